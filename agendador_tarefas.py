@@ -0,0 +1,249 @@
+"""
+Agendador de Tarefas em Segundo Plano
+Executa tarefas periódicas de manutenção (exclusões em lote, varredura de arquivos
+temporários) em uma thread do próprio processo; com vários workers, só o líder
+eleito por uma linha de trava no banco executa as tarefas
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert as sa_insert, or_, select as sa_select, update as sa_update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ExecucaoAgendador, LiderAgendador
+
+
+def remover_arquivos_antigos(pasta, prefixos, sufixo, idade_maxima_segundos, limite):
+    """
+    Remove da pasta os arquivos gerados (prefixo + sufixo) mais antigos que a idade máxima.
+
+    Args:
+        pasta: Diretório varrido (não recursivo)
+        prefixos: Tupla de prefixos dos nomes gerados pela aplicação
+        sufixo: Extensão dos arquivos (ex.: '.pdf')
+        idade_maxima_segundos: Idade, pela data de modificação, a partir da qual o arquivo é removido
+        limite: Máximo de arquivos removidos por chamada
+
+    Returns:
+        int: Quantidade de arquivos removidos
+    """
+    corte = time.time() - idade_maxima_segundos
+    removidos = 0
+    try:
+        entradas = os.scandir(pasta)
+    except FileNotFoundError:
+        return 0
+
+    with entradas:
+        for entrada in entradas:
+            if removidos >= limite:
+                break
+            if not (entrada.name.startswith(prefixos) and entrada.name.endswith(sufixo)):
+                continue
+            try:
+                if entrada.is_file(follow_symlinks=False) and entrada.stat().st_mtime < corte:
+                    os.remove(entrada.path)
+                    removidos += 1
+            except FileNotFoundError:
+                # Removido por outro processo entre a listagem e a exclusão
+                continue
+    return removidos
+
+
+class AgendadorTarefas:
+    """
+    Tarefas periódicas executadas por um único processo entre todos os workers.
+
+    Recursos:
+    - Tarefas registradas com @agendador.tarefa(intervalo_segundos=...)
+    - Liderança por trava com expiração: o líder renova a linha antes de cada tarefa
+      (e a cada terço do TTL enquanto ela roda) e, se o processo morrer, outro worker
+      assume depois de `ttl_lider_segundos`; sem a renovação, o ciclo para
+    - Próxima execução de cada tarefa gravada no banco: um novo líder segue o
+      calendário do anterior em vez de disparar todas as tarefas de uma vez
+    - Cada tarefa faz trabalho limitado por chamada (um lote); o restante fica
+      para os próximos ciclos, sem transações longas nem picos de I/O
+    - Iniciado sob demanda em cada processo (seguro com workers criados por fork)
+    """
+
+    def __init__(self, app, nome='manutencao', intervalo_segundos=60, ttl_lider_segundos=180):
+        """
+        Inicializa o agendador.
+
+        Args:
+            app: Aplicação Flask (as tarefas rodam dentro de um app_context)
+            nome: Nome da linha de trava (agendadores diferentes elegem líderes separados)
+            intervalo_segundos: Intervalo entre ciclos de verificação
+            ttl_lider_segundos: Validade da liderança sem renovação
+        """
+        self.app = app
+        self.nome = nome
+        self.intervalo_segundos = intervalo_segundos
+        self.ttl_lider_segundos = ttl_lider_segundos
+        self.identidade = None
+        self._tarefas = []
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+    def tarefa(self, intervalo_segundos):
+        """Decorador que registra uma função sem argumentos como tarefa periódica"""
+        def registrar(funcao):
+            self._tarefas.append({
+                'nome': funcao.__name__,
+                'funcao': funcao,
+                'intervalo': intervalo_segundos,
+            })
+            return funcao
+        return registrar
+
+    def iniciar(self):
+        """Inicia a thread do agendador neste processo (idempotente; refeito após fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.identidade = f'{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}'
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name=f'agendador-{self.nome}', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+
+    def assumir_lideranca(self):
+        """
+        Assume ou renova a liderança se a trava estiver livre, vencida ou já for deste processo.
+
+        Returns:
+            bool: True se este processo é o líder até a próxima renovação
+        """
+        agora = datetime.utcnow()
+        expira_em = agora + timedelta(seconds=self.ttl_lider_segundos)
+        tabela = LiderAgendador.__table__
+
+        resultado = db.session.execute(
+            sa_update(tabela)
+            .where(tabela.c.nome == self.nome,
+                   or_(tabela.c.dono == self.identidade, tabela.c.expira_em < agora))
+            .values(dono=self.identidade, expira_em=expira_em)
+        )
+        if resultado.rowcount == 0:
+            try:
+                # Primeira execução: a linha ainda não existe
+                db.session.execute(
+                    sa_insert(tabela).values(nome=self.nome, dono=self.identidade, expira_em=expira_em)
+                )
+            except IntegrityError:
+                # A linha existe e pertence a outro processo ainda válido
+                db.session.rollback()
+                return False
+        db.session.commit()
+        return True
+
+    @contextmanager
+    def _batimento(self):
+        """
+        Renova a trava a cada terço do TTL enquanto uma tarefa roda (numa thread com
+        conexão própria), para que uma tarefa longa não perca a liderança no meio
+        """
+        engine = db.engine
+        tabela = LiderAgendador.__table__
+        parar = threading.Event()
+
+        def renovar():
+            while not parar.wait(self.ttl_lider_segundos / 3):
+                try:
+                    with engine.begin() as conexao:
+                        resultado = conexao.execute(
+                            sa_update(tabela)
+                            .where(tabela.c.nome == self.nome, tabela.c.dono == self.identidade)
+                            .values(expira_em=datetime.utcnow() + timedelta(seconds=self.ttl_lider_segundos))
+                        )
+                    if resultado.rowcount == 0:
+                        self.app.logger.warning(f"⚠️ Agendador {self.nome}: liderança perdida durante uma tarefa")
+                        return
+                except Exception as e:
+                    self.app.logger.error(f"❌ Erro ao renovar a liderança do agendador {self.nome}: {e}")
+
+        thread = threading.Thread(target=renovar, name=f'agendador-{self.nome}-batimento', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            parar.set()
+            thread.join()
+
+    def _proximas_execucoes(self):
+        """Próxima execução gravada de cada tarefa (tarefas sem linha estão vencidas)"""
+        tabela = ExecucaoAgendador.__table__
+        linhas = db.session.execute(
+            sa_select(tabela.c.tarefa, tabela.c.proxima_em).where(tabela.c.agendador == self.nome)
+        ).all()
+        return dict(linhas)
+
+    def _agendar(self, tarefa, proxima_em):
+        """Grava a próxima execução da tarefa"""
+        tabela = ExecucaoAgendador.__table__
+        resultado = db.session.execute(
+            sa_update(tabela)
+            .where(tabela.c.agendador == self.nome, tabela.c.tarefa == tarefa)
+            .values(proxima_em=proxima_em)
+        )
+        if resultado.rowcount == 0:
+            db.session.execute(
+                sa_insert(tabela).values(agendador=self.nome, tarefa=tarefa, proxima_em=proxima_em)
+            )
+        db.session.commit()
+
+    def executar_ciclo(self):
+        """
+        Executa um ciclo: roda as tarefas cujo intervalo venceu, renovando a liderança
+        antes de cada uma.
+
+        Returns:
+            list: Nomes das tarefas executadas (vazia se não for o líder)
+        """
+        if not self.assumir_lideranca():
+            return []
+
+        proximas = self._proximas_execucoes()
+        executadas = []
+        for tarefa in self._tarefas:
+            agora = datetime.utcnow()
+            proxima_em = proximas.get(tarefa['nome'])
+            if proxima_em is not None and agora < proxima_em:
+                continue
+            # A tarefa anterior pode ter passado do TTL: sem a trava, outro processo já é o líder
+            if not self.assumir_lideranca():
+                self.app.logger.warning(f"⚠️ Agendador {self.nome}: liderança perdida, ciclo interrompido")
+                break
+            self._agendar(tarefa['nome'], agora + timedelta(seconds=tarefa['intervalo']))
+            try:
+                with self._batimento():
+                    tarefa['funcao']()
+                executadas.append(tarefa['nome'])
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"❌ Erro na tarefa agendada {tarefa['nome']}: {e}")
+        return executadas
+
+    def _executar(self):
+        while not self._parar.wait(self.intervalo_segundos):
+            try:
+                with self.app.app_context():
+                    try:
+                        self.executar_ciclo()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                self.app.logger.error(f"❌ Erro no agendador de tarefas: {e}")
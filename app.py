@@ -5,7 +5,7 @@ from dotenv import load_dotenv
 
 load_dotenv()
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, send_file, Blueprint, g, \
-    make_response, send_from_directory
+    make_response, send_from_directory, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
@@ -49,11 +49,14 @@ from models import (db, User, Subusuario, Registro, LogAcesso, Empresa, Calculad
                     CalculadoraPasso1Servicos, Produto, Documento, Fornecedor, AvaliacaoFornecedor,
                     Banner, ChamadoSuporte, RespostaChamado, ProdutosFornecedores, FornecedorProdutos,
                     Lote, Servico, Despesa, CalculadoraSessao, CalculadoraSessaoServicos,
-                    limpar_sessao_servicos_atual, ProdutoDetalhes
+                    limpar_sessao_servicos_atual, ProdutoDetalhes, ResumoProposta, atualizar_resumo_proposta,
+                    ContadoresCatalogo, ResumoAvaliacaoFornecedor
                     )
 import leitor_edital  # Importa o novo módulo
 from leitor_edital import extrair_texto_de_pdf, analisar_edital_com_ia
 from gerenciador_chaves_api import inicializar_gerenciador
+from exportacao_csv import resposta_csv, LINHAS_POR_LEITURA
+from exportacao_xlsx import resposta_xlsx, Coluna, FORMATO_MOEDA, FORMATO_INTEIRO, FORMATO_DATA_HORA
 
 # OpenAI (se usado)
 # Importa o Blueprint do módulo de licitações
@@ -129,6 +132,17 @@ login_manager.login_message = "Por favor, faça login para acessar esta página.
 login_manager.login_message_category = "info"
 migrate = Migrate(app, db)
 
+# Consultas e tempo de banco por requisição; formas repetidas (N+1) vão para o log com a rota
+from instrumentacao_sql import InstrumentacaoSQL
+
+instrumentacao_sql = None
+if app.config.get('SQL_INSTRUMENTACAO_ATIVA', True):
+    instrumentacao_sql = InstrumentacaoSQL(
+        app,
+        limite_repeticoes=app.config.get('SQL_LIMITE_REPETICOES', 5),
+        server_timing=app.config.get('SQL_SERVER_TIMING', False)
+    )
+
 # Registra as rotas do módulo de licitações sob o prefixo /licitacoes
 # SEÇÃO CORRIGIDA
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -139,8 +153,9 @@ db_path = os.path.join(basedir, 'licitacoes_app', 'src', 'database')
 # Garante que a pasta exista antes de tentar usá-la
 os.makedirs(db_path, exist_ok=True)
 
-# Agora, define a URI usando o caminho que sabemos que existe
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(db_path, 'app.db')
+# A URI do banco vem só do Config (variável DATABASE_URL): o engine é criado no db.init_app,
+# então sobrescrever SQLALCHEMY_DATABASE_URI depois daqui não tinha efeito.
+# Para usar o SQLite local: DATABASE_URL=sqlite:///<basedir>/licitacoes_app/src/database/app.db
 
 # Inicializa o SQLAlchemy do módulo usando sua app principal
 from models_nova_lei import SvcScenario, SvcJob, SvcBenefit, SvcInsumo, SvcOutput
@@ -518,105 +533,158 @@ import json
 
 # ... (resto do seu código do app.py) ...
 
+# ========================================
+# CACHE DE KPIs DO DASHBOARD
+# ========================================
+from cache_dashboard import CacheDashboard, registrar_invalidacao
+
+cache_dashboard = CacheDashboard(
+    max_entradas=app.config['DASHBOARD_CACHE_MAX_ENTRADAS'],
+    ttl_segundos=app.config['DASHBOARD_CACHE_TTL'],
+    arquivo_sqlite=app.config['DASHBOARD_CACHE_SQLITE']
+)
+# Qualquer commit que altere estes modelos invalida o snapshot do usuário dono da linha
+registrar_invalidacao(cache_dashboard, {
+    CalculadoraPasso1: 'user_id',
+    CalculadoraPasso1Servicos: 'user_id',
+    ProdutosFornecedores: 'user_id',
+    FornecedorProdutos: 'user_id',
+    ChamadoSuporte: 'usuario_id',
+    ContadoresCatalogo: 'user_id',
+})
+
+
+def _calcular_kpis_dashboard(user_id):
+    """Executa as consultas agregadas do dashboard e devolve um snapshot serializável em JSON"""
+    # --- 1. KPIs Consolidados (Cards) ---
+    total_propostas_produtos = db.session.query(func.count(CalculadoraPasso1.id)).filter_by(
+        user_id=user_id).scalar()
+    total_propostas_servicos = db.session.query(func.count(CalculadoraPasso1Servicos.id)).filter_by(
+        user_id=user_id).scalar()
+    # Propostas encerradas movidas para o arquivo continuam nos totais e no gráfico de status
+    status_arquivadas = (arquivo_propostas.contagem_por_status(CalculadoraPasso1, user_id) +
+                         arquivo_propostas.contagem_por_status(CalculadoraPasso1Servicos, user_id))
+    total_propostas = total_propostas_produtos + total_propostas_servicos + sum(n for _, n in status_arquivadas)
+
+    total_produtos = db.session.query(func.count(ProdutosFornecedores.id)).filter_by(user_id=user_id).scalar()
+    total_fornecedores = db.session.query(func.count(FornecedorProdutos.id)).filter_by(user_id=user_id).scalar()
+    chamados_abertos = db.session.query(func.count(ChamadoSuporte.id)).filter_by(usuario_id=user_id,
+                                                                                 status='Aberto').scalar()
+
+    # --- 2. Gráfico Consolidado de Propostas por Mês (Últimos 12 meses) ---
+    today = datetime.now(timezone.utc)
+    last_12_months = today - timedelta(days=365)
+
+    # Query para propostas de produtos
+    query_produtos = db.session.query(
+        extract('year', CalculadoraPasso1.criado_em).label('year'),
+        extract('month', CalculadoraPasso1.criado_em).label('month')
+    ).filter(CalculadoraPasso1.user_id == user_id, CalculadoraPasso1.criado_em >= last_12_months)
+
+    # Query para propostas de serviços (ambas as calculadoras)
+    query_servicos = db.session.query(
+        extract('year', CalculadoraPasso1Servicos.criado_em).label('year'),
+        extract('month', CalculadoraPasso1Servicos.criado_em).label('month')
+    ).filter(CalculadoraPasso1Servicos.user_id == user_id, CalculadoraPasso1Servicos.criado_em >= last_12_months)
+
+    # Unifica as duas queries
+    unioned_query = union_all(query_produtos, query_servicos).alias('propostas_unificadas')
+
+    propostas_por_mes_query = db.session.query(
+        unioned_query.c.year,
+        unioned_query.c.month,
+        func.count().label('total_count')
+    ).group_by(unioned_query.c.year, unioned_query.c.month).all()
+
+    # Estrutura para formatar os dados para o gráfico
+    chart_data = {}
+    for i in range(12):
+        dt = today - timedelta(days=i * 30)
+        chart_data[f"{dt.year}-{dt.month:02d}"] = 0
+
+    for ano, mes, total in propostas_por_mes_query:
+        if ano is not None and mes is not None:
+            chart_data[f"{int(ano)}-{int(mes):02d}"] = total
+
+    sorted_chart_data = sorted(chart_data.items())[-12:]  # Garante apenas os últimos 12 meses
+
+    meses_dict = {1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun', 7: 'Jul', 8: 'Ago', 9: 'Set',
+                  10: 'Out', 11: 'Nov', 12: 'Dez'}
+    labels_meses = [f"{meses_dict[int(key.split('-')[1])]}/{key.split('-')[0][2:]}" for key, value in
+                    sorted_chart_data]
+    valores_meses = [value for key, value in sorted_chart_data]
+
+    # --- 3. Gráfico Consolidado de Status das Propostas (Pizza) ---
+    status_produtos = db.session.query(CalculadoraPasso1.status, func.count(CalculadoraPasso1.id)).filter_by(
+        user_id=user_id).group_by(CalculadoraPasso1.status).all()
+    status_servicos = db.session.query(CalculadoraPasso1Servicos.status,
+                                       func.count(CalculadoraPasso1Servicos.id)).filter_by(
+        user_id=user_id).group_by(CalculadoraPasso1Servicos.status).all()
+
+    status_agregado = {}
+    for status, count in status_produtos + status_servicos + status_arquivadas:
+        status_agregado[status] = status_agregado.get(status, 0) + count
+
+    # --- 4. Tabela de Atividades Recentes ---
+    ultimas_propostas_produtos = CalculadoraPasso1.query.filter_by(user_id=user_id).order_by(
+        CalculadoraPasso1.criado_em.desc()).limit(3).all()
+    ultimas_propostas_servicos = CalculadoraPasso1Servicos.query.filter_by(user_id=user_id).order_by(
+        CalculadoraPasso1Servicos.criado_em.desc()).limit(3).all()
+
+    ultimas_propostas = [
+        {'tipo': 'Produto', 'id': p.id, 'numero_processo': p.numero_processo, 'status': p.status,
+         'criado_em': p.criado_em.isoformat() if p.criado_em else None}
+        for p in ultimas_propostas_produtos
+    ] + [
+        {'tipo': 'Serviço', 'id': s.id, 'numero_processo': s.numero_processo, 'status': s.status,
+         'criado_em': s.criado_em.isoformat() if s.criado_em else None}
+        for s in ultimas_propostas_servicos
+    ]
+    ultimas_propostas = sorted(ultimas_propostas, key=lambda x: x['criado_em'] or '', reverse=True)[:5]
+
+    return {
+        'total_propostas': total_propostas,
+        'total_produtos': total_produtos,
+        'total_fornecedores': total_fornecedores,
+        'chamados_abertos': chamados_abertos,
+        'ultimas_propostas': ultimas_propostas,
+        'labels_meses': labels_meses,
+        'valores_meses': valores_meses,
+        'labels_status': list(status_agregado.keys()),
+        'valores_status': list(status_agregado.values()),
+    }
+
+
 @app.route('/precificaja/dashboard')
 @login_required
 def dashboard():
     try:
         user_id = current_user.id
 
-        # --- 1. KPIs Consolidados (Cards) ---
-        total_propostas_produtos = db.session.query(func.count(CalculadoraPasso1.id)).filter_by(
-            user_id=user_id).scalar()
-        total_propostas_servicos = db.session.query(func.count(CalculadoraPasso1Servicos.id)).filter_by(
-            user_id=user_id).scalar()
-        total_propostas = total_propostas_produtos + total_propostas_servicos
-
-        total_produtos = db.session.query(func.count(ProdutosFornecedores.id)).filter_by(user_id=user_id).scalar()
-        total_fornecedores = db.session.query(func.count(FornecedorProdutos.id)).filter_by(user_id=user_id).scalar()
-        chamados_abertos = db.session.query(func.count(ChamadoSuporte.id)).filter_by(usuario_id=user_id,
-                                                                                     status='Aberto').scalar()
-
-        # --- 2. Gráfico Consolidado de Propostas por Mês (Últimos 12 meses) ---
-        today = datetime.now(timezone.utc)
-        last_12_months = today - timedelta(days=365)
-
-        # Query para propostas de produtos
-        query_produtos = db.session.query(
-            extract('year', CalculadoraPasso1.criado_em).label('year'),
-            extract('month', CalculadoraPasso1.criado_em).label('month')
-        ).filter(CalculadoraPasso1.user_id == user_id, CalculadoraPasso1.criado_em >= last_12_months)
-
-        # Query para propostas de serviços (ambas as calculadoras)
-        query_servicos = db.session.query(
-            extract('year', CalculadoraPasso1Servicos.criado_em).label('year'),
-            extract('month', CalculadoraPasso1Servicos.criado_em).label('month')
-        ).filter(CalculadoraPasso1Servicos.user_id == user_id, CalculadoraPasso1Servicos.criado_em >= last_12_months)
-
-        # Unifica as duas queries
-        unioned_query = union_all(query_produtos, query_servicos).alias('propostas_unificadas')
-
-        propostas_por_mes_query = db.session.query(
-            unioned_query.c.year,
-            unioned_query.c.month,
-            func.count().label('total_count')
-        ).group_by(unioned_query.c.year, unioned_query.c.month).all()
-
-        # Estrutura para formatar os dados para o gráfico
-        chart_data = {}
-        for i in range(12):
-            dt = today - timedelta(days=i * 30)
-            chart_data[f"{dt.year}-{dt.month:02d}"] = 0
-
-        for ano, mes, total in propostas_por_mes_query:
-            if ano is not None and mes is not None:
-                chart_data[f"{int(ano)}-{int(mes):02d}"] = total
-
-        sorted_chart_data = sorted(chart_data.items())[-12:]  # Garante apenas os últimos 12 meses
-
-        meses_dict = {1: 'Jan', 2: 'Fev', 3: 'Mar', 4: 'Abr', 5: 'Mai', 6: 'Jun', 7: 'Jul', 8: 'Ago', 9: 'Set',
-                      10: 'Out', 11: 'Nov', 12: 'Dez'}
-        labels_meses = [f"{meses_dict[int(key.split('-')[1])]}/{key.split('-')[0][2:]}" for key, value in
-                        sorted_chart_data]
-        valores_meses = [value for key, value in sorted_chart_data]
-
-        # --- 3. Gráfico Consolidado de Status das Propostas (Pizza) ---
-        status_produtos = db.session.query(CalculadoraPasso1.status, func.count(CalculadoraPasso1.id)).filter_by(
-            user_id=user_id).group_by(CalculadoraPasso1.status).all()
-        status_servicos = db.session.query(CalculadoraPasso1Servicos.status,
-                                           func.count(CalculadoraPasso1Servicos.id)).filter_by(
-            user_id=user_id).group_by(CalculadoraPasso1Servicos.status).all()
-
-        status_agregado = {}
-        for status, count in status_produtos + status_servicos:
-            status_agregado[status] = status_agregado.get(status, 0) + count
-
-        labels_status = list(status_agregado.keys())
-        valores_status = list(status_agregado.values())
+        kpis = cache_dashboard.obter(user_id)
+        if kpis is None:
+            # A geração é lida antes do cálculo: se houver escrita no meio, o snapshot já nasce inválido
+            geracao = cache_dashboard.geracao(user_id)
+            kpis = _calcular_kpis_dashboard(user_id)
+            cache_dashboard.salvar(user_id, geracao, kpis)
+
+        # O template usa proposta.criado_em.strftime
+        ultimas_propostas = [
+            dict(p, criado_em=datetime.fromisoformat(p['criado_em']) if p['criado_em'] else None)
+            for p in kpis['ultimas_propostas']
+        ]
         cores_status = ['#007bff', '#28a745', '#dc3545', '#ffc107', '#17a2b8', '#6c757d']
 
-        # --- 4. Tabela de Atividades Recentes ---
-        ultimas_propostas_produtos = CalculadoraPasso1.query.filter_by(user_id=user_id).order_by(
-            CalculadoraPasso1.criado_em.desc()).limit(3).all()
-        ultimas_propostas_servicos = CalculadoraPasso1Servicos.query.filter_by(user_id=user_id).order_by(
-            CalculadoraPasso1Servicos.criado_em.desc()).limit(3).all()
-
-        # Adiciona um atributo 'tipo' para diferenciar no template
-        for p in ultimas_propostas_produtos: p.tipo = 'Produto'
-        for s in ultimas_propostas_servicos: s.tipo = 'Serviço'
-
-        ultimas_propostas = sorted(ultimas_propostas_produtos + ultimas_propostas_servicos, key=lambda x: x.criado_em,
-                                   reverse=True)[:5]
-
         return render_template('dashboard.html',
-                               total_propostas=total_propostas,
-                               total_produtos=total_produtos,
-                               total_fornecedores=total_fornecedores,
-                               chamados_abertos=chamados_abertos,
+                               total_propostas=kpis['total_propostas'],
+                               total_produtos=kpis['total_produtos'],
+                               total_fornecedores=kpis['total_fornecedores'],
+                               chamados_abertos=kpis['chamados_abertos'],
                                ultimas_propostas=ultimas_propostas,
-                               labels_meses=json.dumps(labels_meses),
-                               valores_meses=json.dumps(valores_meses),
-                               labels_status=json.dumps(labels_status),
-                               valores_status=json.dumps(valores_status),
+                               labels_meses=json.dumps(kpis['labels_meses']),
+                               valores_meses=json.dumps(kpis['valores_meses']),
+                               labels_status=json.dumps(kpis['labels_status']),
+                               valores_status=json.dumps(kpis['valores_status']),
                                cores_status=json.dumps(cores_status)
                                )
     except Exception as e:
@@ -1363,6 +1431,8 @@ def salvar_passo1():
             prazo_entrega=data['prazo_entrega']
         )
         db.session.add(nova_proposta)
+        db.session.flush()
+        atualizar_resumo_proposta(nova_proposta)
         db.session.commit()
 
         # Log de sucesso
@@ -1408,13 +1478,7 @@ def salvar_passo2():
         empresa = Empresa.query.filter_by(user_id=user_principal_id).first()
         imposto_venda = empresa.imposto_venda if empresa and empresa.imposto_venda is not None else 0
 
-        # Cálculos agregados
-        referencia_total = sum([float(p.get('referencia', 0)) * int(p.get('quantidade', 1)) for p in produtos])
-        valor_total_venda = sum([float(p.get('venda', 0)) * int(p.get('quantidade', 1)) for p in produtos])
-        custo_total_geral = sum([float(p.get('custo', 0)) * int(p.get('quantidade', 1)) for p in produtos])
-        imposto_total = valor_total_venda * (imposto_venda / 100)
-        lucro_total = valor_total_venda - custo_total_geral - frete - imposto_total
-
+        # Os totais agregados ficam no ResumoProposta (recalculado abaixo), não repetidos em cada item
         # Salvar cada produto
         for produto_data in produtos:
             # Validação mínima por produto
@@ -1434,14 +1498,11 @@ def salvar_passo2():
                 subusuario_id=subusuario_id,
                 calculadora_passo1_id=proposta_id,
                 frete=frete,
-                custo_total=float(produto_data['custo']) * int(produto_data['quantidade']),
-                referencia_total=referencia_total,
-                imposto_total=imposto_total,
-                valor_total_venda=valor_total_venda,
-                lucro_total=lucro_total
+                custo_total=float(produto_data['custo']) * int(produto_data['quantidade'])
             )
             db.session.add(novo_produto)
 
+        atualizar_resumo_proposta(proposta, imposto_venda=imposto_venda)
         db.session.commit()
 
         # ✅ LIMPAR SESSÃO APÓS FINALIZAR COM SUCESSO
@@ -1531,6 +1592,33 @@ def cancelar_processo(id):
         return jsonify({'error': f'Erro ao cancelar o processo: {str(e)}'}), 500
 
 
+# ===== BUSCA DE PRODUTOS (sem acentos, com índice de texto e ranking) =====
+from busca_produtos import IndiceBusca, IndiceAutocomplete
+
+indice_busca_itens = IndiceBusca(db, Produto)
+indice_busca_catalogo = IndiceBusca(db, ProdutosFornecedores)
+
+# Autocomplete da calculadora: itens já cadastrados em propostas e catálogo dos fornecedores
+indice_autocomplete = IndiceAutocomplete(
+    db,
+    fontes=[
+        (Produto, "Produto Cadastrado", lambda p: {
+            "nome": p.nome,
+            "marca_modelo": p.marca_modelo or "",  # Evita erro se for None
+            "custo": p.custo,
+        }),
+        (ProdutosFornecedores, "Fornecedor", lambda p: {
+            "nome": p.nome,
+            "marca_modelo": f"{p.marca or ''} {p.modelo or ''}".strip(),
+            "custo": p.custo,
+        }),
+    ],
+    max_usuarios=app.config.get('AUTOCOMPLETE_MAX_USUARIOS', 64),
+    ttl_segundos=app.config.get('AUTOCOMPLETE_TTL', 900),
+)
+indice_autocomplete.registrar_eventos()
+
+
 @app.route('/api/buscar_produtos', methods=['GET'])
 @login_required
 def buscar_produtos():
@@ -1542,11 +1630,14 @@ def buscar_produtos():
     try:
         user_id = current_user.id  # ID do usuário autenticado
 
+        # Produtos cadastrados e do catálogo, ranqueados juntos pelo índice em memória
+        resultado = indice_autocomplete.buscar(user_id, termo, limite=10)
+        if resultado is not None:
+            return jsonify(resultado)
+
+        # Índice em memória ainda sendo montado: busca no índice de texto do banco
         # 1ª busca: Tabela Produto (Filtra por user_id)
-        produtos = Produto.query.filter(
-            Produto.user_id == user_id,  # Filtra pelo usuário logado
-            Produto.nome.ilike(f"%{termo}%")
-        ).limit(10).all()
+        produtos = indice_busca_itens.buscar(user_id, termo, limite=10)
 
         resultado = [
             {
@@ -1561,10 +1652,7 @@ def buscar_produtos():
 
         # Se não encontrou nada na primeira, busca na tabela ProdutosFornecedores
         if not resultado:
-            produtos_fornecedores = ProdutosFornecedores.query.filter(
-                ProdutosFornecedores.user_id == user_id,  # Filtra pelo usuário logado
-                ProdutosFornecedores.nome.ilike(f"%{termo}%")
-            ).limit(10).all()
+            produtos_fornecedores = indice_busca_catalogo.buscar(user_id, termo, limite=10)
 
             resultado = [
                 {
@@ -1594,6 +1682,36 @@ import json
 
 # ===== ROTAS DE SESSÃO DA CALCULADORA =====
 
+from sqlalchemy.exc import IntegrityError
+from sessao_incremental import PatchInvalido, VersaoDesatualizada
+
+
+def gravar_dados_sessao(sessao, data):
+    """
+    Grava na sessão os dados de um autosave.
+
+    Com 'patch' (JSON Patch calculado sobre 'versao_base') grava apenas o delta;
+    sem ele, regrava o documento completo enviado em 'dados_sessao'.
+    """
+    if 'patch' in data:
+        sessao.aplicar_delta(
+            data['patch'],
+            data.get('versao_base'),
+            limite_deltas=app.config.get('SESSAO_COMPACTAR_DELTAS', 20),
+            limite_bytes=app.config.get('SESSAO_COMPACTAR_BYTES', 65536)
+        )
+    else:
+        sessao.set_dados_sessao(data.get('dados_sessao', {}))
+
+
+def resposta_conflito_sessao(versao_atual=None):
+    """409 para o cliente reenviar o documento completo (delta sobre versão antiga)"""
+    return jsonify({
+        'error': 'A sessão foi alterada em outra aba; reenvie os dados completos.',
+        'versao': versao_atual,
+        'requer_completo': True
+    }), 409
+
 
 @app.route('/calculadora/sessao/salvar', methods=['POST'])
 @login_required
@@ -1631,14 +1749,19 @@ def salvar_sessao_calculadora():
         ).first()
 
         if sessao_existente:
-            # Atualizar sessão existente
-            sessao_existente.set_dados_sessao(data.get('dados_sessao', {}))
+            # Atualizar sessão existente (delta ou documento completo)
+            gravar_dados_sessao(sessao_existente, data)
             sessao_existente.passo_atual = data.get('passo_atual', 1)
             sessao_existente.updated_at = datetime.utcnow()
             sessao_existente.expires_at = datetime.utcnow() + timedelta(hours=24)
+            sessao = sessao_existente
 
             app.logger.info(f"Sessão {sessao_existente.id} atualizada")
         else:
+            if 'patch' in data:
+                # Delta sem sessão no servidor (expirada ou removida)
+                return resposta_conflito_sessao(0)
+
             # Criar nova sessão
             nova_sessao = CalculadoraSessao(
                 user_id=user_principal_id,
@@ -1647,6 +1770,7 @@ def salvar_sessao_calculadora():
                 expires_at=datetime.utcnow() + timedelta(hours=24)
             )
             nova_sessao.set_dados_sessao(data.get('dados_sessao', {}))
+            sessao = nova_sessao
 
             db.session.add(nova_sessao)
             app.logger.info(f"Nova sessão criada para usuário {user_principal_id}")
@@ -1655,9 +1779,20 @@ def salvar_sessao_calculadora():
 
         return jsonify({
             'message': 'Sessão salva com sucesso!',
+            'versao': sessao.versao,
             'timestamp': datetime.utcnow().isoformat()
         }), 200
 
+    except VersaoDesatualizada as e:
+        db.session.rollback()
+        return resposta_conflito_sessao(e.versao_atual)
+    except IntegrityError:
+        # Outro autosave gravou a mesma versão ao mesmo tempo
+        db.session.rollback()
+        return resposta_conflito_sessao()
+    except PatchInvalido as e:
+        db.session.rollback()
+        return jsonify({'error': f'Patch inválido: {e}'}), 400
     except Exception as e:
         app.logger.error(f"Erro ao salvar sessão: {str(e)}", exc_info=True)
         db.session.rollback()
@@ -1714,6 +1849,7 @@ def carregar_sessao_calculadora():
             'sessao_id': sessao.id,
             'passo_atual': sessao.passo_atual,
             'dados_sessao': dados_sessao,
+            'versao': sessao.versao,
             'created_at': sessao.created_at.isoformat(),
             'updated_at': sessao.updated_at.isoformat()
         }), 200
@@ -1805,18 +1941,13 @@ def limpeza_sessoes_expiradas():
     Remove sessões expiradas (pode ser chamada por um cron job)
     """
     try:
-        # Buscar sessões expiradas
-        sessoes_expiradas = CalculadoraSessao.query.filter(
-            CalculadoraSessao.expires_at < datetime.utcnow()
-        ).all()
-
-        count = len(sessoes_expiradas)
-
-        # Remover sessões expiradas
-        for sessao in sessoes_expiradas:
-            db.session.delete(sessao)
-
-        db.session.commit()
+        # Remover sessões expiradas em lotes (com os deltas)
+        count = 0
+        while True:
+            removidas = CalculadoraSessao.excluir_expiradas(limite=500)
+            count += removidas
+            if removidas < 500:
+                break
 
         app.logger.info(f"Limpeza automática: {count} sessões expiradas removidas")
 
@@ -1975,27 +2106,41 @@ def salvar_sessao_servicos():
         ).first()
 
         if sessao:
-            # Atualizar sessão existente
-            sessao.set_dados_sessao(data.get('dados_sessao', {}))
+            # Atualizar sessão existente (delta ou documento completo)
+            gravar_dados_sessao(sessao, data)
             sessao.passo_atual = data.get('passo_atual', 1)
             sessao.updated_at = datetime.now()
             sessao.expires_at = datetime.now() + timedelta(hours=24)
             app.logger.info(f"✅ Sessão de serviços atualizada - ID: {sessao.id}")
         else:
+            if 'patch' in data:
+                # Delta sem sessão no servidor (expirada ou removida)
+                return resposta_conflito_sessao(0)
+
             # Criar nova sessão
-            nova_sessao = CalculadoraSessaoServicos(
+            sessao = CalculadoraSessaoServicos(
                 user_id=user_principal_id,
                 subusuario_id=subusuario_id,
                 passo_atual=data.get('passo_atual', 1),
                 expires_at=datetime.now() + timedelta(hours=24)
             )
-            nova_sessao.set_dados_sessao(data.get('dados_sessao', {}))
-            db.session.add(nova_sessao)
+            sessao.set_dados_sessao(data.get('dados_sessao', {}))
+            db.session.add(sessao)
             app.logger.info(f"✅ Nova sessão de serviços criada")
 
         db.session.commit()
-        return jsonify({"message": "Sessão salva com sucesso"}), 200
+        return jsonify({"message": "Sessão salva com sucesso", "versao": sessao.versao}), 200
 
+    except VersaoDesatualizada as e:
+        db.session.rollback()
+        return resposta_conflito_sessao(e.versao_atual)
+    except IntegrityError:
+        # Outro autosave gravou a mesma versão ao mesmo tempo
+        db.session.rollback()
+        return resposta_conflito_sessao()
+    except PatchInvalido as e:
+        db.session.rollback()
+        return jsonify({"error": f"Patch inválido: {e}"}), 400
     except Exception as e:
         db.session.rollback()
         app.logger.error(f"❌ Erro ao salvar sessão de serviços: {str(e)}")
@@ -2395,7 +2540,8 @@ def carregar_sessao_servicos():
             app.logger.info(f"✅ Sessão de serviços carregada - ID: {sessao.id}")
             return jsonify({
                 "dados_sessao": dados,
-                "passo_atual": sessao.passo_atual
+                "passo_atual": sessao.passo_atual,
+                "versao": sessao.versao
             }), 200
         else:
             app.logger.info("ℹ️ Nenhuma sessão de serviços válida para carregar")
@@ -2488,18 +2634,13 @@ def limpeza_sessoes_servicos_expiradas():
     Remove sessões de serviços expiradas (pode ser chamada por um cron job)
     """
     try:
-        # Buscar sessões expiradas
-        sessoes_expiradas = CalculadoraSessaoServicos.query.filter(
-            CalculadoraSessaoServicos.expires_at < datetime.utcnow()
-        ).all()
-
-        count = len(sessoes_expiradas)
-
-        # Remover sessões expiradas
-        for sessao in sessoes_expiradas:
-            db.session.delete(sessao)
-
-        db.session.commit()
+        # Remover sessões expiradas em lotes (com os deltas)
+        count = 0
+        while True:
+            removidas = CalculadoraSessaoServicos.excluir_expiradas(limite=500)
+            count += removidas
+            if removidas < 500:
+                break
 
         app.logger.info(f"Limpeza automática de serviços: {count} sessões expiradas removidas")
 
@@ -2514,6 +2655,117 @@ def limpeza_sessoes_servicos_expiradas():
         return jsonify({'error': 'Erro interno na limpeza de sessões de serviços.', 'details': str(e)}), 500
 
 
+# ===== TAREFAS DE MANUTENÇÃO EM SEGUNDO PLANO =====
+
+from agendador_tarefas import AgendadorTarefas, remover_arquivos_antigos
+
+agendador = AgendadorTarefas(
+    app,
+    intervalo_segundos=app.config.get('AGENDADOR_INTERVALO', 60),
+    ttl_lider_segundos=app.config.get('AGENDADOR_TTL_LIDER', 180)
+)
+
+
+from tarefas_segundo_plano import ExecutorTarefas
+
+executor_tarefas = ExecutorTarefas(app, max_simultaneas=app.config.get('TAREFAS_MAX_SIMULTANEAS', 2))
+
+
+@agendador.tarefa(intervalo_segundos=300)
+def retomar_tarefas_paradas_agendado():
+    """Exclusões e importações de um processo encerrado voltam à fila, a partir do último lote gravado"""
+    retomadas = executor_tarefas.retomar_paradas(app.config.get('TAREFAS_RETOMAR_APOS', 600))
+    if retomadas:
+        app.logger.info(f"🔁 {retomadas} tarefa(s) em segundo plano retomada(s)")
+
+
+@agendador.tarefa(intervalo_segundos=300)
+def limpar_sessoes_expiradas_agendado():
+    """Um lote de sessões expiradas por calculadora a cada execução"""
+    lote = app.config.get('AGENDADOR_LOTE', 500)
+    total = CalculadoraSessao.excluir_expiradas(lote) + CalculadoraSessaoServicos.excluir_expiradas(lote)
+    if total:
+        app.logger.info(f"🧹 Limpeza agendada: {total} sessão(ões) expirada(s) removida(s)")
+
+
+@agendador.tarefa(intervalo_segundos=600)
+def remover_arquivos_temporarios_agendado():
+    """Catálogos PDF gerados no diretório temporário e PDFs consolidados em uploads"""
+    idade = app.config.get('ARQUIVOS_TEMPORARIOS_IDADE_MAXIMA', 6 * 3600)
+    limite = app.config.get('AGENDADOR_MAX_ARQUIVOS', 200)
+    total = remover_arquivos_antigos(
+        tempfile.gettempdir(), ('catalogo_completo_', 'catalogo_selecionados_'), '.pdf', idade, limite
+    )
+    total += remover_arquivos_antigos(
+        app.config['UPLOAD_FOLDER'], ('documentos_consolidados_',), '.pdf', idade, limite
+    )
+    if total:
+        app.logger.info(f"🧹 Limpeza agendada: {total} arquivo(s) temporário(s) removido(s)")
+
+
+from arquivo_propostas import ArquivoPropostas
+
+arquivo_propostas = ArquivoPropostas(
+    dias=app.config.get('ARQUIVO_PROPOSTAS_DIAS', 365),
+    lote=app.config.get('ARQUIVO_PROPOSTAS_LOTE', 200)
+)
+
+
+def _remover_itens_arquivados_autocomplete(propostas):
+    """Itens de propostas arquivadas deixam de aparecer no autocomplete da calculadora"""
+    donos = dict(propostas)
+    itens = db.session.query(Produto.id, Produto.calculadora_passo1_id).filter(
+        Produto.calculadora_passo1_id.in_(list(donos))
+    ).all()
+    por_usuario = {}
+    for item_id, proposta_id in itens:
+        por_usuario.setdefault(donos[proposta_id], []).append(item_id)
+    for user_id, ids in por_usuario.items():
+        indice_autocomplete.registrar_remocao(Produto, user_id, ids)
+
+
+@agendador.tarefa(intervalo_segundos=app.config.get('ARQUIVO_PROPOSTAS_INTERVALO', 3600))
+def arquivar_propostas_encerradas_agendado():
+    """Um lote de propostas encerradas e antigas de cada calculadora vai para as tabelas de arquivo"""
+    for modelo, antes_de_mover in ((CalculadoraPasso1, _remover_itens_arquivados_autocomplete),
+                                   (CalculadoraPasso1Servicos, None)):
+        movidas = arquivo_propostas.arquivar(modelo, antes_de_mover=antes_de_mover)
+        if movidas:
+            # As movimentações não passam pelo flush: o snapshot do dashboard é descartado aqui
+            cache_dashboard.invalidar(*{user_id for _, user_id in movidas})
+            app.logger.info(f"🗄️ Arquivo: {len(movidas)} proposta(s) encerrada(s) de {modelo.__tablename__} arquivada(s)")
+
+
+@agendador.tarefa(intervalo_segundos=app.config.get('EXPORTACAO_ANALITICA_INTERVALO', 3600))
+def exportar_analitico_agendado():
+    """Linhas novas de propostas, serviços e catálogo vão para os datasets Parquet do BI"""
+    pasta = app.config.get('EXPORTACAO_ANALITICA_PASTA')
+    if not pasta:
+        return
+    from exportacao_parquet import ExportacaoAnalitica
+
+    exportacao = ExportacaoAnalitica(
+        pasta,
+        linhas_por_leitura=app.config.get('EXPORTACAO_ANALITICA_LEITURA', 50000),
+        janela_ids=app.config.get('EXPORTACAO_ANALITICA_JANELA', 500000)
+    )
+    resumo = exportacao.exportar()
+    ocupados = [nome for nome, resultado in resumo.items() if resultado.get('em_andamento')]
+    if ocupados:
+        app.logger.warning(f"⏳ Exportação analítica em andamento em outro processo: {', '.join(ocupados)} ignorado(s)")
+    total = sum(resultado['linhas'] for resultado in resumo.values())
+    if total:
+        app.logger.info(f"📊 Exportação analítica: {total} linha(s) - "
+                        + ', '.join(f"{nome}: {r['linhas']}" for nome, r in resumo.items() if r['linhas']))
+
+
+@app.before_request
+def iniciar_agendador():
+    # Inicia no processo que atende requisições (após o fork dos workers)
+    if app.config.get('AGENDADOR_ATIVO', True):
+        agendador.iniciar()
+
+
 # ---------------fim calculadora de serviços-----------------
 
 @app.route('/gerador_documentos/propostas')
@@ -2538,6 +2790,27 @@ def simulacao_produtos():
 
 
 # ------------------------- PAGINA PROPOSTAS -------------------
+def _consulta_propostas_listagem(user_id, user_type):
+    """
+    Propostas em andamento do usuário principal (de subusuários, só as dele) com o
+    resumo agregado, numa única query (sem carregar itens nem criador por linha)
+    """
+    # Determinar o usuário principal para subusuários
+    user_principal_id = (
+        current_user.user_principal_id if user_type == 'subusuario' else current_user.id
+    )
+
+    query = db.session.query(CalculadoraPasso1, ResumoProposta).outerjoin(
+        ResumoProposta, ResumoProposta.proposta_id == CalculadoraPasso1.id
+    ).filter(
+        CalculadoraPasso1.user_id == user_principal_id,
+        ~CalculadoraPasso1.status.in_(['Adjudica', 'Perdida', 'Anulada', 'Prazo Vencido'])
+    )
+    if user_type == 'subusuario':
+        query = query.filter(CalculadoraPasso1.subusuario_id == user_id)
+    return query
+
+
 @app.route('/propostas', methods=['GET'])
 @login_required
 def listar_propostas():
@@ -2549,39 +2822,16 @@ def listar_propostas():
         user_id = session.get('user_id')  # ID do usuário logado
         user_type = session.get('user_type')  # Tipo de usuário (user/subusuario)
 
-        # Determinar o usuário principal para subusuários
-        user_principal_id = (
-            current_user.user_principal_id if user_type == 'subusuario' else current_user.id
-        )
-
-        # Query para buscar propostas excluindo as que não devem aparecer
-        if user_type == 'subusuario':
-            propostas = CalculadoraPasso1.query.filter(
-                CalculadoraPasso1.user_id == user_principal_id,
-                CalculadoraPasso1.subusuario_id == user_id,
-                ~CalculadoraPasso1.status.in_(['Adjudica', 'Perdida', 'Anulada', 'Prazo Vencido'])
-            ).all()
-        else:
-            propostas = CalculadoraPasso1.query.filter(
-                CalculadoraPasso1.user_id == user_principal_id,
-                ~CalculadoraPasso1.status.in_(['Adjudica', 'Perdida', 'Anulada', 'Prazo Vencido'])
-            ).all()
+        query = _consulta_propostas_listagem(user_id, user_type)
 
         # Preparar os dados para exibição na tabela
         lista_propostas = []
-        for proposta in propostas:
-            # Calcular o valor total
-            produtos = Produto.query.filter_by(calculadora_passo1_id=proposta.id).all()
-            valor_total = sum(produto.quantidade * produto.venda for produto in produtos)
-
-            # Identificar o criador (usuário principal ou subusuário)
-            criador = None
-            if proposta.subusuario_id:
-                subusuario = Subusuario.query.get(proposta.subusuario_id)
-                criador = subusuario.nome if subusuario else "Subusuário Desconhecido"
-            else:
-                usuario_principal = User.query.get(proposta.user_id)
-                criador = usuario_principal.nome if usuario_principal else "Usuário Desconhecido"
+        resumos_criados = False
+        for proposta, resumo in query.all():
+            if resumo is None:
+                # Proposta anterior à tabela de resumo: calcula uma vez e persiste
+                resumo = atualizar_resumo_proposta(proposta)
+                resumos_criados = True
 
             # Adicionar dados formatados à lista
             lista_propostas.append({
@@ -2589,11 +2839,14 @@ def listar_propostas():
                 'numero_processo': proposta.numero_processo,
                 'cnpj': proposta.cnpj,
                 'razao_social': proposta.razao_social,
-                'valor_total': f"R$ {valor_total:,.2f}",
-                'criador': criador,
+                'valor_total': f"R$ {resumo.valor_total_venda:,.2f}",
+                'criador': resumo.criador_nome,
                 'status': proposta.status
             })
 
+        if resumos_criados:
+            db.session.commit()
+
         # Renderizar a página de propostas com os dados
         return render_template('propostas.html', propostas=lista_propostas)
     except Exception as e:
@@ -2601,6 +2854,67 @@ def listar_propostas():
         return render_template('propostas.html', propostas=[])
 
 
+@app.route('/propostas/exportar_xlsx', methods=['GET'])
+@login_required
+def exportar_propostas_xlsx():
+    """
+    Exporta a lista de propostas em andamento para Excel (planilha write_only,
+    com as linhas lidas do banco em partes).
+    """
+    try:
+        query = _consulta_propostas_listagem(session.get('user_id'), session.get('user_type'))
+
+        # Propostas anteriores à tabela de resumo: calcula antes de começar a leitura em partes
+        sem_resumo = query.filter(ResumoProposta.proposta_id.is_(None)).all()
+        for proposta, _ in sem_resumo:
+            atualizar_resumo_proposta(proposta)
+        if sem_resumo:
+            db.session.commit()
+
+        def linhas():
+            for proposta, resumo in query.order_by(CalculadoraPasso1.id.desc()).yield_per(LINHAS_POR_LEITURA):
+                yield [
+                    proposta.id,
+                    proposta.numero_processo,
+                    proposta.cnpj,
+                    proposta.razao_social,
+                    proposta.status,
+                    resumo.quantidade_itens,
+                    resumo.custo_total,
+                    resumo.frete,
+                    resumo.imposto_total,
+                    resumo.valor_total_venda,
+                    resumo.lucro_total,
+                    resumo.criador_nome,
+                    proposta.criado_em,
+                ]
+
+        return resposta_xlsx(
+            f'propostas_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+            'Propostas',
+            [
+                Coluna('ID', 8, FORMATO_INTEIRO),
+                Coluna('Nº do Processo', 22),
+                Coluna('CNPJ', 20),
+                Coluna('Razão Social', 40),
+                Coluna('Status', 14),
+                Coluna('Itens', 8, FORMATO_INTEIRO),
+                Coluna('Custo Total', 16, FORMATO_MOEDA),
+                Coluna('Frete', 14, FORMATO_MOEDA),
+                Coluna('Impostos', 14, FORMATO_MOEDA),
+                Coluna('Valor Total', 16, FORMATO_MOEDA),
+                Coluna('Lucro', 16, FORMATO_MOEDA),
+                Coluna('Criador', 25),
+                Coluna('Criada em', 17, FORMATO_DATA_HORA),
+            ],
+            linhas()
+        )
+    except Exception as e:
+        app.logger.error(f"Erro ao exportar propostas: {str(e)}", exc_info=True)
+        flash("Erro ao exportar propostas.", "danger")
+        return redirect(url_for('listar_propostas'))
+
+
 @app.route('/proposta/<int:proposta_id>/detalhes', methods=['GET'])
 @login_required
 def detalhes_proposta(proposta_id):
@@ -2787,12 +3101,13 @@ def imprimir_proposta(proposta_id):
         user_principal_id = (
             current_user.user_principal_id if session.get('user_type') == 'subusuario' else current_user.id
         )
-        proposta = CalculadoraPasso1.query.filter_by(
-            id=proposta_id, user_id=user_principal_id
-        ).first_or_404()
+        # Proposta ativa ou arquivada, com os produtos da mesma camada
+        proposta = arquivo_propostas.proposta(CalculadoraPasso1, user_principal_id, proposta_id)
+        if proposta is None:
+            abort(404)
 
         empresa = Empresa.query.filter_by(user_id=user_principal_id).first()
-        produtos = Produto.query.filter_by(calculadora_passo1_id=proposta_id).all()
+        produtos = arquivo_propostas.dependentes(Produto, 'calculadora_passo1_id', proposta.id, proposta.arquivada)
 
         if not empresa:
             flash("Configure sua empresa para gerar propostas.", "danger")
@@ -3500,18 +3815,18 @@ def imprimir_proposta_servico(proposta_id):
         user_principal_id = current_user.user_principal_id if session.get(
             'user_type') == 'subusuario' else current_user.id
 
-        # Buscar dados
-        registro = CalculadoraPasso1Servicos.query.filter_by(id=proposta_id, user_id=user_principal_id).first_or_404()
+        # Buscar dados (proposta ativa ou arquivada, dependentes da mesma camada)
+        registro = arquivo_propostas.proposta(CalculadoraPasso1Servicos, user_principal_id, proposta_id)
+        if registro is None:
+            abort(404)
         empresa = Empresa.query.filter_by(user_id=user_principal_id).first()
 
         if not empresa:
             flash("Configure sua empresa para gerar propostas.", "danger")
             return redirect(url_for('listar_propostas'))
 
-        lotes = Lote.query.filter_by(proposta_servico_id=registro.id).all()
-        despesas = Despesa.query.filter(
-            (Despesa.proposta_id == registro.id) | (Despesa.proposta_servico_id == registro.id)
-        ).all()
+        lotes = arquivo_propostas.lotes_com_servicos(registro.id, registro.arquivada)
+        despesas = arquivo_propostas.dependentes(Despesa, 'proposta_servico_id', registro.id, registro.arquivada)
 
         imposto_percentual = float(empresa.imposto_venda) if empresa and empresa.imposto_venda is not None else 0.0
         obs = request.args.get('obs', '')
@@ -3520,8 +3835,8 @@ def imprimir_proposta_servico(proposta_id):
         servicos_data = []
         despesas_data = []
 
-        for lote in lotes:
-            for servico in lote.servicos:
+        for lote, servicos in lotes:
+            for servico in servicos:
                 servicos_data.append({
                     'id': servico.id,
                     'lote_id': lote.id,
@@ -4055,8 +4370,10 @@ def relatorio_custos_servico(proposta_id):
         user_principal_id = current_user.user_principal_id if session.get(
             'user_type') == 'subusuario' else current_user.id
 
-        # Buscar a proposta de serviço
-        registro = CalculadoraPasso1Servicos.query.filter_by(id=proposta_id, user_id=user_principal_id).first_or_404()
+        # Buscar a proposta de serviço (ativa ou arquivada)
+        registro = arquivo_propostas.proposta(CalculadoraPasso1Servicos, user_principal_id, proposta_id)
+        if registro is None:
+            abort(404)
 
         # Buscar empresa e validar se existe
         empresa = Empresa.query.filter_by(user_id=user_principal_id).first()
@@ -4064,11 +4381,9 @@ def relatorio_custos_servico(proposta_id):
             flash("Configure sua empresa para gerar propostas.", "danger")
             return redirect(url_for('listar_propostas'))
 
-        # Buscar lotes, serviços e despesas
-        lotes = Lote.query.filter_by(proposta_servico_id=registro.id).all()
-        despesas = Despesa.query.filter(
-            (Despesa.proposta_id == registro.id) | (Despesa.proposta_servico_id == registro.id)
-        ).all()
+        # Buscar lotes, serviços e despesas na camada da proposta
+        lotes = arquivo_propostas.lotes_com_servicos(registro.id, registro.arquivada)
+        despesas = arquivo_propostas.dependentes(Despesa, 'proposta_servico_id', registro.id, registro.arquivada)
 
         # Buscar impostos da empresa
         imposto_percentual = float(empresa.imposto_venda) if empresa and empresa.imposto_venda is not None else 0.0
@@ -4081,9 +4396,9 @@ def relatorio_custos_servico(proposta_id):
         servicos_data = []
         despesas_data = []
 
-        for lote in lotes:
+        for lote, servicos in lotes:
             lotes_data.append({'id': lote.id, 'nome': lote.nome})
-            for servico in lote.servicos:
+            for servico in servicos:
                 servicos_data.append({
                     'id': servico.id,
                     'lote_id': lote.id,
@@ -7336,7 +7651,9 @@ def salvar_simulacao():
             return jsonify({'error': 'Registro não encontrado.'}), 404
 
         # Limpa produtos antigos
+        ids_antigos = [i for (i,) in db.session.query(Produto.id).filter_by(calculadora_passo1_id=registro_id)]
         Produto.query.filter_by(calculadora_passo1_id=registro_id).delete(synchronize_session=False)
+        indice_autocomplete.registrar_remocao(Produto, user_principal_id, ids_antigos)
 
         # Itera sobre os produtos para salvar
         for i, produto_data in enumerate(produtos_data):
@@ -7377,6 +7694,7 @@ def salvar_simulacao():
 
         registro.frete = frete_decimal
         db.session.add(registro)
+        atualizar_resumo_proposta(registro)
 
         print("\n[PONTO G] Realizando db.session.commit()")
         db.session.commit()
@@ -7661,14 +7979,11 @@ def simulacao_servicos():
         user_type = session.get('user_type')
         user_principal_id = current_user.user_principal_id if user_type == 'subusuario' else user_id
 
-        if user_type == 'subusuario':
-            registros = CalculadoraPasso1Servicos.query.filter_by(subusuario_id=user_id).all()
-        else:
-            subusuarios_ids = [sub.id for sub in current_user.subusuarios]
-            registros = CalculadoraPasso1Servicos.query.filter(
-                (CalculadoraPasso1Servicos.user_id == current_user.id) |
-                (CalculadoraPasso1Servicos.subusuario_id.in_(subusuarios_ids))
-            ).all()
+        # Camada ativa + propostas encerradas já arquivadas (somente leitura)
+        registros = arquivo_propostas.propostas(
+            CalculadoraPasso1Servicos, user_principal_id,
+            subusuario_id=user_id if user_type == 'subusuario' else None
+        )
 
         return render_template('simulacao_servicos.html', registros=registros)
     except Exception as e:
@@ -7701,11 +8016,8 @@ def obter_dados_simulacao_servicos(registro_id):
 
         app.logger.info(f"🔍 Buscando registro {registro_id} para usuário {user_principal_id}")
 
-        # ✅ BUSCAR REGISTRO COM TRATAMENTO DE ERRO
-        registro = CalculadoraPasso1Servicos.query.filter_by(
-            id=registro_id,
-            user_id=user_principal_id
-        ).first()
+        # ✅ BUSCAR REGISTRO (ATIVO OU ARQUIVADO) COM TRATAMENTO DE ERRO
+        registro = arquivo_propostas.proposta(CalculadoraPasso1Servicos, user_principal_id, registro_id)
 
         if not registro:
             app.logger.error(f"❌ Registro {registro_id} não encontrado para usuário {user_principal_id}")
@@ -7720,14 +8032,12 @@ def obter_dados_simulacao_servicos(registro_id):
 
         # ✅ BUSCAR LOTES COM LOGS
         app.logger.info(f"🔍 Buscando lotes para proposta_servico_id: {registro.id}")
-        lotes = Lote.query.filter_by(proposta_servico_id=registro.id).all()
+        lotes = arquivo_propostas.lotes_com_servicos(registro.id, registro.arquivada)
         app.logger.info(f"✅ Encontrados {len(lotes)} lotes")
 
         # Preparar estrutura para lotes e serviços
         lotes_data = []
-        for lote in lotes:
-            app.logger.info(f"🔍 Processando lote: {lote.nome}")
-            servicos = Servico.query.filter_by(lote_id=lote.id).all()
+        for lote, servicos in lotes:
             app.logger.info(f"✅ Encontrados {len(servicos)} serviços no lote {lote.nome}")
 
             lotes_data.append({
@@ -7748,7 +8058,7 @@ def obter_dados_simulacao_servicos(registro_id):
 
         # ✅ BUSCAR DESPESAS COM LOGS
         app.logger.info(f"🔍 Buscando despesas para proposta_servico_id: {registro.id}")
-        despesas = Despesa.query.filter_by(proposta_servico_id=registro.id).all()
+        despesas = arquivo_propostas.dependentes(Despesa, 'proposta_servico_id', registro.id, registro.arquivada)
         app.logger.info(f"✅ Encontradas {len(despesas)} despesas")
 
         # ✅ CALCULAR RESUMO COM IMPOSTO
@@ -7757,8 +8067,8 @@ def obter_dados_simulacao_servicos(registro_id):
         valor_venda_total = 0
         total_despesas = sum(despesa.valor for despesa in despesas)
 
-        for lote in lotes:
-            for servico in lote.servicos:
+        for lote, servicos in lotes:
+            for servico in servicos:
                 custo_total += servico.custo_unitario * servico.quantidade
                 quantidade_total += servico.quantidade
                 valor_venda_total += servico.valor_venda * servico.quantidade
@@ -7778,6 +8088,7 @@ def obter_dados_simulacao_servicos(registro_id):
             "razao_social": registro.razao_social,
             "endereco": registro.endereco,
             "numero_processo": registro.numero_processo,
+            "arquivada": registro.arquivada,
             "despesas": [
                 {"id": despesa.id, "descricao": despesa.nome, "valor": float(despesa.valor)}
                 for despesa in despesas
@@ -8194,16 +8505,9 @@ def visualizar_relatorios():
         data_fim = request.args.get('data_fim')
         status = request.args.get('status')
 
-        query = CalculadoraPasso1.query.filter_by(user_id=user_principal_id)
-
-        if data_inicio:
-            query = query.filter(CalculadoraPasso1.criado_em >= data_inicio)
-        if data_fim:
-            query = query.filter(CalculadoraPasso1.criado_em <= data_fim)
-        if status:
-            query = query.filter(CalculadoraPasso1.status == status)
-
-        registros = query.order_by(CalculadoraPasso1.criado_em.desc()).all()
+        # Camada ativa + propostas encerradas já arquivadas
+        registros = arquivo_propostas.propostas(CalculadoraPasso1, user_principal_id, status=status,
+                                                data_inicio=data_inicio, data_fim=data_fim)
 
         return render_template('relatorios.html', registros=registros, data_inicio=data_inicio, data_fim=data_fim,
                                status=status)
@@ -8224,11 +8528,13 @@ def detalhes_registro(registro_id):
             current_user.user_principal_id if session.get('user_type') == 'subusuario' else current_user.id
         )
 
-        # Buscar o registro e verificar o acesso
-        registro = CalculadoraPasso1.query.filter_by(id=registro_id, user_id=user_principal_id).first_or_404()
+        # Buscar o registro (ativo ou arquivado) e verificar o acesso
+        registro = arquivo_propostas.proposta(CalculadoraPasso1, user_principal_id, registro_id)
+        if registro is None:
+            return jsonify({'error': 'Registro não encontrado.'}), 404
 
-        # Buscar produtos associados
-        produtos = Produto.query.filter_by(calculadora_passo1_id=registro.id).all()
+        # Buscar produtos associados na mesma camada do registro
+        produtos = arquivo_propostas.dependentes(Produto, 'calculadora_passo1_id', registro.id, registro.arquivada)
 
         if not produtos:
             return jsonify({
@@ -8313,10 +8619,19 @@ def excluir_registro(registro_id):
         )
 
         # Verificar se o registro existe e pertence ao usuário
-        registro = CalculadoraPasso1.query.filter_by(id=registro_id, user_id=user_principal_id).first_or_404()
+        registro = CalculadoraPasso1.query.filter_by(id=registro_id, user_id=user_principal_id).first()
+        if registro is None:
+            # Proposta encerrada já arquivada: sai direto das tabelas de arquivo
+            if arquivo_propostas.proposta(CalculadoraPasso1, user_principal_id, registro_id) is None:
+                return jsonify({'error': 'Registro não encontrado.'}), 404
+            arquivo_propostas.excluir_arquivada(CalculadoraPasso1, registro_id)
+            db.session.commit()
+            return jsonify({'message': 'Registro excluído com sucesso!'}), 200
 
         # Excluir os produtos associados
+        ids_itens = [i for (i,) in db.session.query(Produto.id).filter_by(calculadora_passo1_id=registro.id)]
         Produto.query.filter_by(calculadora_passo1_id=registro.id).delete(synchronize_session=False)
+        indice_autocomplete.registrar_remocao(Produto, user_principal_id, ids_itens)
 
         # Excluir o registro
         db.session.delete(registro)
@@ -8417,8 +8732,10 @@ def _obter_fornecedores_paginados(pagina, por_pagina, busca_nome='', busca_ativi
         if busca_atividade:
             query = query.filter(Fornecedor.atividade_principal.ilike(f'%{busca_atividade}%'))
 
-        # Ordenar por nome da empresa
-        query = query.order_by(Fornecedor.nome_empresa.asc())
+        # Ordenar por nome da empresa; agregado de avaliações vem no mesmo SELECT
+        query = query.order_by(Fornecedor.nome_empresa.asc()).options(
+            db.joinedload(Fornecedor.resumo_avaliacao)
+        )
 
         # Aplicar paginação
         fornecedores_paginados = query.paginate(
@@ -8430,11 +8747,7 @@ def _obter_fornecedores_paginados(pagina, por_pagina, busca_nome='', busca_ativi
         # Processar fornecedores com avaliações
         fornecedores_detalhes = []
         for fornecedor in fornecedores_paginados.items:
-            # Buscar avaliações do fornecedor
-            avaliacoes = AvaliacaoFornecedor.query.filter_by(fornecedor_id=fornecedor.id).all()
-
-            # Calcular média das avaliações
-            media_avaliacao = _calcular_media_avaliacoes(avaliacoes)
+            resumo = fornecedor.resumo_avaliacao
 
             fornecedores_detalhes.append({
                 'id': fornecedor.id,
@@ -8446,8 +8759,8 @@ def _obter_fornecedores_paginados(pagina, por_pagina, busca_nome='', busca_ativi
                 'nome_vendedor': fornecedor.nome_vendedor,
                 'contato_vendedor': fornecedor.contato_vendedor,
                 'comentario': fornecedor.comentario,
-                'media_avaliacao': media_avaliacao,
-                'total_avaliacoes': len(avaliacoes),
+                'media_avaliacao': resumo.media_geral if resumo else 0,
+                'total_avaliacoes': resumo.total_avaliacoes if resumo else 0,
                 'data_cadastro': fornecedor.data_cadastro.strftime('%d/%m/%Y') if hasattr(fornecedor,
                                                                                           'data_cadastro') else None
             })
@@ -8629,19 +8942,66 @@ def _validar_dados_fornecedor(dados):
     return erros
 
 
-def _calcular_media_avaliacoes(avaliacoes):
-    """
-    Calcula a média das avaliações de um fornecedor.
-    """
-    if not avaliacoes:
-        return 0
+def _calcular_estatisticas_fornecedores():
+    """
+    Calcula as estatísticas gerais dos fornecedores (diretório compartilhado por todos os usuários).
+    """
+    # Estatísticas básicas
+    total_fornecedores = Fornecedor.query.count()
+    # SUM no MySQL devolve Decimal: converte para o JSON e a divisão abaixo
+    total_avaliacoes = int(db.session.query(
+        func.coalesce(func.sum(ResumoAvaliacaoFornecedor.total_avaliacoes), 0)
+    ).scalar())
+
+    # Fornecedores por atividade (top 10)
+    atividades = db.session.query(
+        Fornecedor.atividade_principal,
+        func.count(Fornecedor.id).label('total')
+    ).group_by(Fornecedor.atividade_principal).order_by(
+        func.count(Fornecedor.id).desc()
+    ).limit(10).all()
+
+    # Fornecedores mais bem avaliados (top 10), direto do agregado de avaliações
+    media = (
+        (ResumoAvaliacaoFornecedor.soma_prazo +
+         ResumoAvaliacaoFornecedor.soma_qualidade +
+         ResumoAvaliacaoFornecedor.soma_preco) /
+        (ResumoAvaliacaoFornecedor.total_avaliacoes * 3.0)
+    ).label('media')
+
+    melhores_fornecedores = db.session.query(
+        Fornecedor.nome_empresa,
+        media
+    ).join(ResumoAvaliacaoFornecedor, Fornecedor.id == ResumoAvaliacaoFornecedor.fornecedor_id).filter(
+        ResumoAvaliacaoFornecedor.total_avaliacoes > 0
+    ).order_by(media.desc()).limit(10).all()
+
+    return {
+        'total_fornecedores': total_fornecedores,
+        'total_avaliacoes': total_avaliacoes,
+        'media_avaliacoes_por_fornecedor': round(total_avaliacoes / total_fornecedores,
+                                                 2) if total_fornecedores > 0 else 0,
+        'atividades_principais': [
+            {'atividade': ativ[0], 'total': ativ[1]}
+            for ativ in atividades
+        ],
+        'melhores_fornecedores': [
+            {'nome': forn[0], 'media': round(float(forn[1]), 2)}
+            for forn in melhores_fornecedores
+        ]
+    }
+
 
-    total_prazo = sum(avaliacao.nota_prazo for avaliacao in avaliacoes)
-    total_qualidade = sum(avaliacao.nota_qualidade for avaliacao in avaliacoes)
-    total_preco = sum(avaliacao.nota_preco for avaliacao in avaliacoes)
-    total_avaliacoes = len(avaliacoes) * 3  # 3 notas por avaliação
+# Snapshot em memória: recalculado com debounce após escritas em fornecedores/avaliações
+from snapshot_estatisticas import SnapshotEstatisticas
 
-    return round((total_prazo + total_qualidade + total_preco) / total_avaliacoes, 2)
+snapshot_estatisticas_fornecedores = SnapshotEstatisticas(
+    app,
+    _calcular_estatisticas_fornecedores,
+    atraso_segundos=app.config.get('FORNECEDORES_ESTATISTICAS_DEBOUNCE', 5),
+    idade_maxima_segundos=app.config.get('FORNECEDORES_ESTATISTICAS_IDADE_MAXIMA', 300),
+)
+snapshot_estatisticas_fornecedores.registrar_eventos((Fornecedor, AvaliacaoFornecedor))
 
 
 @app.route('/fornecedores/estatisticas', methods=['GET'])
@@ -8651,49 +9011,9 @@ def estatisticas_fornecedores():
     Retorna estatísticas gerais dos fornecedores.
     """
     try:
-        # Estatísticas básicas
-        total_fornecedores = Fornecedor.query.count()
-        total_avaliacoes = AvaliacaoFornecedor.query.count()
-
-        # Fornecedores por atividade (top 10)
-        atividades = db.session.query(
-            Fornecedor.atividade_principal,
-            func.count(Fornecedor.id).label('total')
-        ).group_by(Fornecedor.atividade_principal).order_by(
-            func.count(Fornecedor.id).desc()
-        ).limit(10).all()
-
-        # Fornecedores mais bem avaliados (top 10)
-        subquery = db.session.query(
-            AvaliacaoFornecedor.fornecedor_id,
-            func.avg((AvaliacaoFornecedor.nota_prazo +
-                      AvaliacaoFornecedor.nota_qualidade +
-                      AvaliacaoFornecedor.nota_preco) / 3.0).label('media')
-        ).group_by(AvaliacaoFornecedor.fornecedor_id).subquery()
-
-        melhores_fornecedores = db.session.query(
-            Fornecedor.nome_empresa,
-            subquery.c.media
-        ).join(subquery, Fornecedor.id == subquery.c.fornecedor_id).order_by(
-            subquery.c.media.desc()
-        ).limit(10).all()
-
         return jsonify({
             'success': True,
-            'estatisticas': {
-                'total_fornecedores': total_fornecedores,
-                'total_avaliacoes': total_avaliacoes,
-                'media_avaliacoes_por_fornecedor': round(total_avaliacoes / total_fornecedores,
-                                                         2) if total_fornecedores > 0 else 0,
-                'atividades_principais': [
-                    {'atividade': ativ[0], 'total': ativ[1]}
-                    for ativ in atividades
-                ],
-                'melhores_fornecedores': [
-                    {'nome': forn[0], 'media': round(float(forn[1]), 2)}
-                    for forn in melhores_fornecedores
-                ]
-            }
+            'estatisticas': snapshot_estatisticas_fornecedores.obter()
         })
 
     except Exception as e:
@@ -8708,55 +9028,38 @@ def estatisticas_fornecedores():
 @login_required
 def exportar_fornecedores():
     """
-    Exporta lista de fornecedores em formato CSV.
+    Exporta lista de fornecedores em formato CSV (gerado em fluxo, sem montar o arquivo em memória).
     """
     try:
-        import csv
-        from io import StringIO
-
-        # Buscar todos os fornecedores
-        fornecedores = Fornecedor.query.order_by(Fornecedor.nome_empresa.asc()).all()
-
-        # Criar CSV
-        output = StringIO()
-        writer = csv.writer(output)
-
-        # Cabeçalho
-        writer.writerow([
-            'CNPJ', 'Nome da Empresa', 'Atividade Principal', 'Endereço',
-            'Contato', 'Nome do Vendedor', 'Contato do Vendedor', 'Comentário',
-            'Média de Avaliações', 'Total de Avaliações', 'Data de Cadastro'
-        ])
-
-        # Dados
-        for fornecedor in fornecedores:
-            avaliacoes = AvaliacaoFornecedor.query.filter_by(fornecedor_id=fornecedor.id).all()
-            media_avaliacao = _calcular_media_avaliacoes(avaliacoes)
-
-            writer.writerow([
-                fornecedor.cnpj,
-                fornecedor.nome_empresa,
-                fornecedor.atividade_principal,
-                fornecedor.endereco,
-                fornecedor.contato,
-                fornecedor.nome_vendedor or '',
-                fornecedor.contato_vendedor or '',
-                fornecedor.comentario or '',
-                media_avaliacao,
-                len(avaliacoes),
-                fornecedor.data_cadastro.strftime('%d/%m/%Y') if hasattr(fornecedor, 'data_cadastro') else ''
-            ])
-
-        # Preparar resposta
-        output.seek(0)
-
-        from flask import make_response
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers[
-            'Content-Disposition'] = f'attachment; filename=fornecedores_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        # Fornecedores com o agregado de avaliações num único SELECT, lido em partes
+        consulta = db.select(Fornecedor, ResumoAvaliacaoFornecedor).outerjoin(
+            ResumoAvaliacaoFornecedor, ResumoAvaliacaoFornecedor.fornecedor_id == Fornecedor.id
+        ).order_by(Fornecedor.nome_empresa.asc()).execution_options(yield_per=LINHAS_POR_LEITURA)
+
+        def linhas():
+            for fornecedor, resumo in db.session.execute(consulta):
+                yield [
+                    fornecedor.cnpj,
+                    fornecedor.nome_empresa,
+                    fornecedor.atividade_principal,
+                    fornecedor.endereco,
+                    fornecedor.contato,
+                    fornecedor.nome_vendedor or '',
+                    fornecedor.contato_vendedor or '',
+                    fornecedor.comentario or '',
+                    resumo.media_geral if resumo else 0,
+                    resumo.total_avaliacoes if resumo else 0,
+                    fornecedor.data_cadastro.strftime('%d/%m/%Y') if fornecedor.data_cadastro else ''
+                ]
 
-        return response
+        return resposta_csv(
+            f'fornecedores_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+            ['CNPJ', 'Nome da Empresa', 'Atividade Principal', 'Endereço',
+             'Contato', 'Nome do Vendedor', 'Contato do Vendedor', 'Comentário',
+             'Média de Avaliações', 'Total de Avaliações', 'Data de Cadastro'],
+            linhas(),
+            delimitador=','
+        )
 
     except Exception as e:
         app.logger.error(f"Erro ao exportar fornecedores: {str(e)}", exc_info=True)
@@ -8907,17 +9210,16 @@ def avaliar_fornecedor(fornecedor_id):
 
             mensagem = "Avaliação registrada com sucesso!"
 
+        # O agregado do fornecedor é atualizado no flush, na mesma transação da avaliação
         db.session.commit()
 
-        # Recalcular média atualizada
-        avaliacoes_atualizadas = AvaliacaoFornecedor.query.filter_by(fornecedor_id=fornecedor_id).all()
-        nova_media = _calcular_media_avaliacoes(avaliacoes_atualizadas)
+        resumo = db.session.get(ResumoAvaliacaoFornecedor, fornecedor_id)
 
         return jsonify({
             "success": True,
             "message": mensagem,
-            "nova_media": nova_media,
-            "total_avaliacoes": len(avaliacoes_atualizadas)
+            "nova_media": resumo.media_geral if resumo else 0,
+            "total_avaliacoes": resumo.total_avaliacoes if resumo else 0
         })
 
     except Exception as e:
@@ -9373,65 +9675,14 @@ from flask import request, jsonify, current_app, render_template, redirect, url_
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from models import db, ProdutosFornecedores, FornecedorProdutos, ProdutoDetalhes  # Adicionado ProdutoDetalhes
+from models import obter_contadores_catalogo, recalcular_contadores_catalogo
 
 
 # ============================================================================
 # FUNÇÕES AUXILIARES
 # ============================================================================
 
-def processar_valor_monetario(valor_str):
-    """
-    Processa valores monetários de diferentes formatos
-    """
-    if not valor_str:
-        return 0.0
-
-    try:
-        # Converter para string e limpar
-        valor_str = str(valor_str).strip()
-
-        # Casos especiais
-        if not valor_str or valor_str.lower() in [None,
-                                                  'nan', 'null', 'none', '']:
-            return 0.0
-
-        # Remover símbolos de moeda
-        valor_limpo = valor_str.replace("R$", "").replace("$", "").strip()
-
-        # Remover caracteres não numéricos exceto vírgula e ponto
-        valor_limpo = re.sub(r"[^\d,.-]", "", valor_limpo)
-
-        if not valor_limpo:
-            return 0.0
-
-        # Processar formato brasileiro (vírgula como decimal)
-        if "," in valor_limpo and "." in valor_limpo:
-            # Formato: 1.234,56
-            if valor_limpo.rfind(",") > valor_limpo.rfind("."):
-                partes = valor_limpo.rsplit(",", 1)
-                parte_inteira = partes[0].replace(".", "")
-                parte_decimal = partes[1] if len(partes) > 1 else "0"
-                valor_final = parte_inteira + "." + parte_decimal
-            else:
-                # Formato: 1,234.56
-                partes = valor_limpo.rsplit(".", 1)
-                parte_inteira = partes[0].replace(",", "")
-                parte_decimal = partes[1] if len(partes) > 1 else "0"
-                valor_final = parte_inteira + "." + parte_decimal
-        elif "," in valor_limpo:
-            # Apenas vírgula: assumir decimal brasileiro
-            valor_final = valor_limpo.replace(",", ".")
-        else:
-            # Apenas pontos ou só números
-            valor_final = valor_limpo
-
-        # Conversão final
-        resultado = float(valor_final)
-        return round(max(0, resultado), 2)
-
-    except Exception as e:
-        current_app.logger.warning(f"Erro ao processar valor '{valor_str}': {e}")
-        return 0.0
+from valores_monetarios import processar_valor_monetario, processar_valores_monetarios
 
 
 def detectar_delimitador(sample_text):
@@ -9801,12 +10052,9 @@ def filtrar_produtos():
                 pass  # Ignorar fornecedor_id inválido
 
         if busca:
-            search_term = f"%{busca}%"
-            query = query.filter(
-                (ProdutosFornecedores.nome.ilike(search_term)) |
-                (ProdutosFornecedores.marca.ilike(search_term)) |
-                (ProdutosFornecedores.modelo.ilike(search_term))
-            )
+            filtro_busca = indice_busca_catalogo.filtro(current_user.id, busca)
+            if filtro_busca is not None:
+                query = query.filter(filtro_busca)
 
         if preco_min:
             try:
@@ -9822,14 +10070,16 @@ def filtrar_produtos():
             except ValueError:
                 pass
 
-        produtos = query.order_by(ProdutosFornecedores.nome).all()
+        query = _aplicar_filtro_status_catalogo(query, status)
+        produtos = query.options(db.joinedload(ProdutosFornecedores.detalhes_rel)) \
+            .order_by(ProdutosFornecedores.nome).all()
 
         fornecedores = FornecedorProdutos.query.filter_by(user_id=current_user.id).all()
         fornecedores_dict = {f.id: f.nome_empresa for f in fornecedores}
 
         produtos_formatados = []
         for produto in produtos:
-            detalhes = ProdutoDetalhes.query.filter_by(produto_id=produto.id).first()
+            detalhes = produto.detalhes_rel
             produto_dict = {
                 "id": produto.id,
                 "nome": produto.nome or "Nome não informado",
@@ -9850,16 +10100,6 @@ def filtrar_produtos():
             }
             produtos_formatados.append(produto_dict)
 
-        # Aplicar filtro de status após a formatação para ter acesso a tem_foto e tem_descricao
-        if status == "com-foto":
-            produtos_formatados = [p for p in produtos_formatados if p["tem_foto"]]
-        elif status == "sem-foto":
-            produtos_formatados = [p for p in produtos_formatados if not p["tem_foto"]]
-        elif status == "com-descricao":
-            produtos_formatados = [p for p in produtos_formatados if p["tem_descricao"]]
-        elif status == "sem-descricao":
-            produtos_formatados = [p for p in produtos_formatados if not p["tem_descricao"]]
-
         return jsonify({"success": True, "produtos": produtos_formatados})
 
     except Exception as e:
@@ -9870,35 +10110,33 @@ def filtrar_produtos():
 @app.route("/produtos_fornecedores/exportar_csv", methods=["GET"])
 @login_required
 def exportar_csv_produtos():
-    """Exporta os produtos para um arquivo CSV"""
+    """Exporta os produtos para um arquivo CSV (gerado em fluxo enquanto as linhas chegam do banco)"""
     try:
-        produtos = ProdutosFornecedores.query.filter_by(user_id=current_user.id).all()
-
-        # Usar StringIO para criar o CSV em memória
-        si = io.StringIO()
-        cw = csv.writer(si, delimiter=';', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-
-        # Cabeçalho
-        cw.writerow(["Nome", "Marca", "Modelo", "Unidade de Medida", "Custo", "Fornecedor"])
-
-        # Dados
-        for produto in produtos:
-            fornecedor_nome = produto.fornecedor.nome_empresa if produto.fornecedor else ""
-            cw.writerow([
-                produto.nome,
-                produto.marca,
-                produto.modelo,
-                produto.unidade_medida,
-                str(produto.custo).replace('.', ','),  # Formato brasileiro
-                fornecedor_nome
-            ])
-
-        # Criar resposta
-        output = make_response(si.getvalue().encode('utf-8'))
-        output.headers["Content-Disposition"] = "attachment; filename=produtos.csv"
-        output.headers["Content-type"] = "text/csv; charset=utf-8"
+        consulta = db.select(
+            ProdutosFornecedores.nome, ProdutosFornecedores.marca, ProdutosFornecedores.modelo,
+            ProdutosFornecedores.unidade_medida, ProdutosFornecedores.custo, FornecedorProdutos.nome_empresa
+        ).outerjoin(
+            FornecedorProdutos, FornecedorProdutos.id == ProdutosFornecedores.fornecedor_id
+        ).where(
+            ProdutosFornecedores.user_id == current_user.id
+        ).order_by(ProdutosFornecedores.id).execution_options(yield_per=LINHAS_POR_LEITURA)
+
+        def linhas():
+            for nome, marca, modelo, unidade_medida, custo, fornecedor_nome in db.session.execute(consulta):
+                yield [
+                    nome,
+                    marca,
+                    modelo,
+                    unidade_medida,
+                    str(custo).replace('.', ','),  # Formato brasileiro
+                    fornecedor_nome or ""
+                ]
 
-        return output
+        return resposta_csv(
+            "produtos.csv",
+            ["Nome", "Marca", "Modelo", "Unidade de Medida", "Custo", "Fornecedor"],
+            linhas()
+        )
 
     except Exception as e:
         flash(f'Erro ao exportar CSV: {str(e)}', 'danger')
@@ -9985,155 +10223,276 @@ def download_modelo_csv():
         return redirect(url_for('listar_produtos_fornecedores'))
 
 
-# Em app.py, substitua a função importar_produtos_csv por esta:
+# ===== IMPORTAÇÃO DE PRODUTOS EM LOTES =====
+from importacao_produtos import (ImportadorProdutos, RelatorioImportacao, SimulacaoImportacao, abrir_csv, abrir_xlsx,
+                                 mapear_colunas)
 
-@app.route('/importar_produtos_csv', methods=['POST'])
-@login_required
-def importar_produtos_csv():
-    """Importa produtos de um arquivo CSV - VERSÃO OTIMIZADA E SIMPLIFICADA"""
-    try:
-        current_app.logger.info(f"Iniciando importação CSV para usuário {current_user.id}")
 
-        if 'file' not in request.files:
-            flash("Nenhum arquivo enviado.", "danger")
-            return redirect(url_for('listar_produtos_fornecedores'))
+def _concluir_importacao_produtos(user_id, relatorio):
+    """Atualiza o que a escrita em massa não atualiza pelo flush: contadores, dashboard e autocomplete"""
+    if relatorio.importados or relatorio.atualizados or relatorio.ausentes:
+        recalcular_contadores_catalogo(user_id)
+        cache_dashboard.invalidar(user_id)
+        indice_autocomplete.descartar(user_id)
 
-        file = request.files['file']
-        if file.filename == '':
-            flash("Nenhum arquivo selecionado.", "danger")
-            return redirect(url_for('listar_produtos_fornecedores'))
 
-        # Validação da extensão do arquivo
-        if not '.' in file.filename or file.filename.rsplit('.', 1)[1].lower() != 'csv':
-            flash("Tipo de arquivo não permitido. Apenas arquivos CSV são aceitos.", "danger")
-            return redirect(url_for('listar_produtos_fornecedores'))
+def _mensagem_importacao(relatorio, modo='inserir'):
+    """Mensagem com o resultado e os primeiros erros do relatório, como (texto, categoria)"""
+    if modo == 'atualizar':
+        resumo = (f"{relatorio.importados} novos, {relatorio.atualizados} atualizados, "
+                  f"{relatorio.inalterados} sem alteração")
+        if relatorio.ausentes:
+            resumo += f", {relatorio.ausentes} marcados como fora da lista"
+        if relatorio.total_erros:
+            return (f"Lista importada com {relatorio.total_erros} erros: {resumo}. "
+                    f"Detalhes: {relatorio.resumo_erros()}..."), "warning"
+        return f"Lista importada: {resumo}.", "success"
+    if relatorio.total_erros == 0 and relatorio.importados > 0:
+        return f"Importação concluída com sucesso! {relatorio.importados} produtos foram importados.", "success"
+    if relatorio.importados > 0:
+        return (f"Importação parcial: {relatorio.importados} produtos importados e {relatorio.total_erros} erros. "
+                f"Detalhes: {relatorio.resumo_erros()}..."), "warning"
+    return (f"A importação falhou. {relatorio.total_erros} erros encontrados. "
+            f"Detalhes: {relatorio.resumo_erros()}..."), "danger"
 
-        # Salvar arquivo temporariamente para análise
-        temp_dir = tempfile.mkdtemp()
-        temp_filepath = os.path.join(temp_dir, secure_filename(file.filename))
-        file.save(temp_filepath)
-        current_app.logger.info(f"Arquivo salvo temporariamente: {temp_filepath}")
-
-        # Detectar encoding e delimitador
-        encoding = detectar_encoding(temp_filepath)
-        current_app.logger.info(f"Encoding detectado: {encoding}")
-        with open(temp_filepath, 'r', encoding=encoding) as f:
-            sample = f.read(2048)  # Amostra maior para garantir a detecção
-            delimiter = detectar_delimitador(sample)
-        current_app.logger.info(f"Delimitador detectado: '{delimiter}'")
-
-        total_importados = 0
-        total_erros = 0
-        erros_detalhes = []
-
-        # Obter um dicionário de fornecedores do usuário para consulta rápida
-        fornecedores_usuario = {f.id: f for f in FornecedorProdutos.query.filter_by(user_id=current_user.id).all()}
-
-        with open(temp_filepath, 'r', encoding=encoding) as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=delimiter)
-
-            if not reader.fieldnames:
-                flash("Arquivo CSV vazio ou sem cabeçalhos.", "danger")
-                return redirect(url_for('listar_produtos_fornecedores'))
-
-            current_app.logger.info(f"Colunas encontradas: {reader.fieldnames}")
-
-            # Mapeamento flexível de colunas
-            col_mapping = {
-                'nome': next((f for f in reader.fieldnames if 'nome' in f.lower() or 'produto' in f.lower()), None),
-                'marca': next((f for f in reader.fieldnames if 'marca' in f.lower()), None),
-                'modelo': next((f for f in reader.fieldnames if 'modelo' in f.lower()), None),
-                'unidade_medida': next(
-                    (f for f in reader.fieldnames if 'unidade' in f.lower() or 'medida' in f.lower()), None),
-                'custo': next((f for f in reader.fieldnames if
-                               'custo' in f.lower() or 'preço' in f.lower() or 'valor' in f.lower()), None),
-                'fornecedor_id': next(
-                    (f for f in reader.fieldnames if 'fornecedor_id' in f.lower() or 'id_fornecedor' in f.lower()),
-                    None)
-            }
 
-            if not col_mapping['nome'] or not col_mapping['custo']:
-                flash(
-                    "O arquivo CSV deve conter colunas para 'nome' e 'custo' (ou variações como 'produto', 'preço', 'valor').",
-                    "danger")
-                return redirect(url_for('listar_produtos_fornecedores'))
+# Formatos lidos em streaming (.xls antigo não é suportado pelo openpyxl)
+EXTENSOES_IMPORTACAO = ('csv', 'xlsx')
 
-            for i, row in enumerate(reader):
-                linha_num = i + 2
-                try:
-                    nome = row.get(col_mapping['nome'], '').strip()
-                    custo_str = row.get(col_mapping['custo'], '').strip()
-
-                    if not nome or not custo_str:
-                        erros_detalhes.append(f"Linha {linha_num}: Nome ou custo em branco.")
-                        total_erros += 1
-                        continue
-
-                    custo = processar_valor_monetario(custo_str)
-                    if custo <= 0:
-                        erros_detalhes.append(f"Linha {linha_num}: Custo '{custo_str}' inválido.")
-                        total_erros += 1
-                        continue
-
-                    fornecedor_id = None
-                    if col_mapping['fornecedor_id'] and row.get(col_mapping['fornecedor_id']):
-                        try:
-                            f_id = int(row[col_mapping['fornecedor_id']].strip())
-                            if f_id in fornecedores_usuario:
-                                fornecedor_id = f_id
-                            else:
-                                raise ValueError("ID de fornecedor não pertence ao usuário.")
-                        except (ValueError, TypeError):
-                            erros_detalhes.append(
-                                f"Linha {linha_num}: ID de fornecedor '{row[col_mapping['fornecedor_id']]}' inválido ou não encontrado.")
-                            total_erros += 1
-                            continue
-
-                    # Cria o produto
-                    novo_produto = ProdutosFornecedores(
-                        nome=nome,
-                        marca=row.get(col_mapping['marca'], '').strip() or None,
-                        modelo=row.get(col_mapping['modelo'], '').strip() or None,
-                        unidade_medida=row.get(col_mapping['unidade_medida'], 'UN').strip(),
-                        custo=custo,
-                        fornecedor_id=fornecedor_id,
-                        user_id=current_user.id
-                    )
-                    db.session.add(novo_produto)
-                    total_importados += 1
 
-                except Exception as e:
-                    total_erros += 1
-                    erros_detalhes.append(f"Linha {linha_num}: {str(e)}")
-                    db.session.rollback()
+def _pasta_importacoes():
+    """Pasta dos arquivos aguardando importação (fora de static/, compartilhada entre os workers)"""
+    pasta = app.config.get('IMPORTACAO_PASTA') or os.path.join(app.instance_path, 'importacoes')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def _contar_linhas_arquivo(caminho):
+    """Quebras de linha do arquivo, lido em blocos (estimativa do total de linhas de um CSV)"""
+    total = 0
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            total += bloco.count(b'\n')
+    return total
+
 
-        if total_importados > 0:
+def _abrir_arquivo_importacao(caminho, extensao):
+    """
+    Abre o arquivo gravado para leitura em streaming: no CSV, detecta encoding e
+    delimitador; no XLSX, a planilha e a linha de cabeçalho.
+
+    Returns:
+        tuple: (cabeçalho, gerador de (número da linha, dict), formato detectado:
+        encoding e delimitador no CSV)
+
+    Raises:
+        ArquivoInvalido: se o arquivo não tiver cabeçalho com nome e custo
+    """
+    if extensao == 'xlsx':
+        return (*abrir_xlsx(caminho), {'formato': 'xlsx'})
+
+    # Detectar encoding e delimitador
+    encoding = detectar_encoding(caminho)
+    with open(caminho, 'r', encoding=encoding) as f:
+        delimiter = detectar_delimitador(f.read(2048))
+    current_app.logger.info(f"Encoding detectado: {encoding}, delimitador: '{delimiter}'")
+    return (*abrir_csv(caminho, encoding, delimiter), {'formato': 'csv', 'encoding': encoding, 'delimitador': delimiter})
+
+
+@executor_tarefas.tipo('importar_produtos')
+def importar_produtos_em_lotes(tarefa):
+    """
+    Importa o arquivo gravado em lotes com commit. A última linha de cada lote (ultimo_id)
+    e o relatório parcial são gravados na transação do próprio lote: uma execução retomada
+    após a queda do processo continua do lote seguinte, sem duplicar produtos.
+    O arquivo é removido ao final, com sucesso ou erro.
+    """
+    parametros = tarefa.get_parametros()
+    caminho = parametros['caminho']
+    modo = parametros.get('modo', 'inserir')
+    max_erros = app.config.get('IMPORTACAO_MAX_ERROS', 200)
+
+    def registrar_progresso(ultima_linha, relatorio):
+        tarefa.ultimo_id = ultima_linha
+        tarefa.processados = relatorio.linhas_lidas
+        tarefa.set_resultado(relatorio.to_dict())
+        tarefa.mensagem = f"{relatorio.linhas_lidas} linha(s) processada(s)..."
+
+    def manter_ativa(relatorio):
+        # Etapas sem lote gravado (retomada, marcação de ausentes): atualizado_em mostra
+        # a retomar_paradas que a tarefa segue viva
+        tarefa.set_resultado(relatorio.to_dict())
+        tarefa.mensagem = (f"{relatorio.linhas_lidas} linha(s) processada(s), "
+                           f"{relatorio.ausentes} produto(s) fora da lista...")
+        tarefa.atualizado_em = datetime.utcnow()
+        db.session.commit()
+
+    importador = None
+    try:
+        if parametros['extensao'] == 'csv' and tarefa.total is None:
+            tarefa.total = max(_contar_linhas_arquivo(caminho) - 1, 0)
             db.session.commit()
 
-        # Limpar arquivos temporários
-        try:
-            os.remove(temp_filepath)
-            os.rmdir(temp_dir)
-        except OSError as e:
-            current_app.logger.error(f"Erro ao limpar arquivos temporários: {e}")
-
-        # Mensagens de feedback
-        if total_erros == 0 and total_importados > 0:
-            flash(f"Importação concluída com sucesso! {total_importados} produtos foram importados.", "success")
-        elif total_importados > 0 and total_erros > 0:
-            flash(
-                f"Importação parcial: {total_importados} produtos importados e {total_erros} erros. Detalhes: {'; '.join(erros_detalhes[:3])}...",
-                "warning")
-        else:
-            flash(f"A importação falhou. {total_erros} erros encontrados. Detalhes: {'; '.join(erros_detalhes[:3])}...",
-                  "danger")
+        cabecalho, linhas, _ = _abrir_arquivo_importacao(caminho, parametros['extensao'])
+        current_app.logger.info(f"Colunas encontradas: {cabecalho}")
+        importador = ImportadorProdutos(
+            tarefa.user_id,
+            processar_valor_monetario,
+            tamanho_lote=app.config.get('IMPORTACAO_LOTE', 1000),
+            max_erros=max_erros,
+            modo=modo,
+            marcar_ausentes=parametros.get('marcar_ausentes', False),
+            # Retomada: continua o relatório gravado e mantém o início original
+            relatorio=RelatorioImportacao.de_dict(tarefa.get_resultado(), max_erros) if tarefa.ultimo_id else None,
+            inicio=tarefa.iniciado_em,
+            antes_do_commit=registrar_progresso,
+            converter_valores=processar_valores_monetarios,
+            ao_progredir=manter_ativa
+        )
+        if tarefa.ultimo_id:
+            current_app.logger.info(f"🔁 Importação {tarefa.id} retomada após a linha {tarefa.ultimo_id}")
+        relatorio = importador.importar(linhas, mapear_colunas(cabecalho), retomar_apos=tarefa.ultimo_id)
+    finally:
+        # Um lote interrompido no meio não pode ir junto com o commit dos contadores
+        db.session.rollback()
+        if importador is not None:
+            _concluir_importacao_produtos(tarefa.user_id, importador.relatorio)
+        executor_tarefas.remover_arquivos([caminho])
+
+    tarefa.processados = relatorio.linhas_lidas
+    tarefa.set_resultado(relatorio.to_dict())
+    tarefa.mensagem = _mensagem_importacao(relatorio, modo)[0][:500]
+    current_app.logger.info(
+        f"Importação {parametros['extensao'].upper()} ({modo}) do usuário {tarefa.user_id}: "
+        f"{relatorio.importados} novos, {relatorio.atualizados} atualizados, {relatorio.ausentes} ausentes, "
+        f"{relatorio.total_erros} erros em {relatorio.linhas_lidas} linhas ({relatorio.lotes} lotes)"
+    )
+
+
+@executor_tarefas.tipo('validar_importacao')
+def validar_importacao_produtos(tarefa):
+    """
+    Simulação da importação: uma passada pelo arquivo gravado, sem escrita no catálogo
+    (só o progresso da tarefa, a cada lote). Formato detectado, mapeamento das colunas,
+    contagens e problemas vão em resultado.
+    """
+    parametros = tarefa.get_parametros()
+    caminho = parametros['caminho']
+
+    def registrar_progresso(linhas_lidas):
+        # Um commit por lote: sem ele, retomar_paradas tomaria uma validação longa por parada
+        tarefa.processados = linhas_lidas
+        tarefa.mensagem = f"{linhas_lidas} linha(s) verificada(s)..."
+        tarefa.atualizado_em = datetime.utcnow()
+        db.session.commit()
+
+    try:
+        cabecalho, linhas, formato = _abrir_arquivo_importacao(caminho, parametros['extensao'])
+        simulacao = SimulacaoImportacao(
+            tarefa.user_id,
+            processar_valor_monetario,
+            converter_valores=processar_valores_monetarios,
+            tamanho_lote=app.config.get('IMPORTACAO_LOTE', 1000),
+            ao_progredir=registrar_progresso
+        )
+        resultado = {**formato, **simulacao.validar(linhas, cabecalho)}
+    finally:
+        executor_tarefas.remover_arquivos([caminho])
+
+    problemas = resultado['linhas_com_erro'] + resultado['repetidas']['total']
+    tarefa.processados = resultado['linhas_lidas']
+    tarefa.set_resultado(resultado)
+    tarefa.mensagem = (
+        f"{resultado['linhas_validas']} de {resultado['linhas_lidas']} linha(s) válida(s); "
+        f"{resultado['linhas_com_erro']} com erro e {resultado['repetidas']['total']} repetida(s)."
+        if problemas else f"Arquivo válido: {resultado['linhas_lidas']} linha(s) prontas para importar."
+    )
+
+
+def _agendar_importacao(file, modo='inserir', marcar_ausentes=False, simular=False):
+    """
+    Grava o arquivo enviado na pasta de importações e agenda a importação (ou, com
+    simular=True, só a validação) em segundo plano.
+
+    Returns:
+        tuple: (corpo JSON, status HTTP): 202 com o id da tarefa para acompanhamento,
+        400 se a extensão não é CSV/XLSX ou 409 se o usuário já tem uma tarefa do mesmo
+        tipo em andamento
+    """
+    # Extensão validada no upload (o nome do cliente só é usado depois de passar pelo secure_filename)
+    nome_seguro = secure_filename(file.filename or '')
+    extensao = nome_seguro.rsplit('.', 1)[-1].lower() if '.' in nome_seguro else ''
+    if extensao not in EXTENSOES_IMPORTACAO:
+        return {"success": False,
+                "error": "Tipo de arquivo não permitido. Apenas arquivos CSV e XLSX são aceitos."}, 400
+
+    tipo = 'validar_importacao' if simular else 'importar_produtos'
+    andamento = executor_tarefas.em_andamento(current_user.id, tipo)
+    if andamento:
+        return {"success": False, "tarefa_id": andamento.id,
+                "error": "Já existe uma " + ("validação" if simular else "importação") +
+                         " de produtos em andamento."}, 409
+
+    fd, caminho = tempfile.mkstemp(prefix=f'importacao_{current_user.id}_', suffix=f'.{extensao}',
+                                   dir=_pasta_importacoes())
+    os.close(fd)
+    try:
+        file.save(caminho)
+        tarefa = executor_tarefas.iniciar(current_user.id, tipo, parametros={
+            'caminho': caminho,
+            'extensao': extensao,
+            'arquivo': file.filename,
+            'modo': modo,
+            'marcar_ausentes': marcar_ausentes,
+        })
+    except Exception:
+        os.remove(caminho)
+        raise
+
+    return {
+        "success": True,
+        "tarefa_id": tarefa.id,
+        "status_url": url_for("status_tarefa", tarefa_id=tarefa.id),
+        "message": f"{'Validação' if simular else 'Importação'} de '{file.filename}' iniciada em segundo plano."
+    }, 202
+
+
+@app.route('/importar_produtos_csv', methods=['POST'])
+@login_required
+def importar_produtos_csv():
+    """
+    Recebe um arquivo CSV ou XLSX e agenda a importação em segundo plano (com simular=1,
+    só a validação, sem gravar). Chamada via fetch (X-Requested-With) responde JSON com o id da tarefa;
+    o formulário comum volta para a listagem com a mensagem.
+    """
+    ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+    def responder(corpo, status):
+        if ajax:
+            return jsonify(corpo), status
+        flash(corpo.get("message") or corpo.get("error"), "info" if status == 202 else "danger")
+        return redirect(url_for('listar_produtos_fornecedores'))
+
+    try:
+        current_app.logger.info(f"Iniciando importação de produtos para usuário {current_user.id}")
+
+        if 'file' not in request.files:
+            return responder({"success": False, "error": "Nenhum arquivo enviado."}, 400)
+
+        file = request.files['file']
+        if file.filename == '':
+            return responder({"success": False, "error": "Nenhum arquivo selecionado."}, 400)
+
+        # 'atualizar': a lista do fornecedor atualiza os produtos já cadastrados em vez de duplicá-los
+        modo = 'atualizar' if request.form.get('modo_importacao') == 'atualizar' else 'inserir'
+        return responder(*_agendar_importacao(file, modo, marcar_ausentes=bool(request.form.get('marcar_ausentes')),
+                                              simular=request.form.get('simular') == '1'))
 
     except Exception as e:
         db.session.rollback()
-        current_app.logger.error(f"Erro geral na importação de CSV: {e}", exc_info=True)
-        flash(f"Ocorreu um erro inesperado ao processar o arquivo CSV: {str(e)}", "danger")
-
-    return redirect(url_for('listar_produtos_fornecedores'))
+        current_app.logger.error(f"Erro geral na importação de produtos: {e}", exc_info=True)
+        return responder({"success": False,
+                          "error": f"Ocorreu um erro inesperado ao processar o arquivo: {str(e)}"}, 500)
 
 
 def gerar_pdf_catalogo_melhorado(produtos, fornecedores_dict, filepath, titulo):
@@ -10855,48 +11214,6 @@ def gerar_pdf_catalogo(produtos, fornecedores_dict, filepath, titulo):
 # FUNÇÕES AUXILIARES
 # ============================================================================
 
-def processar_valor_monetario(valor_str):
-    """Processa valores monetários de diferentes formatos"""
-    if not valor_str:
-        return 0.0
-
-    try:
-        valor_str = str(valor_str).strip()
-        if not valor_str or valor_str.lower() in ['nan', 'null', 'none', '']:
-            return 0.0
-
-        # Remover símbolos de moeda
-        valor_limpo = valor_str.replace('R$', '').replace('$', '').strip()
-        valor_limpo = re.sub(r'[^\d,.-]', '', valor_limpo)
-
-        if not valor_limpo:
-            return 0.0
-
-        # Processar formato brasileiro (vírgula como decimal)
-        if ',' in valor_limpo and '.' in valor_limpo:
-            if valor_limpo.rfind(',') > valor_limpo.rfind('.'):
-                partes = valor_limpo.rsplit(',', 1)
-                parte_inteira = partes[0].replace('.', '')
-                parte_decimal = partes[1] if len(partes) > 1 else '0'
-                valor_final = parte_inteira + '.' + parte_decimal
-            else:
-                partes = valor_limpo.rsplit('.', 1)
-                parte_inteira = partes[0].replace(',', '')
-                parte_decimal = partes[1] if len(partes) > 1 else '0'
-                valor_final = parte_inteira + '.' + parte_decimal
-        elif ',' in valor_limpo:
-            valor_final = valor_limpo.replace(',', '.')
-        else:
-            valor_final = valor_limpo
-
-        resultado = float(valor_final)
-        return round(max(0, resultado), 2)
-
-    except Exception as e:
-        current_app.logger.warning(f"Erro ao processar valor '{valor_str}': {e}")
-        return 0.0
-
-
 def detectar_delimitador(sample_text):
     """Detecta automaticamente o delimitador do CSV"""
     delimitadores = [',', ';', '\t', '|']
@@ -10962,7 +11279,10 @@ def excluir_produtos_selecionados():
             .delete(synchronize_session=False)
         ProdutosFornecedores.query.filter(ProdutosFornecedores.id.in_([p.id for p in produtos])) \
             .delete(synchronize_session=False)
+        indice_autocomplete.registrar_remocao(ProdutosFornecedores, current_user.id, [p.id for p in produtos])
 
+        # Exclusão em massa não passa pelo flush: recalcula os contadores na mesma transação
+        recalcular_contadores_catalogo(current_user.id, commit=False)
         db.session.commit()
         return jsonify(
             {"success": True, "deleted": len(produtos), "message": f"{len(produtos)} produto(s) excluído(s)."})
@@ -10972,6 +11292,92 @@ def excluir_produtos_selecionados():
         return jsonify({"success": False, "error": "Erro interno ao excluir selecionados."}), 500
 
 
+# ===== EXCLUSÃO EM MASSA EM SEGUNDO PLANO =====
+
+from sqlalchemy import select as sa_select
+from models import TarefaSegundoPlano
+
+
+def _caminho_foto_produto(foto_url):
+    """Caminho absoluto de uma foto gravada em static/ (None para URLs externas)"""
+    fp = (foto_url or "").lstrip("/")
+    if fp.startswith("static/"):
+        return os.path.join(app.root_path, fp)
+    return None
+
+
+@executor_tarefas.tipo('excluir_produtos')
+def excluir_produtos_em_lotes(tarefa):
+    """
+    Exclui os produtos do catálogo (todos ou de um fornecedor) em faixas de id, com um
+    commit curto por lote; as fotos são removidas na thread de arquivos após cada commit
+    """
+    parametros = tarefa.get_parametros()
+    user_id = tarefa.user_id
+    lote = app.config.get('EXCLUSAO_LOTE', 1000)
+
+    filtros = [ProdutosFornecedores.user_id == user_id]
+    if parametros.get('fornecedor_id'):
+        filtros.append(ProdutosFornecedores.fornecedor_id == parametros['fornecedor_id'])
+
+    try:
+        while True:
+            ids = db.session.execute(
+                sa_select(ProdutosFornecedores.id)
+                .where(*filtros, ProdutosFornecedores.id > tarefa.ultimo_id)
+                .order_by(ProdutosFornecedores.id)
+                .limit(lote)
+            ).scalars().all()
+            if not ids:
+                break
+
+            fotos = db.session.execute(
+                sa_select(ProdutoDetalhes.foto_url)
+                .where(ProdutoDetalhes.produto_id.in_(ids), ProdutoDetalhes.foto_url.isnot(None))
+            ).scalars().all()
+
+            ProdutoDetalhes.query.filter(ProdutoDetalhes.produto_id.in_(ids)).delete(synchronize_session=False)
+            ProdutosFornecedores.query.filter(ProdutosFornecedores.id.in_(ids)).delete(synchronize_session=False)
+            indice_autocomplete.registrar_remocao(ProdutosFornecedores, user_id, ids)
+
+            tarefa.ultimo_id = ids[-1]
+            tarefa.processados += len(ids)
+            tarefa.mensagem = f"{tarefa.processados} produto(s) excluído(s)..."
+            db.session.commit()
+
+            executor_tarefas.remover_arquivos(filter(None, map(_caminho_foto_produto, fotos)))
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        # Exclusão em massa não passa pelo flush: recalcula os contadores ao final (inclusive após falha)
+        recalcular_contadores_catalogo(user_id)
+
+    if parametros.get('fornecedor_id'):
+        tarefa.mensagem = f"{tarefa.processados} produto(s) do fornecedor excluído(s)."
+    else:
+        tarefa.mensagem = f"Todos os {tarefa.processados} produto(s) foram excluídos."
+
+
+def _iniciar_exclusao_produtos(total, fornecedor_id=None):
+    """Agenda a exclusão em lotes e responde 202 com o id da tarefa para acompanhamento"""
+    andamento = executor_tarefas.em_andamento(current_user.id, 'excluir_produtos')
+    if andamento:
+        return jsonify({"success": False, "tarefa_id": andamento.id,
+                        "error": "Já existe uma exclusão de produtos em andamento."}), 409
+
+    tarefa = executor_tarefas.iniciar(
+        current_user.id, 'excluir_produtos', parametros={'fornecedor_id': fornecedor_id}, total=total
+    )
+    return jsonify({
+        "success": True,
+        "tarefa_id": tarefa.id,
+        "status_url": url_for("status_tarefa", tarefa_id=tarefa.id),
+        "total": total,
+        "message": f"Exclusão de {total} produto(s) iniciada."
+    }), 202
+
+
 @app.route("/produtos_fornecedores/excluir_por_fornecedor", methods=["POST"])
 @login_required
 def excluir_produtos_por_fornecedor():
@@ -10986,33 +11392,14 @@ def excluir_produtos_por_fornecedor():
         if not fornecedor:
             return jsonify({"success": False, "error": "Fornecedor não encontrado."}), 404
 
-        produtos = ProdutosFornecedores.query.filter_by(
-            user_id=current_user.id, fornecedor_id=fornecedor_id
-        ).all()
+        total = ProdutosFornecedores.query.filter_by(
+            user_id=current_user.id, fornecedor_id=fornecedor.id
+        ).count()
 
-        if not produtos:
+        if not total:
             return jsonify({"success": False, "error": "Não há produtos para esse fornecedor."}), 404
 
-        # Remover fotos (se houver) e detalhes
-        ids = [p.id for p in produtos]
-        detalhes = ProdutoDetalhes.query.filter(ProdutoDetalhes.produto_id.in_(ids)).all()
-        for d in detalhes:
-            if d.foto_url:
-                try:
-                    fp = d.foto_url.lstrip("/")
-                    if fp.startswith("static/"):
-                        abs_path = os.path.join(current_app.root_path, fp)
-                        if os.path.exists(abs_path):
-                            os.remove(abs_path)
-                except Exception as e:
-                    current_app.logger.warning(f"Falha ao remover foto '{d.foto_url}': {e}")
-
-        ProdutoDetalhes.query.filter(ProdutoDetalhes.produto_id.in_(ids)).delete(synchronize_session=False)
-        ProdutosFornecedores.query.filter(ProdutosFornecedores.id.in_(ids)).delete(synchronize_session=False)
-        db.session.commit()
-
-        return jsonify(
-            {"success": True, "deleted": len(ids), "message": f"{len(ids)} produto(s) do fornecedor excluído(s)."})
+        return _iniciar_exclusao_produtos(total, fornecedor_id=fornecedor.id)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Erro ao excluir por fornecedor: {e}")
@@ -11023,97 +11410,126 @@ def excluir_produtos_por_fornecedor():
 @login_required
 def excluir_produtos_todos():
     try:
-        # Busca todos os produtos do usuário
-        produtos = ProdutosFornecedores.query.filter_by(user_id=current_user.id).all()
-        if not produtos:
+        total = ProdutosFornecedores.query.filter_by(user_id=current_user.id).count()
+        if not total:
             return jsonify({"success": False, "error": "Você não possui produtos cadastrados."}), 404
 
-        ids = [p.id for p in produtos]
-
-        # Remover fotos (se houver) e detalhes
-        detalhes = ProdutoDetalhes.query.filter(ProdutoDetalhes.produto_id.in_(ids)).all()
-        for d in detalhes:
-            if d.foto_url:
-                try:
-                    fp = d.foto_url.lstrip("/")
-                    if fp.startswith("static/"):
-                        abs_path = os.path.join(current_app.root_path, fp)
-                        if os.path.exists(abs_path):
-                            os.remove(abs_path)
-                except Exception as e:
-                    current_app.logger.warning(f"Falha ao remover foto '{d.foto_url}': {e}")
-
-        ProdutoDetalhes.query.filter(ProdutoDetalhes.produto_id.in_(ids)).delete(synchronize_session=False)
-        ProdutosFornecedores.query.filter(ProdutosFornecedores.id.in_(ids)).delete(synchronize_session=False)
-
-        db.session.commit()
-        return jsonify(
-            {"success": True, "deleted": len(ids), "message": f"Todos os {len(ids)} produto(s) foram excluídos."})
+        return _iniciar_exclusao_produtos(total)
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"Erro ao excluir todos: {e}")
         return jsonify({"success": False, "error": "Erro interno ao excluir todos."}), 500
 
 
+@app.route("/tarefas/<int:tarefa_id>", methods=["GET"])
+@login_required
+def status_tarefa(tarefa_id):
+    """Progresso de uma tarefa em segundo plano do usuário"""
+    tarefa = TarefaSegundoPlano.query.filter_by(id=tarefa_id, user_id=current_user.id).first()
+    if not tarefa:
+        return jsonify({"success": False, "error": "Tarefa não encontrada."}), 404
+    return jsonify({"success": True, **tarefa.to_dict()})
+
+
+def _consulta_exportacao_produtos(user_id):
+    """Produtos do usuário com o nome do fornecedor (JOIN), por nome, lidos do banco em partes"""
+    return db.select(
+        ProdutosFornecedores.id, ProdutosFornecedores.nome, ProdutosFornecedores.marca,
+        ProdutosFornecedores.modelo, ProdutosFornecedores.unidade_medida, ProdutosFornecedores.custo,
+        ProdutosFornecedores.fornecedor_id, FornecedorProdutos.nome_empresa,
+        ProdutosFornecedores.tem_foto, ProdutosFornecedores.tem_descricao
+    ).outerjoin(
+        FornecedorProdutos, FornecedorProdutos.id == ProdutosFornecedores.fornecedor_id
+    ).where(
+        ProdutosFornecedores.user_id == user_id
+    ).order_by(ProdutosFornecedores.nome).execution_options(yield_per=LINHAS_POR_LEITURA)
+
+
 @app.route("/produtos_fornecedores/baixar_planilha", methods=["GET"])
 @login_required
 def baixar_planilha_produtos():
     """
     Exporta CSV dos produtos cadastrados (com fornecedor e flags de foto/descrição).
-    Mantém BOM para Excel.
+    Mantém BOM para Excel. O arquivo é gerado em fluxo: o nome do fornecedor vem
+    do JOIN e os produtos são lidos do banco em partes.
     """
     try:
-        # Carrega produtos do usuário
-        produtos = ProdutosFornecedores.query.filter_by(user_id=current_user.id) \
-            .order_by(ProdutosFornecedores.nome).all()
-
-        # Fornecedores (lookup)
-        fornecedores = FornecedorProdutos.query.filter_by(user_id=current_user.id).all()
-        fornecedores_dict = {f.id: f.nome_empresa for f in fornecedores}
+        consulta = _consulta_exportacao_produtos(current_user.id)
+
+        def linhas():
+            for p in db.session.execute(consulta):
+                yield [
+                    p.id,
+                    p.nome or "",
+                    p.marca or "",
+                    p.modelo or "",
+                    p.unidade_medida or "UN",
+                    f"{float(p.custo or 0):.2f}",
+                    p.fornecedor_id or "",
+                    p.nome_empresa or "",
+                    "1" if p.tem_foto else "0",
+                    "1" if p.tem_descricao else "0",
+                ]
 
-        # Monta CSV em memória
-        output = io.StringIO()
-        fieldnames = [
-            "id", "nome", "marca", "modelo", "unidade_medida", "custo",
-            "fornecedor_id", "fornecedor_nome", "tem_foto", "tem_descricao"
-        ]
-        writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=";")
-        writer.writeheader()
+        return resposta_csv(
+            f"produtos_cadastrados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            ["id", "nome", "marca", "modelo", "unidade_medida", "custo",
+             "fornecedor_id", "fornecedor_nome", "tem_foto", "tem_descricao"],
+            linhas()
+        )
+    except Exception as e:
+        current_app.logger.error(f"Erro ao exportar CSV de produtos: {e}")
+        flash("Erro ao exportar CSV de produtos.", "danger")
+        return redirect(url_for("listar_produtos_fornecedores"))
 
-        for p in produtos:
-            det = ProdutoDetalhes.query.filter_by(produto_id=p.id).first()
-            writer.writerow({
-                "id": p.id,
-                "nome": p.nome or "",
-                "marca": p.marca or "",
-                "modelo": p.modelo or "",
-                "unidade_medida": p.unidade_medida or "UN",
-                "custo": f"{float(p.custo or 0):.2f}",
-                "fornecedor_id": p.fornecedor_id or "",
-                "fornecedor_nome": fornecedores_dict.get(p.fornecedor_id, "") if p.fornecedor_id else "",
-                "tem_foto": "1" if (det and det.foto_url) else "0",
-                "tem_descricao": "1" if (det and det.descricao_detalhada) else "0",
-            })
 
-        mem = io.BytesIO()
-        mem.write(output.getvalue().encode("utf-8-sig"))  # BOM
-        mem.seek(0)
+@app.route("/produtos_fornecedores/exportar_xlsx", methods=["GET"])
+@login_required
+def exportar_xlsx_produtos():
+    """
+    Exporta o catálogo de produtos para Excel. A planilha é gravada em modo
+    write_only enquanto os produtos são lidos do banco em partes.
+    """
+    try:
+        def linhas():
+            for p in db.session.execute(_consulta_exportacao_produtos(current_user.id)):
+                yield [
+                    p.id,
+                    p.nome,
+                    p.marca,
+                    p.modelo,
+                    p.unidade_medida or "UN",
+                    p.custo,
+                    p.nome_empresa,
+                    "Sim" if p.tem_foto else "Não",
+                    "Sim" if p.tem_descricao else "Não",
+                ]
 
-        return send_file(
-            mem,
-            as_attachment=True,
-            download_name=f"produtos_cadastrados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mimetype="text/csv"
+        return resposta_xlsx(
+            f"produtos_cadastrados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+            "Produtos",
+            [
+                Coluna("ID", 8, FORMATO_INTEIRO),
+                Coluna("Nome", 45),
+                Coluna("Marca", 20),
+                Coluna("Modelo", 20),
+                Coluna("Unidade", 10),
+                Coluna("Custo", 15, FORMATO_MOEDA),
+                Coluna("Fornecedor", 35),
+                Coluna("Foto", 8),
+                Coluna("Descrição", 10),
+            ],
+            linhas()
         )
     except Exception as e:
-        current_app.logger.error(f"Erro ao exportar CSV de produtos: {e}")
-        flash("Erro ao exportar CSV de produtos.", "danger")
+        current_app.logger.error(f"Erro ao exportar Excel de produtos: {e}", exc_info=True)
+        flash("Erro ao exportar Excel de produtos.", "danger")
         return redirect(url_for("listar_produtos_fornecedores"))
 
 
 from flask import request, jsonify, current_app
 from flask_login import login_required, current_user
-from models import db, FornecedorProdutos, ProdutosFornecedores
+from models import db, FornecedorProdutos, ProdutosFornecedores, desvincular_fornecedor_produtos
 
 
 # ============================================================================
@@ -11189,11 +11605,8 @@ def excluir_fornecedor_produto(fornecedor_id):
 
         if fornecedor:
             # 2. (NOVO) Encontra todos os produtos vinculados e os desvincula (define fornecedor_id como None)
-            # Esta é a forma mais eficiente de fazer isso, com um único comando ao banco de dados.
-            ProdutosFornecedores.query.filter_by(
-                fornecedor_id=fornecedor.id,
-                user_id=current_user.id
-            ).update({"fornecedor_id": None})
+            # em uma única execução, recalculando a chave natural (que inclui o fornecedor) de cada um
+            desvincular_fornecedor_produtos(current_user.id, fornecedor.id)
 
             # 3. Agora que os produtos estão desvinculados, exclui o fornecedor com segurança
             db.session.delete(fornecedor)
@@ -11265,95 +11678,14 @@ def upload_csv_produtos():
         flash('Nome do arquivo vazio.', 'danger')
         return redirect(url_for('listar_produtos_fornecedores'))
 
-    if file:
-        try:
-            # Salvar temporariamente
-            temp_dir = tempfile.mkdtemp()
-            temp_path = os.path.join(temp_dir, secure_filename(file.filename))
-            file.save(temp_path)
-
-            # Detectar encoding e delimitador
-            encoding = detectar_encoding(temp_path)
-            with open(temp_path, 'r', encoding=encoding) as f:
-                sample_text = f.read(2048)
-                delimiter = detectar_delimitador(sample_text)
-
-            # Processar CSV
-            with open(temp_path, mode='r', encoding=encoding) as csv_file:
-                csv_reader = csv.DictReader(csv_file, delimiter=delimiter)
-
-                # Mapeamento de colunas (flexível)
-                header = [h.lower().strip() for h in csv_reader.fieldnames]
-                column_map = {
-                    'nome': [c for c in ['nome', 'produto', 'descrição'] if c in header],
-                    'marca': [c for c in ['marca'] if c in header],
-                    'modelo': [c for c in ['modelo'] if c in header],
-                    'unidade': [c for c in ['unidade', 'unidade_medida', 'un'] if c in header],
-                    'custo': [c for c in ['custo', 'preço', 'valor'] if c in header],
-                    'fornecedor_nome': [c for c in ['fornecedor', 'nome_fornecedor'] if c in header],
-                    'fornecedor_cnpj': [c for c in ['cnpj', 'fornecedor_cnpj'] if c in header]
-                }
-
-                produtos_adicionados = 0
-                for row in csv_reader:
-                    try:
-                        # Extrair dados com base no mapeamento
-                        nome = next((row[c] for c in column_map['nome'] if row.get(c)), None)
-                        custo_str = next((row[c] for c in column_map['custo'] if row.get(c)), None)
-
-                        if not nome or not custo_str:
-                            continue
-
-                        custo = processar_valor_monetario(custo_str)
-                        if custo <= 0:
-                            continue
-
-                        # Fornecedor (opcional)
-                        fornecedor_id = None
-                        fornecedor_cnpj = next((row[c] for c in column_map['fornecedor_cnpj'] if row.get(c)), None)
-                        fornecedor_nome = next((row[c] for c in column_map['fornecedor_nome'] if row.get(c)), None)
-
-                        if fornecedor_cnpj:
-                            fornecedor = FornecedorProdutos.query.filter_by(cnpj=fornecedor_cnpj.strip(),
-                                                                            user_id=current_user.id).first()
-                            if fornecedor:
-                                fornecedor_id = fornecedor.id
-                        elif fornecedor_nome:
-                            fornecedor = FornecedorProdutos.query.filter_by(nome_empresa=fornecedor_nome.strip(),
-                                                                            user_id=current_user.id).first()
-                            if fornecedor:
-                                fornecedor_id = fornecedor.id
-
-                        # Criar produto
-                        novo_produto = ProdutosFornecedores(
-                            nome=nome.strip(),
-                            marca=next((row[c] for c in column_map['marca'] if row.get(c)), None),
-                            modelo=next((row[c] for c in column_map['modelo'] if row.get(c)), None),
-                            unidade_medida=next((row[c] for c in column_map['unidade'] if row.get(c)), 'UN'),
-                            custo=custo,
-                            user_id=current_user.id,
-                            fornecedor_id=fornecedor_id
-                        )
-                        db.session.add(novo_produto)
-                        produtos_adicionados += 1
-
-                    except Exception as inner_e:
-                        current_app.logger.warning(f"Erro ao processar linha do CSV: {inner_e}")
-                        continue
-
-                db.session.commit()
-                flash(f'{produtos_adicionados} produtos adicionados com sucesso via CSV!', 'success')
-
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Erro ao processar o arquivo CSV: {str(e)}', 'danger')
-            current_app.logger.error(f"Erro no upload de CSV: {e}")
-
-        finally:
-            # Limpar pasta temporária
-            if 'temp_dir' in locals() and os.path.exists(temp_dir):
-                import shutil
-                shutil.rmtree(temp_dir)
+    # Mesma importação em segundo plano da rota /importar_produtos_csv (colunas de fornecedor por CNPJ/nome aceitas)
+    try:
+        corpo, status = _agendar_importacao(file)
+        flash(corpo.get('message') or corpo.get('error'), 'info' if status == 202 else 'warning')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao processar o arquivo CSV: {str(e)}', 'danger')
+        current_app.logger.error(f"Erro no upload de CSV: {e}")
 
     return redirect(url_for('listar_produtos_fornecedores'))
 
@@ -11448,6 +11780,129 @@ def validar_cnpj_unico_por_usuario(cnpj, user_id, fornecedor_id=None):
 # ROTA PRINCIPAL COM PAGINAÇÃO
 # ============================================================================
 
+import threading
+from cachetools import TTLCache
+
+# Totais de listagens filtradas por busca/fornecedor (COUNT(*) no máximo uma vez por minuto por filtro)
+_cache_totais_catalogo = TTLCache(maxsize=4096, ttl=60)
+_cache_totais_catalogo_lock = threading.Lock()
+
+_CAMPOS_CONTADOR_POR_STATUS = {
+    '': 'total_produtos',
+    'com-foto': 'produtos_com_foto',
+    'sem-foto': 'produtos_sem_foto',
+    'com-descricao': 'produtos_com_descricao',
+    'sem-descricao': 'produtos_sem_descricao',
+}
+
+
+def _codificar_cursor_catalogo(produto, direcao):
+    """Cursor opaco (base64 de [direção, nome, id]) para a paginação keyset do catálogo"""
+    bruto = json.dumps([direcao, produto.nome, produto.id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decodificar_cursor_catalogo(cursor):
+    """Retorna (direção, nome, id) ou None se o cursor for inválido"""
+    try:
+        preenchido = cursor + '=' * (-len(cursor) % 4)
+        direcao, nome, produto_id = json.loads(base64.urlsafe_b64decode(preenchido).decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    if direcao not in ('n', 'p') or not isinstance(nome, str) or not isinstance(produto_id, int):
+        return None
+    return direcao, nome, produto_id
+
+
+def _paginar_keyset_catalogo(query, per_page, cursor=None, page=1):
+    """
+    Paginação keyset por (nome, id), sem OFFSET.
+    Sem cursor e com page > 1 (salto direto pelos números da paginação HTML) cai no OFFSET.
+    Retorna (itens, next_cursor, prev_cursor, has_next, has_prev)
+    """
+    nome_col, id_col = ProdutosFornecedores.nome, ProdutosFornecedores.id
+    posicao = _decodificar_cursor_catalogo(cursor) if cursor else None
+
+    if posicao and posicao[0] == 'p':
+        _, nome, produto_id = posicao
+        linhas = query.filter(
+            or_(nome_col < nome, and_(nome_col == nome, id_col < produto_id))
+        ).order_by(nome_col.desc(), id_col.desc()).limit(per_page + 1).all()
+        has_prev = len(linhas) > per_page
+        itens = list(reversed(linhas[:per_page]))
+        has_next = True
+    else:
+        query = query.order_by(nome_col, id_col)
+        if posicao:
+            _, nome, produto_id = posicao
+            query = query.filter(or_(nome_col > nome, and_(nome_col == nome, id_col > produto_id)))
+            has_prev = True
+        elif page > 1:
+            query = query.offset((page - 1) * per_page)
+            has_prev = True
+        else:
+            has_prev = False
+        linhas = query.limit(per_page + 1).all()
+        has_next = len(linhas) > per_page
+        itens = linhas[:per_page]
+
+    next_cursor = _codificar_cursor_catalogo(itens[-1], 'n') if itens and has_next else None
+    prev_cursor = _codificar_cursor_catalogo(itens[0], 'p') if itens and has_prev else None
+    return itens, next_cursor, prev_cursor, has_next, has_prev
+
+
+def _total_catalogo(user_id, query, fornecedor_id, busca, status):
+    """
+    Total da listagem sem COUNT(*) por página:
+    sem busca/fornecedor usa os contadores do catálogo; com eles, um COUNT em cache por 60s
+    """
+    campo = _CAMPOS_CONTADOR_POR_STATUS.get(status)
+    if not fornecedor_id and not busca and campo:
+        return obter_contadores_catalogo(user_id).to_dict()[campo]
+
+    chave = (user_id, fornecedor_id, busca, status)
+    with _cache_totais_catalogo_lock:
+        total = _cache_totais_catalogo.get(chave)
+    if total is None:
+        total = query.order_by(None).count()
+        with _cache_totais_catalogo_lock:
+            _cache_totais_catalogo[chave] = total
+    return total
+
+
+def _montar_paginacao_catalogo(page, per_page, total, itens, next_cursor, prev_cursor, has_next, has_prev):
+    """Informações de paginação no formato que o template/JS já usam, mais os cursores"""
+    pages = max(1, math.ceil(total / per_page)) if total else 1
+    showing_start = (page - 1) * per_page + 1 if itens else 0
+    return {
+        'page': page,
+        'pages': pages,
+        'per_page': per_page,
+        'total': total,
+        'has_prev': has_prev,
+        'has_next': has_next,
+        'prev_num': page - 1 if has_prev and page > 1 else None,
+        'next_num': page + 1 if has_next else None,
+        'showing_start': showing_start,
+        'showing_end': showing_start + len(itens) - 1 if itens else 0,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor
+    }
+
+
+def _aplicar_filtro_status_catalogo(query, status):
+    """Aplica os filtros com-foto/sem-foto/com-descricao/sem-descricao usando as flags indexadas"""
+    if status == 'com-foto':
+        return query.filter(ProdutosFornecedores.tem_foto == db.true())
+    if status == 'sem-foto':
+        return query.filter(ProdutosFornecedores.tem_foto == db.false())
+    if status == 'com-descricao':
+        return query.filter(ProdutosFornecedores.tem_descricao == db.true())
+    if status == 'sem-descricao':
+        return query.filter(ProdutosFornecedores.tem_descricao == db.false())
+    return query
+
+
 @app.route("/produtos_fornecedores", methods=["GET"])
 @login_required
 def listar_produtos_fornecedores():
@@ -11460,7 +11915,9 @@ def listar_produtos_fornecedores():
         # Parâmetros de paginação
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        per_page = min(per_page, 100)  # Máximo 100 itens por página
+        per_page = max(1, min(per_page, 100))  # Máximo 100 itens por página
+        page = max(1, page)
+        cursor = request.args.get('cursor', '').strip() or None
 
         # Parâmetros de filtro
         fornecedor_id = request.args.get('fornecedor_id', type=int)
@@ -11475,56 +11932,19 @@ def listar_produtos_fornecedores():
             query = query.filter(ProdutosFornecedores.fornecedor_id == fornecedor_id)
 
         if busca:
-            busca_pattern = f"%{busca}%"
-            query = query.filter(
-                or_(
-                    ProdutosFornecedores.nome.ilike(busca_pattern),
-                    ProdutosFornecedores.marca.ilike(busca_pattern),
-                    ProdutosFornecedores.modelo.ilike(busca_pattern)
-                )
-            )
-
-        # Filtros de status (implementação simplificada)
-        if status == 'com-foto':
-            # Subquery para produtos com foto
-            produtos_com_foto = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.foto_url.isnot(None),
-                ProdutoDetalhes.foto_url != ''
-            ).subquery()
-            query = query.filter(ProdutosFornecedores.id.in_(produtos_com_foto))
-
-        elif status == 'sem-foto':
-            # Produtos sem foto
-            produtos_com_foto = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.foto_url.isnot(None),
-                ProdutoDetalhes.foto_url != ''
-            ).subquery()
-            query = query.filter(~ProdutosFornecedores.id.in_(produtos_com_foto))
-
-        elif status == 'com-descricao':
-            # Produtos com descrição
-            produtos_com_descricao = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.descricao_detalhada.isnot(None),
-                ProdutoDetalhes.descricao_detalhada != ''
-            ).subquery()
-            query = query.filter(ProdutosFornecedores.id.in_(produtos_com_descricao))
-
-        elif status == 'sem-descricao':
-            # Produtos sem descrição
-            produtos_com_descricao = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.descricao_detalhada.isnot(None),
-                ProdutoDetalhes.descricao_detalhada != ''
-            ).subquery()
-            query = query.filter(~ProdutosFornecedores.id.in_(produtos_com_descricao))
-
-        # Ordenação
-        query = query.order_by(ProdutosFornecedores.nome)
-
-        # Paginação
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+            # Busca sem acentos pelo índice de texto (nome, marca e modelo)
+            filtro_busca = indice_busca_catalogo.filtro(current_user.id, busca)
+            if filtro_busca is not None:
+                query = query.filter(filtro_busca)
+
+        # Filtros de status (flags indexadas em produtos_fornecedores)
+        query = _aplicar_filtro_status_catalogo(query, status)
+
+        # Paginação keyset por (nome, id); total vem dos contadores ou do cache de totais
+        total = _total_catalogo(current_user.id, query, fornecedor_id, busca, status)
+        query = query.options(db.joinedload(ProdutosFornecedores.detalhes_rel))
+        itens, next_cursor, prev_cursor, has_next, has_prev = _paginar_keyset_catalogo(
+            query, per_page, cursor=cursor, page=page
         )
 
         # Buscar fornecedores para filtros
@@ -11537,10 +11957,10 @@ def listar_produtos_fornecedores():
 
         # Preparar dados dos produtos
         produtos_formatados = []
-        for produto in pagination.items:
+        for produto in itens:
             try:
-                # Buscar detalhes do produto
-                detalhes = ProdutoDetalhes.query.filter_by(produto_id=produto.id).first()
+                # Detalhes já carregados pelo joinedload
+                detalhes = produto.detalhes_rel
 
                 produto_dict = {
                     "id": produto.id,
@@ -11551,8 +11971,9 @@ def listar_produtos_fornecedores():
                     "custo": float(produto.custo) if produto.custo else 0.0,
                     "fornecedor_id": produto.fornecedor_id,
                     "fornecedor_nome": fornecedores_dict.get(produto.fornecedor_id, "Sem fornecedor"),
-                    "tem_foto": bool(detalhes and detalhes.foto_url),
-                    "tem_descricao": bool(detalhes and detalhes.descricao_detalhada),
+                    "tem_foto": bool(produto.tem_foto),
+                    "tem_descricao": bool(produto.tem_descricao),
+                    "ausente_na_lista": bool(produto.ausente_na_lista),
                     "foto_url": detalhes.foto_url if detalhes else None,
                     "descricao_preview": (
                         detalhes.descricao_detalhada[:100] + "..."
@@ -11567,18 +11988,9 @@ def listar_produtos_fornecedores():
                 continue
 
         # Informações de paginação
-        paginacao_info = {
-            'page': pagination.page,
-            'pages': pagination.pages,
-            'per_page': pagination.per_page,
-            'total': pagination.total,
-            'has_prev': pagination.has_prev,
-            'has_next': pagination.has_next,
-            'prev_num': pagination.prev_num,
-            'next_num': pagination.next_num,
-            'showing_start': (pagination.page - 1) * pagination.per_page + 1 if pagination.total > 0 else 0,
-            'showing_end': min(pagination.page * pagination.per_page, pagination.total)
-        }
+        paginacao_info = _montar_paginacao_catalogo(
+            page, per_page, total, itens, next_cursor, prev_cursor, has_next, has_prev
+        )
 
         # Informações de filtros aplicados
         filtros_info = {
@@ -11587,7 +11999,7 @@ def listar_produtos_fornecedores():
             'status': status
         }
 
-        current_app.logger.info(f"Carregados {len(produtos_formatados)} produtos (página {page}/{pagination.pages})")
+        current_app.logger.info(f"Carregados {len(produtos_formatados)} produtos (página {page}/{paginacao_info['pages']})")
 
         return render_template(
             "produtos_fornecedores_paginacao_completa.html",
@@ -11627,7 +12039,9 @@ def filtrar_produtos_paginado():
         # Parâmetros de paginação
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        per_page = min(per_page, 100)  # Máximo 100 itens por página
+        per_page = max(1, min(per_page, 100))  # Máximo 100 itens por página
+        page = max(1, page)
+        cursor = request.args.get('cursor', '').strip() or None
 
         # Parâmetros de filtro
         fornecedor_id = request.args.get('fornecedor_id', type=int)
@@ -11642,52 +12056,19 @@ def filtrar_produtos_paginado():
             query = query.filter(ProdutosFornecedores.fornecedor_id == fornecedor_id)
 
         if busca:
-            busca_pattern = f"%{busca}%"
-            query = query.filter(
-                or_(
-                    ProdutosFornecedores.nome.ilike(busca_pattern),
-                    ProdutosFornecedores.marca.ilike(busca_pattern),
-                    ProdutosFornecedores.modelo.ilike(busca_pattern)
-                )
-            )
-
-        # Filtros de status
-        if status == 'com-foto':
-            produtos_com_foto = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.foto_url.isnot(None),
-                ProdutoDetalhes.foto_url != ''
-            ).subquery()
-            query = query.filter(ProdutosFornecedores.id.in_(produtos_com_foto))
-
-        elif status == 'sem-foto':
-            produtos_com_foto = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.foto_url.isnot(None),
-                ProdutoDetalhes.foto_url != ''
-            ).subquery()
-            query = query.filter(~ProdutosFornecedores.id.in_(produtos_com_foto))
-
-        elif status == 'com-descricao':
-            produtos_com_descricao = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.descricao_detalhada.isnot(None),
-                ProdutoDetalhes.descricao_detalhada != ''
-            ).subquery()
-            query = query.filter(ProdutosFornecedores.id.in_(produtos_com_descricao))
-
-        elif status == 'sem-descricao':
-            produtos_com_descricao = db.session.query(ProdutoDetalhes.produto_id).filter(
-                ProdutoDetalhes.descricao_detalhada.isnot(None),
-                ProdutoDetalhes.descricao_detalhada != ''
-            ).subquery()
-            query = query.filter(~ProdutosFornecedores.id.in_(produtos_com_descricao))
-
-        # Ordenação
-        query = query.order_by(ProdutosFornecedores.nome)
-
-        # Paginação
-        pagination = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+            # Busca sem acentos pelo índice de texto (nome, marca e modelo)
+            filtro_busca = indice_busca_catalogo.filtro(current_user.id, busca)
+            if filtro_busca is not None:
+                query = query.filter(filtro_busca)
+
+        # Filtros de status (flags indexadas em produtos_fornecedores)
+        query = _aplicar_filtro_status_catalogo(query, status)
+
+        # Paginação keyset por (nome, id); total vem dos contadores ou do cache de totais
+        total = _total_catalogo(current_user.id, query, fornecedor_id, busca, status)
+        query = query.options(db.joinedload(ProdutosFornecedores.detalhes_rel))
+        itens, next_cursor, prev_cursor, has_next, has_prev = _paginar_keyset_catalogo(
+            query, per_page, cursor=cursor, page=page
         )
 
         # Buscar fornecedores para lookup
@@ -11698,9 +12079,9 @@ def filtrar_produtos_paginado():
 
         # Preparar dados dos produtos
         produtos_formatados = []
-        for produto in pagination.items:
+        for produto in itens:
             try:
-                detalhes = ProdutoDetalhes.query.filter_by(produto_id=produto.id).first()
+                detalhes = produto.detalhes_rel
 
                 produto_dict = {
                     "id": produto.id,
@@ -11711,8 +12092,8 @@ def filtrar_produtos_paginado():
                     "custo": float(produto.custo) if produto.custo else 0.0,
                     "fornecedor_id": produto.fornecedor_id,
                     "fornecedor_nome": fornecedores_dict.get(produto.fornecedor_id, "Sem fornecedor"),
-                    "tem_foto": bool(detalhes and detalhes.foto_url),
-                    "tem_descricao": bool(detalhes and detalhes.descricao_detalhada),
+                    "tem_foto": bool(produto.tem_foto),
+                    "tem_descricao": bool(produto.tem_descricao),
                     "foto_url": detalhes.foto_url if detalhes else None
                 }
                 produtos_formatados.append(produto_dict)
@@ -11722,21 +12103,12 @@ def filtrar_produtos_paginado():
                 continue
 
         # Informações de paginação
-        paginacao_info = {
-            'page': pagination.page,
-            'pages': pagination.pages,
-            'per_page': pagination.per_page,
-            'total': pagination.total,
-            'has_prev': pagination.has_prev,
-            'has_next': pagination.has_next,
-            'prev_num': pagination.prev_num,
-            'next_num': pagination.next_num,
-            'showing_start': (pagination.page - 1) * pagination.per_page + 1 if pagination.total > 0 else 0,
-            'showing_end': min(pagination.page * pagination.per_page, pagination.total)
-        }
+        paginacao_info = _montar_paginacao_catalogo(
+            page, per_page, total, itens, next_cursor, prev_cursor, has_next, has_prev
+        )
 
         current_app.logger.info(
-            f"Filtro retornou {len(produtos_formatados)} produtos (página {page}/{pagination.pages})")
+            f"Filtro retornou {len(produtos_formatados)} produtos (página {page}/{paginacao_info['pages']})")
 
         return jsonify({
             'success': True,
@@ -11765,38 +12137,8 @@ def obter_estatisticas_produtos():
     try:
         current_app.logger.info(f"Carregando estatísticas para usuário {current_user.id}")
 
-        # Total de produtos
-        total_produtos = ProdutosFornecedores.query.filter_by(user_id=current_user.id).count()
-
-        # Produtos com foto
-        produtos_com_foto = db.session.query(func.count(ProdutosFornecedores.id)).join(
-            ProdutoDetalhes, ProdutosFornecedores.id == ProdutoDetalhes.produto_id
-        ).filter(
-            ProdutosFornecedores.user_id == current_user.id,
-            ProdutoDetalhes.foto_url.isnot(None),
-            ProdutoDetalhes.foto_url != ''
-        ).scalar() or 0
-
-        # Produtos com descrição
-        produtos_com_descricao = db.session.query(func.count(ProdutosFornecedores.id)).join(
-            ProdutoDetalhes, ProdutosFornecedores.id == ProdutoDetalhes.produto_id
-        ).filter(
-            ProdutosFornecedores.user_id == current_user.id,
-            ProdutoDetalhes.descricao_detalhada.isnot(None),
-            ProdutoDetalhes.descricao_detalhada != ''
-        ).scalar() or 0
-
-        # Total de fornecedores
-        total_fornecedores = FornecedorProdutos.query.filter_by(user_id=current_user.id).count()
-
-        estatisticas = {
-            'total_produtos': total_produtos,
-            'produtos_com_foto': produtos_com_foto,
-            'produtos_com_descricao': produtos_com_descricao,
-            'produtos_sem_foto': total_produtos - produtos_com_foto,
-            'produtos_sem_descricao': total_produtos - produtos_com_descricao,
-            'total_fornecedores': total_fornecedores
-        }
+        # Contadores mantidos na mesma transação das escritas do catálogo
+        estatisticas = obter_contadores_catalogo(current_user.id).to_dict()
 
         current_app.logger.info(f"Estatísticas carregadas: {estatisticas}")
 
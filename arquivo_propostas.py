@@ -0,0 +1,223 @@
+"""
+Arquivo de Propostas Encerradas
+Move propostas com status final ('Adjudica', 'Perdida', 'Anulada', 'Prazo Vencido')
+mais antigas que N dias, com itens, lotes, serviços e despesas, para as tabelas *_arquivo;
+as consultas de relatório leem as duas camadas pelos mesmos métodos
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete as sa_delete, exists, insert as sa_insert, literal, select as sa_select, union_all
+
+from models import (db, TABELAS_ARQUIVO, CalculadoraPasso1, CalculadoraPasso1Servicos, Despesa, Lote,
+                    Produto, ResumoProposta, Servico, ServicoLegislacao)
+
+STATUS_ENCERRADOS = ('Adjudica', 'Perdida', 'Anulada', 'Prazo Vencido')
+
+_TABELAS_ATIVAS = {modelo: modelo.__table__ for modelo in TABELAS_ARQUIVO}
+
+
+def _grupo_produtos(t, ids):
+    """Linhas de uma proposta de produtos, da tabela pai para as dependentes"""
+    lotes = sa_select(t[Lote].c.id).where(t[Lote].c.proposta_id.in_(ids))
+    return [
+        (CalculadoraPasso1, t[CalculadoraPasso1].c.id.in_(ids)),
+        (ResumoProposta, t[ResumoProposta].c.proposta_id.in_(ids)),
+        (Produto, t[Produto].c.calculadora_passo1_id.in_(ids)),
+        (Lote, t[Lote].c.proposta_id.in_(ids)),
+        (Servico, t[Servico].c.lote_id.in_(lotes)),
+        (Despesa, t[Despesa].c.proposta_id.in_(ids)),
+    ]
+
+
+def _grupo_servicos(t, ids):
+    """Linhas de uma proposta de serviços, da tabela pai para as dependentes"""
+    lotes = sa_select(t[Lote].c.id).where(t[Lote].c.proposta_servico_id.in_(ids))
+    return [
+        (CalculadoraPasso1Servicos, t[CalculadoraPasso1Servicos].c.id.in_(ids)),
+        (Lote, t[Lote].c.proposta_servico_id.in_(ids)),
+        (Servico, t[Servico].c.lote_id.in_(lotes)),
+        (Despesa, t[Despesa].c.proposta_servico_id.in_(ids)),
+    ]
+
+
+GRUPOS = {
+    CalculadoraPasso1: _grupo_produtos,
+    CalculadoraPasso1Servicos: _grupo_servicos,
+}
+
+
+class ArquivoPropostas:
+    """
+    Camada fria das propostas encerradas.
+
+    Recursos:
+    - Arquivamento em lotes de propostas: INSERT ... SELECT nas tabelas *_arquivo e
+      DELETE nas tabelas ativas, na mesma transação curta por lote
+    - Propostas de serviços com cálculo de legislação vinculado ficam na camada ativa
+      (servico_legislacao referencia servico.id)
+    - Acesso unificado para relatórios: listagem (UNION ALL das duas camadas), proposta
+      por id e linhas dependentes; cada linha traz `arquivada`
+    """
+
+    def __init__(self, dias=365, lote=200):
+        """
+        Inicializa o arquivo.
+
+        Args:
+            dias: Idade mínima (pela data de criação) de uma proposta encerrada para ser arquivada
+            lote: Propostas movidas por chamada de arquivar()
+        """
+        self.dias = dias
+        self.lote = lote
+
+    # ------------------------------------------------------------------
+    # Arquivamento
+    # ------------------------------------------------------------------
+
+    def candidatas(self, modelo, limite=None):
+        """Propostas encerradas e antigas o bastante, como lista de (id, user_id)"""
+        corte = datetime.utcnow() - timedelta(days=self.dias)
+        consulta = sa_select(modelo.id, modelo.user_id).where(
+            modelo.status.in_(STATUS_ENCERRADOS),
+            modelo.criado_em < corte
+        )
+        if modelo is CalculadoraPasso1Servicos:
+            consulta = consulta.where(~exists().where(
+                ServicoLegislacao.servico_id == Servico.id,
+                Servico.lote_id == Lote.id,
+                Lote.proposta_servico_id == modelo.id
+            ))
+        consulta = consulta.order_by(modelo.id).limit(limite or self.lote)
+        return [tuple(linha) for linha in db.session.execute(consulta)]
+
+    def arquivar(self, modelo, limite=None, antes_de_mover=None):
+        """
+        Move um lote de propostas encerradas (e dependentes) para as tabelas de arquivo.
+
+        Args:
+            modelo: CalculadoraPasso1 ou CalculadoraPasso1Servicos
+            limite: Propostas no lote (padrão: self.lote)
+            antes_de_mover: Função chamada com a lista de (id, user_id) dentro da
+                transação, antes das linhas saírem das tabelas ativas
+
+        Returns:
+            list: (id, user_id) das propostas arquivadas (vazia se não havia nenhuma)
+        """
+        propostas = self.candidatas(modelo, limite)
+        if not propostas:
+            return []
+
+        ids = [proposta_id for proposta_id, _ in propostas]
+        agora = datetime.utcnow()
+        try:
+            if antes_de_mover:
+                antes_de_mover(propostas)
+
+            for modelo_linha, condicao in GRUPOS[modelo](_TABELAS_ATIVAS, ids):
+                tabela = _TABELAS_ATIVAS[modelo_linha]
+                colunas = [coluna.name for coluna in tabela.columns]
+                db.session.execute(
+                    sa_insert(TABELAS_ARQUIVO[modelo_linha]).from_select(
+                        colunas + ['arquivado_em'],
+                        sa_select(*tabela.columns, literal(agora, db.DateTime)).where(condicao)
+                    )
+                )
+
+            # Dependentes primeiro: as chaves estrangeiras apontam para a tabela pai
+            for modelo_linha, condicao in reversed(GRUPOS[modelo](_TABELAS_ATIVAS, ids)):
+                db.session.execute(sa_delete(_TABELAS_ATIVAS[modelo_linha]).where(condicao))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return propostas
+
+    def excluir_arquivada(self, modelo, proposta_id):
+        """Remove definitivamente uma proposta arquivada e suas dependentes (sem commit)"""
+        for modelo_linha, condicao in reversed(GRUPOS[modelo](TABELAS_ARQUIVO, [proposta_id])):
+            db.session.execute(sa_delete(TABELAS_ARQUIVO[modelo_linha]).where(condicao))
+
+    # ------------------------------------------------------------------
+    # Leitura unificada (camada ativa + arquivo)
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _consulta(tabela, colunas, arquivada):
+        return sa_select(*[tabela.c[nome] for nome in colunas], literal(arquivada).label('arquivada'))
+
+    def propostas(self, modelo, user_id, status=None, data_inicio=None, data_fim=None, subusuario_id=None):
+        """
+        Propostas do usuário nas duas camadas, mais recentes primeiro.
+
+        Args:
+            modelo: CalculadoraPasso1 ou CalculadoraPasso1Servicos
+            user_id: Usuário principal dono das propostas
+            status: Filtro opcional de status
+            subusuario_id: Só as propostas criadas por este subusuário (opcional)
+            data_inicio: Criadas a partir desta data (opcional)
+            data_fim: Criadas até esta data (opcional)
+
+        Returns:
+            list: Linhas com as colunas do modelo e `arquivada`
+        """
+        colunas = [coluna.name for coluna in modelo.__table__.columns]
+        consultas = []
+        for tabela, arquivada in ((modelo.__table__, False), (TABELAS_ARQUIVO[modelo], True)):
+            consulta = self._consulta(tabela, colunas, arquivada).where(tabela.c.user_id == user_id)
+            if subusuario_id:
+                consulta = consulta.where(tabela.c.subusuario_id == subusuario_id)
+            if status:
+                consulta = consulta.where(tabela.c.status == status)
+            elif arquivada:
+                # Só propostas encerradas são arquivadas: o índice (user_id, status) é usado direto
+                consulta = consulta.where(tabela.c.status.in_(STATUS_ENCERRADOS))
+            if data_inicio:
+                consulta = consulta.where(tabela.c.criado_em >= data_inicio)
+            if data_fim:
+                consulta = consulta.where(tabela.c.criado_em <= data_fim)
+            consultas.append(consulta)
+
+        unificada = union_all(*consultas).subquery()
+        return db.session.execute(
+            sa_select(unificada).order_by(unificada.c.criado_em.desc(), unificada.c.id.desc())
+        ).all()
+
+    def proposta(self, modelo, user_id, proposta_id):
+        """Proposta do usuário pelo id, procurada na camada ativa e depois no arquivo (ou None)"""
+        colunas = [coluna.name for coluna in modelo.__table__.columns]
+        for tabela, arquivada in ((modelo.__table__, False), (TABELAS_ARQUIVO[modelo], True)):
+            linha = db.session.execute(
+                self._consulta(tabela, colunas, arquivada)
+                .where(tabela.c.id == proposta_id, tabela.c.user_id == user_id)
+            ).first()
+            if linha is not None:
+                return linha
+        return None
+
+    def dependentes(self, modelo, coluna, valor, arquivada):
+        """Linhas de `modelo` (ex.: Produto) com `coluna` == valor, na camada indicada"""
+        tabela = TABELAS_ARQUIVO[modelo] if arquivada else modelo.__table__
+        consulta = sa_select(*tabela.columns).where(tabela.c[coluna] == valor).order_by(tabela.c.id)
+        return db.session.execute(consulta).all()
+
+    def lotes_com_servicos(self, proposta_servico_id, arquivada):
+        """Lotes de uma proposta de serviços com os seus serviços, como lista de (lote, [servicos])"""
+        lotes = self.dependentes(Lote, 'proposta_servico_id', proposta_servico_id, arquivada)
+        if not lotes:
+            return []
+        tabela = TABELAS_ARQUIVO[Servico] if arquivada else Servico.__table__
+        servicos = {}
+        for servico in db.session.execute(
+            sa_select(*tabela.columns).where(tabela.c.lote_id.in_([lote.id for lote in lotes])).order_by(tabela.c.id)
+        ):
+            servicos.setdefault(servico.lote_id, []).append(servico)
+        return [(lote, servicos.get(lote.id, [])) for lote in lotes]
+
+    def contagem_por_status(self, modelo, user_id):
+        """Propostas arquivadas do usuário agrupadas por status, como lista de (status, total)"""
+        tabela = TABELAS_ARQUIVO[modelo]
+        consulta = sa_select(tabela.c.status, db.func.count()).where(
+            tabela.c.user_id == user_id
+        ).group_by(tabela.c.status)
+        return [tuple(linha) for linha in db.session.execute(consulta)]
@@ -0,0 +1,68 @@
+"""
+Configuração do Engine do Banco de Dados
+Opções de pool por ambiente (MySQL em produção, SQLite local) e PRAGMAs
+aplicados a cada conexão SQLite (WAL, synchronous, mmap e busy_timeout)
+"""
+
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def _int_env(nome, padrao):
+    return int(os.getenv(nome, str(padrao)))
+
+
+def opcoes_engine(uri):
+    """
+    Monta SQLALCHEMY_ENGINE_OPTIONS para a URI informada.
+
+    Args:
+        uri: URI do banco (SQLALCHEMY_DATABASE_URI)
+
+    Returns:
+        dict: Opções repassadas ao create_engine pelo Flask-SQLAlchemy
+    """
+    if uri.startswith('sqlite'):
+        # O pool padrão do SQLite já é adequado; o tempo de espera por lock vai no PRAGMA busy_timeout
+        return {
+            'pool_pre_ping': True,
+            'connect_args': {'timeout': _int_env('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000},
+        }
+
+    return {
+        'pool_size': _int_env('DB_POOL_SIZE', 10),
+        'max_overflow': _int_env('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _int_env('DB_POOL_TIMEOUT', 30),
+        # Abaixo do wait_timeout do MySQL/RDS para não reutilizar conexões derrubadas pelo servidor
+        'pool_recycle': _int_env('DB_POOL_RECYCLE', 280),
+        'pool_pre_ping': True,
+    }
+
+
+def aplicar_pragmas_sqlite(conexao):
+    """
+    Aplica os PRAGMAs de desempenho em uma conexão sqlite3.
+
+    - journal_mode=WAL: leitores não bloqueiam o escritor e vice-versa
+    - synchronous=NORMAL: seguro com WAL, evita fsync a cada commit
+    - mmap_size: leitura das páginas por memória mapeada
+    - busy_timeout: espera pelo lock de escrita em vez de falhar com "database is locked"
+    """
+    cursor = conexao.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={_int_env('SQLITE_MMAP_SIZE', 268435456)}")
+        cursor.execute(f"PRAGMA busy_timeout={_int_env('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def _configurar_conexao_sqlite(conexao_dbapi, registro_conexao):
+    """Aplica os PRAGMAs em toda conexão SQLite aberta por qualquer engine da aplicação"""
+    if isinstance(conexao_dbapi, sqlite3.Connection):
+        aplicar_pragmas_sqlite(conexao_dbapi)
@@ -0,0 +1,127 @@
+"""
+Benchmark de Concorrência - SQLite com e sem os PRAGMAs do banco_dados.py
+Um escritor grava lotes de linhas continuamente enquanto vários leitores consultam
+a mesma tabela; compara o journal padrão (DELETE) com WAL + synchronous=NORMAL
+
+Uso:
+python3 benchmark_sqlite_wal.py [--segundos 5] [--leitores 4] [--lote 500]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from banco_dados import aplicar_pragmas_sqlite
+
+
+def _conectar(arquivo, wal):
+    conexao = sqlite3.connect(arquivo, timeout=5, check_same_thread=False)
+    if wal:
+        aplicar_pragmas_sqlite(conexao)
+    else:
+        conexao.execute("PRAGMA journal_mode=DELETE")
+        conexao.execute("PRAGMA synchronous=FULL")
+    return conexao
+
+
+def _preparar(arquivo, wal):
+    conexao = _conectar(arquivo, wal)
+    conexao.execute("CREATE TABLE itens (id INTEGER PRIMARY KEY, grupo INTEGER, nome TEXT, valor REAL)")
+    conexao.execute("CREATE INDEX ix_itens_grupo ON itens (grupo)")
+    conexao.executemany(
+        "INSERT INTO itens (grupo, nome, valor) VALUES (?, ?, ?)",
+        [(i % 100, f'produto {i}', i * 1.5) for i in range(50000)]
+    )
+    conexao.commit()
+    conexao.close()
+
+
+def executar_cenario(wal, segundos, leitores, lote):
+    """Roda um cenário e retorna as métricas de leitura e escrita"""
+    pasta = tempfile.mkdtemp(prefix='bench_sqlite_')
+    arquivo = os.path.join(pasta, 'bench.db')
+    _preparar(arquivo, wal)
+
+    fim = time.time() + segundos
+    latencias, erros, transacoes = [], [0], [0]
+    lock = threading.Lock()
+
+    def escritor():
+        conexao = _conectar(arquivo, wal)
+        contador = 0
+        while time.time() < fim:
+            try:
+                conexao.executemany(
+                    "INSERT INTO itens (grupo, nome, valor) VALUES (?, ?, ?)",
+                    [((contador + i) % 100, f'novo {contador + i}', 1.0) for i in range(lote)]
+                )
+                conexao.commit()
+                contador += lote
+                transacoes[0] += 1
+            except sqlite3.OperationalError:
+                conexao.rollback()
+                with lock:
+                    erros[0] += 1
+        conexao.close()
+
+    def leitor(numero):
+        conexao = _conectar(arquivo, wal)
+        grupo = numero
+        while time.time() < fim:
+            inicio = time.perf_counter()
+            try:
+                conexao.execute("SELECT COUNT(*), SUM(valor) FROM itens WHERE grupo = ?", (grupo,)).fetchone()
+                with lock:
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+            except sqlite3.OperationalError:
+                with lock:
+                    erros[0] += 1
+            grupo = (grupo + 7) % 100
+        conexao.close()
+
+    threads = [threading.Thread(target=escritor)]
+    threads += [threading.Thread(target=leitor, args=(i,)) for i in range(leitores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    shutil.rmtree(pasta, ignore_errors=True)
+
+    latencias.sort()
+    return {
+        'leituras': len(latencias),
+        'p50_ms': statistics.median(latencias) if latencias else 0,
+        'p95_ms': latencias[int(len(latencias) * 0.95) - 1] if latencias else 0,
+        'max_ms': latencias[-1] if latencias else 0,
+        'transacoes_escrita': transacoes[0],
+        'erros_lock': erros[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de concorrência do SQLite (journal padrão x WAL)')
+    parser.add_argument('--segundos', type=float, default=5)
+    parser.add_argument('--leitores', type=int, default=4)
+    parser.add_argument('--lote', type=int, default=500, help='linhas por transação de escrita')
+    args = parser.parse_args()
+
+    print("="*72)
+    print("BENCHMARK DE CONCORRÊNCIA - SQLite")
+    print(f"{args.leitores} leitor(es) + 1 escritor, {args.segundos}s por cenário, lotes de {args.lote} linhas")
+    print("="*72)
+    print(f"{'cenário':<22}{'leituras':>10}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>10}{'commits':>9}{'locks':>7}")
+
+    for nome, wal in (('journal DELETE', False), ('WAL + NORMAL', True)):
+        r = executar_cenario(wal, args.segundos, args.leitores, args.lote)
+        print(f"{nome:<22}{r['leituras']:>10}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['max_ms']:>10.2f}"
+              f"{r['transacoes_escrita']:>9}{r['erros_lock']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,554 @@
+"""
+Busca de Produtos sem Acentos
+Índice de texto sobre a coluna busca_normalizada (FTS5 no SQLite, FULLTEXT no MySQL),
+com fallback para LIKE na coluna normalizada quando o índice ainda não foi instalado,
+e índice de autocomplete em memória por usuário
+"""
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import and_, event, func, text, column, Integer, select as sa_select
+from sqlalchemy.orm import Session
+
+from models import normalizar_busca
+
+
+# Palavras menores que innodb_ft_min_token_size não entram no índice FULLTEXT
+TAMANHO_MINIMO_FULLTEXT = 3
+
+# Chave em session.info com as alterações de produtos pendentes para o autocomplete
+CHAVE_AUTOCOMPLETE = 'autocomplete_alteracoes'
+
+# Entradas do vetor de palavras percorridas no máximo por busca de autocomplete
+LIMITE_VARREDURA = 10000
+
+# Segundos até verificar de novo um banco sem índice de texto (a migração pode criá-lo com os workers no ar)
+REVERIFICAR_LIKE_SEGUNDOS = 60
+
+# Candidatos lidos do FTS5 para ranquear em Python (mantém o autocomplete rápido com prefixos curtos)
+LIMITE_CANDIDATOS_FTS = 500
+
+
+def prioridade_prefixo(texto, prefixo):
+    """0 = texto começa pelo termo como palavra inteira, 1 = começa pelo termo, 2 = demais"""
+    texto = texto or ''
+    if texto == prefixo or texto.startswith(prefixo + ' '):
+        return 0
+    return 1 if texto.startswith(prefixo) else 2
+
+
+def chave_ranking(texto, palavras):
+    """
+    Chave de ordenação comum às buscas: começo pelo termo, mais palavras inteiras
+    casadas e textos mais curtos primeiro
+    """
+    texto = texto or ''
+    tokens = set(texto.split())
+    return (
+        prioridade_prefixo(texto, ' '.join(palavras)),
+        -sum(1 for p in palavras if p in tokens),
+        len(texto),
+    )
+
+
+class IndiceBusca:
+    """
+    API única de busca textual para um modelo com busca_normalizada e user_id.
+
+    Recursos:
+    - Termo normalizado com a mesma regra da coluna (sem acento, minúsculo)
+    - Cada palavra do termo casa por prefixo ("agu" encontra "Água Mineral")
+    - Ranking por relevância (palavras inteiras e tamanho no SQLite,
+      MATCH ... AGAINST no MySQL), priorizando registros cujo texto começa pelo termo
+    - Filtro reutilizável nas listagens paginadas do catálogo
+    """
+
+    def __init__(self, db, modelo):
+        """
+        Inicializa o índice.
+
+        Args:
+            db: Instância do Flask-SQLAlchemy
+            modelo: Modelo com as colunas id, user_id e busca_normalizada
+        """
+        self.db = db
+        self.modelo = modelo
+        self.tabela = modelo.__tablename__
+        self.tabela_fts = f'{self.tabela}_fts'
+        self.indice_fulltext = f'ft_{self.tabela}_busca'
+        self._modos = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Instalação / detecção do índice
+    # ------------------------------------------------------------------
+
+    def _dialeto(self):
+        return self.db.engine.dialect.name
+
+    def modo(self):
+        """
+        Retorna 'fts5', 'fulltext' ou 'like' conforme o índice disponível no banco.
+        O índice encontrado fica em cache; 'like' é verificado de novo a cada
+        REVERIFICAR_LIKE_SEGUNDOS, para os workers passarem a usar o índice criado depois
+        """
+        chave = str(self.db.engine.url)
+        with self._lock:
+            if chave in self._modos:
+                modo, verificado_em = self._modos[chave]
+                if modo != 'like' or time.monotonic() - verificado_em < REVERIFICAR_LIKE_SEGUNDOS:
+                    return modo
+
+        dialeto = self._dialeto()
+        modo = 'like'
+        with self.db.engine.connect() as conexao:
+            if dialeto == 'sqlite':
+                existe = conexao.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                    {'nome': self.tabela_fts}
+                ).first()
+                if existe:
+                    modo = 'fts5'
+            elif dialeto == 'mysql':
+                existe = conexao.execute(
+                    text("SELECT 1 FROM information_schema.statistics "
+                         "WHERE table_schema = DATABASE() AND table_name = :tabela AND index_name = :indice"),
+                    {'tabela': self.tabela, 'indice': self.indice_fulltext}
+                ).first()
+                if existe:
+                    modo = 'fulltext'
+
+        with self._lock:
+            self._modos[chave] = (modo, time.monotonic())
+        return modo
+
+    def instalar(self):
+        """
+        Cria o índice de texto (idempotente).
+        SQLite: tabela FTS5 de conteúdo externo + triggers de sincronização.
+        MySQL: índice FULLTEXT em busca_normalizada.
+        """
+        dialeto = self._dialeto()
+        with self.db.engine.begin() as conexao:
+            if dialeto == 'sqlite':
+                existia = conexao.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+                    {'nome': self.tabela_fts}
+                ).first()
+                for comando in self._ddl_fts5():
+                    conexao.execute(text(comando))
+                if not existia:
+                    conexao.execute(text(
+                        f"INSERT INTO {self.tabela_fts}({self.tabela_fts}) VALUES ('rebuild')"
+                    ))
+            elif dialeto == 'mysql':
+                try:
+                    conexao.execute(text(
+                        f"ALTER TABLE {self.tabela} ADD FULLTEXT INDEX {self.indice_fulltext} (busca_normalizada)"
+                    ))
+                except Exception as e:
+                    if 'duplicate' not in str(e).lower():
+                        raise
+        with self._lock:
+            self._modos.clear()
+
+    def _ddl_fts5(self):
+        t, f = self.tabela, self.tabela_fts
+        colunas = 'user_id, busca_normalizada'
+        return [
+            # user_id entra como token para o MATCH já filtrar o dono dentro do índice
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {f} USING fts5("
+            f"user_id, busca_normalizada, content='{t}', content_rowid='id', prefix='2 3')",
+            f"CREATE TRIGGER IF NOT EXISTS {f}_ai AFTER INSERT ON {t} BEGIN "
+            f"INSERT INTO {f}(rowid, {colunas}) VALUES (new.id, new.user_id, new.busca_normalizada); END",
+            f"CREATE TRIGGER IF NOT EXISTS {f}_ad AFTER DELETE ON {t} BEGIN "
+            f"INSERT INTO {f}({f}, rowid, {colunas}) VALUES ('delete', old.id, old.user_id, old.busca_normalizada); END",
+            f"CREATE TRIGGER IF NOT EXISTS {f}_au AFTER UPDATE OF {colunas} ON {t} BEGIN "
+            f"INSERT INTO {f}({f}, rowid, {colunas}) VALUES ('delete', old.id, old.user_id, old.busca_normalizada); "
+            f"INSERT INTO {f}(rowid, {colunas}) VALUES (new.id, new.user_id, new.busca_normalizada); END",
+        ]
+
+    # ------------------------------------------------------------------
+    # Montagem das condições
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def palavras(termo):
+        """Palavras normalizadas do termo digitado"""
+        return normalizar_busca(termo).split()
+
+    def _match_fts5(self, user_id, palavras):
+        termos = ' AND '.join(f'busca_normalizada : "{p}"*' for p in palavras)
+        return f'user_id : "{int(user_id)}" AND {termos}'
+
+    def _condicao_like(self, palavras):
+        coluna = self.modelo.busca_normalizada
+        return and_(*[coluna.like(f'%{p}%') for p in palavras])
+
+    def _condicao_fulltext(self, palavras):
+        longas = [p for p in palavras if len(p) >= TAMANHO_MINIMO_FULLTEXT]
+        curtas = [p for p in palavras if len(p) < TAMANHO_MINIMO_FULLTEXT]
+        condicoes = []
+        score = None
+        if longas:
+            score = text(
+                f"MATCH ({self.tabela}.busca_normalizada) AGAINST (:termo_fulltext IN BOOLEAN MODE)"
+            ).bindparams(termo_fulltext=' '.join(f'+{p}*' for p in longas))
+            condicoes.append(score)
+        if curtas:
+            condicoes.append(self._condicao_like(curtas))
+        return and_(*condicoes), score
+
+    def filtro(self, user_id, termo):
+        """
+        Condição para query.filter() nas listagens (None se o termo não tem palavras).
+        A query já deve estar filtrada por user_id.
+        """
+        palavras = self.palavras(termo)
+        if not palavras:
+            return None
+
+        modo = self.modo()
+        if modo == 'fts5':
+            ids = text(
+                f"SELECT rowid FROM {self.tabela_fts} WHERE {self.tabela_fts} MATCH :termo_fts"
+            ).bindparams(termo_fts=self._match_fts5(user_id, palavras)).columns(column('rowid', Integer))
+            return self.modelo.id.in_(ids)
+        if modo == 'fulltext':
+            return self._condicao_fulltext(palavras)[0]
+        return self._condicao_like(palavras)
+
+    # ------------------------------------------------------------------
+    # Busca ranqueada
+    # ------------------------------------------------------------------
+
+    def buscar_ids(self, user_id, termo, limite=10):
+        """Retorna os ids mais relevantes do usuário para o termo, em ordem de ranking"""
+        palavras = self.palavras(termo)
+        if not palavras:
+            return []
+
+        prefixo = ' '.join(palavras)
+        # Busca alguns candidatos a mais para reordenar quem começa pelo termo
+        candidatos = limite * 4
+        modo = self.modo()
+        sessao = self.db.session
+
+        if modo == 'fts5':
+            # ORDER BY rowid DESC antes do LIMIT: candidatos determinísticos (os cadastros mais
+            # recentes) no mesmo custo da leitura do índice. ORDER BY rank pontuaria com bm25
+            # todos os resultados do prefixo; os candidatos são ranqueados abaixo
+            linhas = sessao.execute(
+                text(f"SELECT rowid, busca_normalizada FROM {self.tabela_fts} "
+                     f"WHERE {self.tabela_fts} MATCH :termo_fts ORDER BY rowid DESC LIMIT :limite"),
+                {'termo_fts': self._match_fts5(user_id, palavras), 'limite': LIMITE_CANDIDATOS_FTS}
+            ).all()
+            linhas = sorted(linhas, key=lambda linha: chave_ranking(linha[1], palavras))
+        else:
+            coluna = self.modelo.busca_normalizada
+            consulta = sa_select(self.modelo.id, coluna).where(self.modelo.user_id == user_id)
+            if modo == 'fulltext':
+                condicao, score = self._condicao_fulltext(palavras)
+                consulta = consulta.where(condicao)
+                if score is not None:
+                    consulta = consulta.order_by(score.desc())
+            else:
+                consulta = consulta.where(self._condicao_like(palavras))
+            consulta = consulta.order_by(coluna.like(f'{prefixo}%').desc(), func.length(coluna), self.modelo.id)
+            linhas = sessao.execute(consulta.limit(candidatos)).all()
+
+        # Ordenação estável: quem começa pelo termo sobe, mantendo a relevância do banco entre iguais
+        linhas = sorted(linhas, key=lambda linha: prioridade_prefixo(linha[1], prefixo))
+        return [linha[0] for linha in linhas[:limite]]
+
+    def buscar(self, user_id, termo, limite=10):
+        """Retorna os objetos do modelo em ordem de ranking"""
+        ids = self.buscar_ids(user_id, termo, limite)
+        if not ids:
+            return []
+        objetos = {obj.id: obj for obj in self.modelo.query.filter(self.modelo.id.in_(ids)).all()}
+        return [objetos[i] for i in ids if i in objetos]
+
+
+class _AutocompleteUsuario:
+    """Índice de um usuário: entradas (texto, linha) + vetores ordenados de (palavra, chave) e (texto, chave)"""
+
+    def __init__(self):
+        self.entradas = {}
+        self.palavras = []
+        self.textos = []
+        self.criado_em = time.time()
+
+    def adicionar(self, chave, texto, linha):
+        self.remover(chave)
+        self.entradas[chave] = (texto, linha)
+        insort(self.textos, (texto, chave))
+        for palavra in set(texto.split()):
+            insort(self.palavras, (palavra, chave))
+
+    def remover(self, chave):
+        entrada = self.entradas.pop(chave, None)
+        if entrada is None:
+            return
+        texto = entrada[0]
+        self._retirar(self.textos, (texto, chave))
+        for palavra in set(texto.split()):
+            self._retirar(self.palavras, (palavra, chave))
+
+    @staticmethod
+    def _retirar(vetor, item):
+        posicao = bisect_left(vetor, item)
+        if posicao < len(vetor) and vetor[posicao] == item:
+            del vetor[posicao]
+
+    @staticmethod
+    def _com_prefixo(vetor, prefixo):
+        posicao = bisect_left(vetor, (prefixo,))
+        fim = min(len(vetor), posicao + LIMITE_VARREDURA)
+        while posicao < fim and vetor[posicao][0].startswith(prefixo):
+            yield vetor[posicao][1]
+            posicao += 1
+
+    def candidatos(self, palavras, limite):
+        """Chaves cujo texto começa pelo termo, completadas pelas que têm todas as palavras"""
+        chaves = set()
+        for chave in self._com_prefixo(self.textos, ' '.join(palavras)):
+            chaves.add(chave)
+            if len(chaves) >= limite:
+                return chaves
+
+        # A palavra mais longa é a mais seletiva; as demais são conferidas no texto
+        outras = list(palavras)
+        principal = max(outras, key=len)
+        outras.remove(principal)
+        for chave in self._com_prefixo(self.palavras, principal):
+            if chave in chaves:
+                continue
+            texto = ' ' + self.entradas[chave][0]
+            if all(' ' + p in texto for p in outras):
+                chaves.add(chave)
+                if len(chaves) >= limite:
+                    break
+        return chaves
+
+
+class IndiceAutocomplete:
+    """
+    Índice de autocomplete em memória por usuário, sobre o texto normalizado
+    de várias tabelas de produtos.
+
+    Recursos:
+    - Montado sob demanda (em segundo plano) na primeira busca do usuário
+    - Atualizado a cada commit que grava produtos (eventos de sessão)
+    - LRU entre usuários, com TTL para reconstruir índices de outros workers
+    - Ranking único entre as fontes (chave_ranking), desempate pela ordem das fontes
+    """
+
+    # Candidatos avaliados por busca antes do ranking
+    LIMITE_CANDIDATOS = 400
+
+    def __init__(self, db, fontes, max_usuarios=64, ttl_segundos=900):
+        """
+        Inicializa o índice.
+
+        Args:
+            db: Instância do Flask-SQLAlchemy
+            fontes: Lista de (Modelo, origem, montar_dados) em ordem de preferência;
+                    montar_dados recebe a linha (id, custo e CAMPOS_BUSCA) e retorna
+                    o dicionário da resposta
+            max_usuarios: Quantidade máxima de usuários mantidos em memória
+            ttl_segundos: Idade máxima de um índice antes de ser reconstruído
+        """
+        self.db = db
+        self.fontes = fontes
+        self.max_usuarios = max_usuarios
+        self.ttl_segundos = ttl_segundos
+        self._usuarios = OrderedDict()
+        self._lock = threading.Lock()
+        self._ordem_fonte = {modelo: posicao for posicao, (modelo, _, _) in enumerate(fontes)}
+        # Usuários com montagem em andamento -> alterações recebidas enquanto isso
+        self._montando = {}
+
+    # ------------------------------------------------------------------
+    # Montagem
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _texto(linha, modelo):
+        texto = linha.busca_normalizada
+        if texto is None:
+            texto = normalizar_busca(*(getattr(linha, campo) for campo in modelo.CAMPOS_BUSCA))
+        return texto
+
+    @staticmethod
+    def _colunas(modelo):
+        return ['id', 'custo', 'busca_normalizada'] + list(modelo.CAMPOS_BUSCA)
+
+    def _montar(self, user_id):
+        indice = _AutocompleteUsuario()
+        entradas, textos, palavras = indice.entradas, [], []
+        # Core direto na conexão: as linhas ficam guardadas como estão e o dicionário
+        # da resposta só é montado para os itens devolvidos
+        conexao = self.db.session.connection()
+        for modelo, _, _ in self.fontes:
+            fonte = self._ordem_fonte[modelo]
+            colunas = [getattr(modelo, nome) for nome in self._colunas(modelo)]
+            consulta = sa_select(*colunas).where(modelo.user_id == user_id)
+            for linha in conexao.execute(consulta.execution_options(yield_per=5000)):
+                chave, texto = (fonte, linha.id), self._texto(linha, modelo)
+                entradas[chave] = (texto, linha)
+                textos.append((texto, chave))
+                palavras.extend((palavra, chave) for palavra in set(texto.split()))
+        textos.sort()
+        palavras.sort()
+        indice.textos, indice.palavras = textos, palavras
+        return indice
+
+    def _indice(self, user_id):
+        """
+        Retorna o índice do usuário (None se ainda não existe). Índices ausentes
+        ou vencidos são montados em segundo plano; o vencido continua servindo até lá.
+        """
+        agora = time.time()
+        with self._lock:
+            indice = self._usuarios.get(user_id)
+            if indice is not None:
+                self._usuarios.move_to_end(user_id)
+            vencido = indice is None or agora - indice.criado_em >= self.ttl_segundos
+            iniciar = vencido and user_id not in self._montando
+            if iniciar:
+                self._montando[user_id] = []
+
+        if iniciar:
+            threading.Thread(
+                target=self._montar_em_segundo_plano,
+                args=(current_app._get_current_object(), user_id),
+                daemon=True
+            ).start()
+        return indice
+
+    def _montar_em_segundo_plano(self, app, user_id):
+        with app.app_context():
+            try:
+                indice = self._montar(user_id)
+            except Exception as e:
+                app.logger.error(f"❌ Erro ao montar autocomplete do usuário {user_id}: {e}")
+                with self._lock:
+                    self._montando.pop(user_id, None)
+                return
+            finally:
+                self.db.session.remove()
+
+        with self._lock:
+            # Commits ocorridos durante a montagem (reaplicar é idempotente)
+            for chave, texto, linha in self._montando.pop(user_id, []):
+                if texto is None:
+                    indice.remover(chave)
+                else:
+                    indice.adicionar(chave, texto, linha)
+            self._usuarios[user_id] = indice
+            self._usuarios.move_to_end(user_id)
+            while len(self._usuarios) > self.max_usuarios:
+                self._usuarios.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def buscar(self, user_id, termo, limite=10):
+        """
+        Retorna os dicionários de resposta mais relevantes do usuário para o termo,
+        ou None enquanto o índice do usuário está sendo montado
+        """
+        palavras = normalizar_busca(termo).split()
+        if not palavras:
+            return []
+
+        indice = self._indice(user_id)
+        if indice is None:
+            return None
+        with self._lock:
+            chaves = indice.candidatos(palavras, self.LIMITE_CANDIDATOS)
+            encontrados = [(chave, indice.entradas[chave]) for chave in chaves]
+
+        encontrados.sort(key=lambda item: (chave_ranking(item[1][0], palavras), item[0][0], -item[0][1]))
+        resultado, vistos = [], set()
+        for (fonte, _), (_, linha) in encontrados:
+            _, origem, montar_dados = self.fontes[fonte]
+            dados = dict(montar_dados(linha), id=linha.id, origem=origem)
+            # Itens repetidos em várias propostas aparecem uma vez só
+            assinatura = (fonte, dados.get('nome'), dados.get('marca_modelo'))
+            if assinatura in vistos:
+                continue
+            vistos.add(assinatura)
+            resultado.append(dados)
+            if len(resultado) >= limite:
+                break
+        return resultado
+
+    def aplicar(self, alteracoes):
+        """
+        Aplica alterações nos índices já carregados.
+
+        Args:
+            alteracoes: Lista de (user_id, chave, texto, linha); texto None = remoção
+        """
+        with self._lock:
+            for user_id, chave, texto, linha in alteracoes:
+                if user_id in self._montando:
+                    self._montando[user_id].append((chave, texto, linha))
+                indice = self._usuarios.get(user_id)
+                if indice is None:
+                    continue
+                if texto is None:
+                    indice.remover(chave)
+                else:
+                    indice.adicionar(chave, texto, linha)
+
+    def descartar(self, *user_ids):
+        """Descarta os índices dos usuários (remontados na próxima busca)"""
+        with self._lock:
+            for user_id in user_ids:
+                self._usuarios.pop(user_id, None)
+
+    def registrar_remocao(self, modelo, user_id, ids):
+        """
+        Agenda a remoção de ids excluídos em massa (query.delete não passa pelo flush);
+        aplicada no commit da sessão atual
+        """
+        fonte = self._ordem_fonte[modelo]
+        pendentes = self.db.session.info.setdefault(CHAVE_AUTOCOMPLETE, [])
+        pendentes.extend((user_id, (fonte, id_), None, None) for id_ in ids)
+
+    def registrar_eventos(self):
+        """Instala os eventos de sessão que mantêm os índices carregados atualizados"""
+
+        @event.listens_for(Session, 'after_flush')
+        def _coletar_produtos(session, flush_context):
+            alteracoes = session.info.setdefault(CHAVE_AUTOCOMPLETE, [])
+            for modelo, _, _ in self.fontes:
+                fonte = self._ordem_fonte[modelo]
+                for obj in list(session.new) + list(session.dirty):
+                    if type(obj) is modelo:
+                        # Cópia dos valores gravados: o objeto pode mudar depois do commit
+                        linha = SimpleNamespace(**{nome: getattr(obj, nome) for nome in self._colunas(modelo)})
+                        alteracoes.append((obj.user_id, (fonte, obj.id), self._texto(linha, modelo), linha))
+                for obj in session.deleted:
+                    if type(obj) is modelo:
+                        alteracoes.append((obj.user_id, (fonte, obj.id), None, None))
+
+        @event.listens_for(Session, 'after_commit')
+        def _aplicar_produtos(session):
+            alteracoes = session.info.pop(CHAVE_AUTOCOMPLETE, None)
+            if alteracoes:
+                self.aplicar(alteracoes)
+
+        @event.listens_for(Session, 'after_rollback')
+        def _descartar_produtos(session):
+            session.info.pop(CHAVE_AUTOCOMPLETE, None)
+
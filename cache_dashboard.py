@@ -0,0 +1,212 @@
+"""
+Cache de KPIs do Dashboard
+Snapshot por usuário em LRU na memória do processo, com backing opcional em SQLite
+compartilhado entre workers, invalidado a cada commit que altera propostas,
+produtos, fornecedores ou chamados do usuário
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+class CacheDashboard:
+    """
+    Cache de snapshots de KPIs do dashboard por usuário.
+
+    Recursos:
+    - LRU em memória com limite de entradas e TTL
+    - Número de geração por usuário: snapshots calculados antes de uma
+      invalidação nunca são servidos depois dela
+    - Backing opcional em SQLite (arquivo local) para compartilhar
+      snapshots e gerações entre os workers do mesmo servidor
+    """
+
+    def __init__(self, max_entradas=1024, ttl_segundos=600, arquivo_sqlite=None):
+        """
+        Inicializa o cache.
+
+        Args:
+            max_entradas: Quantidade máxima de usuários mantidos em memória
+            ttl_segundos: Validade de cada snapshot
+            arquivo_sqlite: Caminho do arquivo SQLite compartilhado (None = só memória)
+        """
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.arquivo_sqlite = arquivo_sqlite
+        self._entradas = OrderedDict()
+        self._geracoes = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        if self.arquivo_sqlite:
+            self._criar_tabelas()
+
+    # ------------------------------------------------------------------
+    # SQLite compartilhado
+    # ------------------------------------------------------------------
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.arquivo_sqlite, timeout=5, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    def _criar_tabelas(self):
+        pasta = os.path.dirname(self.arquivo_sqlite)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        conexao = self._conexao()
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS dashboard_geracao ("
+            "user_id INTEGER PRIMARY KEY, geracao INTEGER NOT NULL)"
+        )
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS dashboard_snapshot ("
+            "user_id INTEGER PRIMARY KEY, geracao INTEGER NOT NULL, "
+            "expira_em REAL NOT NULL, dados TEXT NOT NULL)"
+        )
+
+    def _geracao_atual(self, user_id):
+        if not self.arquivo_sqlite:
+            with self._lock:
+                return self._geracoes.get(user_id, 0)
+        linha = self._conexao().execute(
+            "SELECT geracao FROM dashboard_geracao WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return linha[0] if linha else 0
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def geracao(self, user_id):
+        """Geração atual do usuário; deve ser lida ANTES de calcular um snapshot novo"""
+        try:
+            return self._geracao_atual(user_id)
+        except sqlite3.Error:
+            return None
+
+    def obter(self, user_id):
+        """Retorna o snapshot válido do usuário ou None"""
+        agora = time.time()
+        try:
+            geracao = self._geracao_atual(user_id)
+        except sqlite3.Error:
+            return None
+
+        with self._lock:
+            entrada = self._entradas.get(user_id)
+            if entrada and entrada[0] == geracao and entrada[1] > agora:
+                self._entradas.move_to_end(user_id)
+                return entrada[2]
+
+        if not self.arquivo_sqlite:
+            return None
+
+        try:
+            linha = self._conexao().execute(
+                "SELECT expira_em, dados FROM dashboard_snapshot WHERE user_id = ? AND geracao = ?",
+                (user_id, geracao)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if not linha or linha[0] <= agora:
+            return None
+
+        dados = json.loads(linha[1])
+        self._guardar_local(user_id, geracao, linha[0], dados)
+        return dados
+
+    def salvar(self, user_id, geracao, dados):
+        """
+        Guarda o snapshot calculado.
+
+        Args:
+            user_id: Usuário dono do snapshot
+            geracao: Valor de geracao() lido antes do cálculo
+            dados: Dicionário serializável em JSON
+        """
+        if geracao is None:
+            return
+        expira_em = time.time() + self.ttl_segundos
+        self._guardar_local(user_id, geracao, expira_em, dados)
+
+        if self.arquivo_sqlite:
+            try:
+                self._conexao().execute(
+                    "INSERT OR REPLACE INTO dashboard_snapshot (user_id, geracao, expira_em, dados) "
+                    "VALUES (?, ?, ?, ?)",
+                    (user_id, geracao, expira_em, json.dumps(dados))
+                )
+            except sqlite3.Error:
+                pass
+
+    def invalidar(self, *user_ids):
+        """Descarta os snapshots e avança a geração dos usuários informados"""
+        with self._lock:
+            for user_id in user_ids:
+                self._entradas.pop(user_id, None)
+                if not self.arquivo_sqlite:
+                    self._geracoes[user_id] = self._geracoes.get(user_id, 0) + 1
+
+        if not self.arquivo_sqlite:
+            return
+        try:
+            conexao = self._conexao()
+            for user_id in user_ids:
+                conexao.execute(
+                    "INSERT INTO dashboard_geracao (user_id, geracao) VALUES (?, 1) "
+                    "ON CONFLICT(user_id) DO UPDATE SET geracao = geracao + 1",
+                    (user_id,)
+                )
+                conexao.execute("DELETE FROM dashboard_snapshot WHERE user_id = ?", (user_id,))
+        except sqlite3.Error:
+            pass
+
+    def _guardar_local(self, user_id, geracao, expira_em, dados):
+        with self._lock:
+            self._entradas[user_id] = (geracao, expira_em, dados)
+            self._entradas.move_to_end(user_id)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+
+def registrar_invalidacao(cache, modelos):
+    """
+    Instala os eventos de sessão que invalidam o cache após o commit.
+
+    Args:
+        cache: Instância de CacheDashboard
+        modelos: Dicionário {Modelo: 'nome_do_campo_do_usuario'}
+    """
+    chave = 'dashboard_usuarios_alterados'
+
+    @event.listens_for(Session, 'after_flush')
+    def _coletar_usuarios(session, flush_context):
+        alterados = session.info.setdefault(chave, set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            campo = modelos.get(type(obj))
+            if campo:
+                user_id = getattr(obj, campo, None)
+                if user_id:
+                    alterados.add(user_id)
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidar_usuarios(session):
+        alterados = session.info.pop(chave, None)
+        if alterados:
+            cache.invalidar(*alterados)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _descartar_usuarios(session):
+        session.info.pop(chave, None)
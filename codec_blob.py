@@ -0,0 +1,121 @@
+"""
+Codec de Blobs JSON
+Documentos JSON grandes (resultados e memórias de cálculo) gravados comprimidos,
+com um cabeçalho versionado e sem compressão no início do blob que traz os totais:
+quem só precisa deles (ex.: a exportação analítica) lê os primeiros bytes, sem
+descomprimir o detalhamento
+
+Formato: mágico 'PJB' | formato (1 byte) | codec (1 byte) | versão do schema (2 bytes)
+         | tamanho do cabeçalho (2 bytes) | cabeçalho JSON | corpo comprimido
+"""
+
+import json
+import struct
+import zlib
+
+from sqlalchemy import func
+
+MAGICO = b'PJB'
+FORMATO = 1
+CODEC_ZLIB = 1
+TAMANHO_MAXIMO_CABECALHO = 1024
+
+_ESTRUTURA = struct.Struct('>3sBBHH')
+
+# Bytes suficientes para ler o cabeçalho sem trazer o corpo do banco
+TAMANHO_PREFIXO = _ESTRUTURA.size + TAMANHO_MAXIMO_CABECALHO
+
+
+class BlobInvalido(ValueError):
+    """Bytes que não estão no formato do codec (ou prefixo curto demais)"""
+
+
+def _json(dados, default=None):
+    return json.dumps(dados, ensure_ascii=False, separators=(',', ':'), default=default)
+
+
+def _escalar(valor):
+    return not isinstance(valor, (dict, list, tuple))
+
+
+def montar_cabecalho(dados, campos=None, default=None):
+    """
+    Totais do documento para o cabeçalho, limitados a TAMANHO_MAXIMO_CABECALHO bytes.
+
+    Sem `campos`, usa os valores escalares do nível raiz e os dicionários planos
+    (só com escalares, ex.: {'total_contrato': {...}}); com `campos`, só essas chaves.
+    """
+    cabecalho = {}
+    if not isinstance(dados, dict):
+        return cabecalho
+
+    tamanho = 2
+    for chave, valor in dados.items():
+        if campos is not None:
+            if chave not in campos:
+                continue
+        elif not (_escalar(valor) or (isinstance(valor, dict) and all(map(_escalar, valor.values())))):
+            continue
+        entrada = len(_json({chave: valor}, default).encode('utf-8')) - 1
+        if tamanho + entrada > TAMANHO_MAXIMO_CABECALHO:
+            continue
+        cabecalho[chave] = valor
+        tamanho += entrada
+    return json.loads(_json(cabecalho, default))
+
+
+def codificar(dados, versao_schema=1, campos_cabecalho=None, default=None, nivel=6):
+    """
+    Serializa e comprime um documento JSON.
+
+    Args:
+        dados: Documento (dict/list) serializável em JSON
+        versao_schema: Versão do formato do documento, gravada no cabeçalho
+        campos_cabecalho: Chaves do nível raiz copiadas para o cabeçalho (None = automático)
+        default: Função de fallback do json.dumps (ex.: str para Decimal/datetime)
+        nivel: Nível de compressão zlib
+
+    Returns:
+        bytes: Blob no formato do codec
+    """
+    cabecalho = _json(montar_cabecalho(dados, campos_cabecalho, default), default).encode('utf-8')
+    corpo = zlib.compress(_json(dados, default).encode('utf-8'), nivel)
+    return _ESTRUTURA.pack(MAGICO, FORMATO, CODEC_ZLIB, versao_schema, len(cabecalho)) + cabecalho + corpo
+
+
+def _abrir(blob):
+    if blob is None or len(blob) < _ESTRUTURA.size:
+        raise BlobInvalido('blob vazio ou truncado')
+    magico, formato, codec, versao_schema, tamanho = _ESTRUTURA.unpack_from(blob)
+    if magico != MAGICO or formato != FORMATO:
+        raise BlobInvalido('formato de blob desconhecido')
+    if codec != CODEC_ZLIB:
+        raise BlobInvalido(f'codec não suportado: {codec}')
+    return versao_schema, _ESTRUTURA.size, _ESTRUTURA.size + tamanho
+
+
+def decodificar(blob):
+    """Descomprime e desserializa o documento completo"""
+    _, _, fim_cabecalho = _abrir(blob)
+    return json.loads(zlib.decompress(bytes(blob[fim_cabecalho:])).decode('utf-8'))
+
+
+def ler_cabecalho(blob):
+    """
+    Lê só o cabeçalho (totais) sem descomprimir o corpo.
+
+    Args:
+        blob: Blob completo ou apenas os primeiros TAMANHO_PREFIXO bytes
+
+    Returns:
+        tuple: (versao_schema, dict com os totais)
+    """
+    versao_schema, inicio, fim = _abrir(blob)
+    if len(blob) < fim:
+        raise BlobInvalido('prefixo menor que o cabeçalho')
+    return versao_schema, json.loads(bytes(blob[inicio:fim]).decode('utf-8'))
+
+
+def prefixo_blob(coluna):
+    """Expressão SQL que traz só o início do blob (para ler_cabecalho em listagens)"""
+    return func.substr(coluna, 1, TAMANHO_PREFIXO)
@@ -1,5 +1,7 @@
 import os
 
+from banco_dados import opcoes_engine
+
 
 class Config:
     # Suas configurações originais (mantidas)
@@ -12,9 +14,69 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    # --- CORREÇÃO: Impede que a conexão com o banco de dados expire durante processos longos ---
-    SQLALCHEMY_POOL_RECYCLE = 280
-    # -----------------------------------------------------------------------------------------
+    # Pool de conexões (pool_size, max_overflow, pool_recycle, pool_pre_ping) conforme o banco da URI.
+    # O Flask-SQLAlchemy 3 ignora SQLALCHEMY_POOL_RECYCLE: o recycle de 280s agora vai aqui.
+    # Ajustáveis por DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+    # e, no SQLite, SQLITE_BUSY_TIMEOUT_MS / SQLITE_MMAP_SIZE
+    SQLALCHEMY_ENGINE_OPTIONS = opcoes_engine(SQLALCHEMY_DATABASE_URI)
+
+    # Cache de KPIs do dashboard (LRU em memória; arquivo SQLite opcional compartilhado entre workers)
+    DASHBOARD_CACHE_MAX_ENTRADAS = int(os.getenv('DASHBOARD_CACHE_MAX_ENTRADAS', '1024'))
+    DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '600'))
+    DASHBOARD_CACHE_SQLITE = os.getenv('DASHBOARD_CACHE_SQLITE') or None
+
+    # Autocomplete de produtos em memória (usuários mantidos no LRU e idade máxima do índice)
+    AUTOCOMPLETE_MAX_USUARIOS = int(os.getenv('AUTOCOMPLETE_MAX_USUARIOS', '64'))
+    AUTOCOMPLETE_TTL = int(os.getenv('AUTOCOMPLETE_TTL', '900'))
+
+    # Estatísticas de fornecedores em memória (debounce após escritas e idade máxima do snapshot)
+    FORNECEDORES_ESTATISTICAS_DEBOUNCE = int(os.getenv('FORNECEDORES_ESTATISTICAS_DEBOUNCE', '5'))
+    FORNECEDORES_ESTATISTICAS_IDADE_MAXIMA = int(os.getenv('FORNECEDORES_ESTATISTICAS_IDADE_MAXIMA', '300'))
+
+    # Sessões das calculadoras: deltas pendentes (quantidade ou bytes) que disparam a compactação no snapshot
+    SESSAO_COMPACTAR_DELTAS = int(os.getenv('SESSAO_COMPACTAR_DELTAS', '20'))
+    SESSAO_COMPACTAR_BYTES = int(os.getenv('SESSAO_COMPACTAR_BYTES', '65536'))
+
+    # Agendador de manutenção (um líder entre os workers via tabela agendador_lider):
+    # intervalo entre ciclos, validade da liderança, lote de sessões e de arquivos por execução
+    AGENDADOR_ATIVO = os.getenv('AGENDADOR_ATIVO', '1') == '1'
+    AGENDADOR_INTERVALO = int(os.getenv('AGENDADOR_INTERVALO', '60'))
+    AGENDADOR_TTL_LIDER = int(os.getenv('AGENDADOR_TTL_LIDER', '180'))
+    AGENDADOR_LOTE = int(os.getenv('AGENDADOR_LOTE', '500'))
+    AGENDADOR_MAX_ARQUIVOS = int(os.getenv('AGENDADOR_MAX_ARQUIVOS', '200'))
+    # Idade (segundos) a partir da qual catálogos e PDFs consolidados gerados são removidos
+    ARQUIVOS_TEMPORARIOS_IDADE_MAXIMA = int(os.getenv('ARQUIVOS_TEMPORARIOS_IDADE_MAXIMA', '21600'))
+
+    # Tarefas em segundo plano (exclusões em massa, importações): execuções simultâneas por processo,
+    # produtos por lote e segundos sem progresso após os quais o agendador retoma a tarefa
+    TAREFAS_MAX_SIMULTANEAS = int(os.getenv('TAREFAS_MAX_SIMULTANEAS', '2'))
+    EXCLUSAO_LOTE = int(os.getenv('EXCLUSAO_LOTE', '1000'))
+    TAREFAS_RETOMAR_APOS = int(os.getenv('TAREFAS_RETOMAR_APOS', '600'))
+
+    # Arquivo de propostas encerradas: idade mínima (dias desde a criação), propostas por lote
+    # e intervalo (segundos) entre lotes do agendador
+    ARQUIVO_PROPOSTAS_DIAS = int(os.getenv('ARQUIVO_PROPOSTAS_DIAS', '365'))
+    ARQUIVO_PROPOSTAS_LOTE = int(os.getenv('ARQUIVO_PROPOSTAS_LOTE', '200'))
+    ARQUIVO_PROPOSTAS_INTERVALO = int(os.getenv('ARQUIVO_PROPOSTAS_INTERVALO', '3600'))
+
+    # Importação de produtos: linhas por INSERT/commit e erros por linha guardados no relatório
+    IMPORTACAO_LOTE = int(os.getenv('IMPORTACAO_LOTE', '1000'))
+    IMPORTACAO_MAX_ERROS = int(os.getenv('IMPORTACAO_MAX_ERROS', '200'))
+    # Pasta dos arquivos enviados até a importação terminar (padrão: instance/importacoes)
+    IMPORTACAO_PASTA = os.getenv('IMPORTACAO_PASTA') or None
+
+    # Exportação analítica em Parquet para o BI (desligada sem pasta de destino): intervalo
+    # (segundos) entre execuções incrementais, ids por execução e linhas por leitura do banco
+    EXPORTACAO_ANALITICA_PASTA = os.getenv('EXPORTACAO_ANALITICA_PASTA') or None
+    EXPORTACAO_ANALITICA_INTERVALO = int(os.getenv('EXPORTACAO_ANALITICA_INTERVALO', '3600'))
+    EXPORTACAO_ANALITICA_JANELA = int(os.getenv('EXPORTACAO_ANALITICA_JANELA', '500000'))
+    EXPORTACAO_ANALITICA_LEITURA = int(os.getenv('EXPORTACAO_ANALITICA_LEITURA', '50000'))
+
+    # Instrumentação de SQL por requisição: execuções da mesma consulta que geram alerta de N+1
+    # no log e cabeçalho Server-Timing com o tempo de banco (desligado por padrão)
+    SQL_INSTRUMENTACAO_ATIVA = os.getenv('SQL_INSTRUMENTACAO_ATIVA', '1') == '1'
+    SQL_LIMITE_REPETICOES = int(os.getenv('SQL_LIMITE_REPETICOES', '5'))
+    SQL_SERVER_TIMING = os.getenv('SQL_SERVER_TIMING', '0') == '1'
 
     # Suas configurações de e-mail (mantidas)
     MAIL_SERVER = 'smtp.gmail.com'
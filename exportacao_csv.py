@@ -0,0 +1,81 @@
+"""
+Exportação de CSV em Fluxo
+Respostas CSV escritas enquanto as linhas chegam do banco: a consulta é lida em partes
+(yield_per) e o corpo sai em blocos de linhas, com o BOM UTF-8 no início para o Excel
+reconhecer a codificação. O primeiro byte sai logo e a memória não cresce com o arquivo
+"""
+
+import codecs
+import csv
+import io
+
+from flask import Response, current_app, stream_with_context
+
+# Linhas de CSV por bloco enviado ao cliente
+LINHAS_POR_BLOCO = 500
+# Linhas buscadas do banco por vez (execution_options(yield_per=...))
+LINHAS_POR_LEITURA = 1000
+
+
+def blocos_csv(cabecalho, linhas, delimitador=';', linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Gera o CSV em blocos de bytes UTF-8.
+
+    O BOM e o cabeçalho saem no primeiro bloco, antes de a consulta começar; as linhas
+    são agrupadas para não enviar um pedaço por linha.
+
+    Args:
+        cabecalho: Nomes das colunas
+        linhas: Iterável de sequências de valores, consumido uma única vez
+        delimitador: Separador de campos
+        linhas_por_bloco: Linhas acumuladas antes de cada envio
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimitador, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+
+    def esvaziar():
+        texto = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return texto.encode('utf-8')
+
+    writer.writerow(cabecalho)
+    yield codecs.BOM_UTF8 + esvaziar()
+
+    pendentes = 0
+    try:
+        for linha in linhas:
+            writer.writerow(linha)
+            pendentes += 1
+            if pendentes >= linhas_por_bloco:
+                yield esvaziar()
+                pendentes = 0
+    except Exception as e:
+        # Os cabeçalhos HTTP já foram enviados: a conexão é interrompida e o download fica incompleto
+        current_app.logger.error(f"❌ Erro durante a exportação de CSV: {e}", exc_info=True)
+        raise
+    if pendentes:
+        yield esvaziar()
+
+
+def resposta_csv(nome_arquivo, cabecalho, linhas, delimitador=';'):
+    """
+    Resposta de download de CSV gerada em fluxo.
+
+    `linhas` é consumido dentro do contexto da requisição (stream_with_context): pode
+    ser um gerador que executa a consulta só quando o corpo começa a ser enviado.
+
+    Args:
+        nome_arquivo: Nome sugerido para o download
+        cabecalho: Nomes das colunas
+        linhas: Iterável de sequências de valores
+        delimitador: Separador de campos
+
+    Returns:
+        Response: text/csv com Content-Disposition de anexo
+    """
+    resposta = Response(stream_with_context(blocos_csv(cabecalho, linhas, delimitador)), mimetype='text/csv')
+    resposta.headers['Content-Disposition'] = f'attachment; filename={nome_arquivo}'
+    # Proxy (nginx) repassa os blocos sem esperar o fim da resposta
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
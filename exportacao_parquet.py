@@ -0,0 +1,387 @@
+"""
+Exportação Analítica em Parquet
+Propostas de produtos (com itens), cenários da calculadora de serviços (com resultados)
+e o catálogo de produtos gravados como datasets Parquet particionados por usuário e mês
+(<conjunto>/user_id=<id>/mes=<AAAA-MM>/), para o BI ler direto com pyarrow, DuckDB ou Spark.
+
+As tabelas são lidas em partes (yield_per) e cada parte vira um RecordBatch colunar;
+cada execução grava só as linhas novas desde a marca (maior id exportado) da anterior,
+guardada em <conjunto>/_marca.json (arquivos com '_' são ignorados pelos leitores).
+Uma trava por conjunto (_trava-<conjunto>) impede duas execuções simultâneas do mesmo conjunto
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
+from sqlalchemy import (Boolean, Date, DateTime, Float, Integer, Numeric, func, literal, select as sa_select,
+                        union_all)
+
+from codec_blob import ler_cabecalho, prefixo_blob
+from models import (db, TABELAS_ARQUIVO, CalculadoraPasso1, FornecedorProdutos, Produto, ProdutosFornecedores,
+                    ResumoProposta)
+from models_nova_lei import SvcOutput, SvcScenario
+
+_TABELAS_ATIVAS = {modelo: modelo.__table__ for modelo in TABELAS_ARQUIVO}
+_CAMADAS = ((_TABELAS_ATIVAS, False), (TABELAS_ARQUIVO, True))
+
+PARTICIONAMENTO = pa.schema([('user_id', pa.int64()), ('mes', pa.string())])
+MES_SEM_DATA = 'sem_data'
+
+Derivada = namedtuple('Derivada', ['nome', 'tipo', 'origem', 'funcao'])
+Derivada.__doc__ = """Coluna calculada em Python a partir de outra da consulta (que não é gravada)"""
+
+Conjunto = namedtuple('Conjunto', ['nome', 'consulta', 'tabelas', 'coluna_data', 'derivadas'], defaults=((),))
+Conjunto.__doc__ = """
+Dataset exportado: consulta(apos_id, ate_id) devolve o SELECT das linhas novas (com as colunas
+id, user_id e coluna_data); tabelas são as tabelas cujo maior id limita a execução
+"""
+
+
+def _tipo_arrow(tipo):
+    """Tipo Arrow de uma coluna SQLAlchemy (textos e tipos desconhecidos viram string)"""
+    if isinstance(tipo, Boolean):
+        return pa.bool_()
+    if isinstance(tipo, Integer):
+        return pa.int64()
+    if isinstance(tipo, Float):
+        return pa.float64()
+    if isinstance(tipo, Numeric):
+        return pa.decimal128(tipo.precision or 18, tipo.scale if tipo.scale is not None else 4)
+    if isinstance(tipo, DateTime):
+        return pa.timestamp('us')
+    if isinstance(tipo, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def _camadas(montar, apos_id, ate_id):
+    """UNION ALL da camada ativa com o arquivo: uma única leitura consistente, mesmo durante o arquivamento"""
+    consultas = []
+    for tabelas, arquivada in _CAMADAS:
+        consulta = montar(tabelas, arquivada)
+        id_ = consulta.selected_columns.id
+        consultas.append(consulta.where(id_ > apos_id, id_ <= ate_id))
+    return union_all(*consultas)
+
+
+def _consulta_propostas(apos_id, ate_id):
+    def montar(t, arquivada):
+        p, r = t[CalculadoraPasso1], t[ResumoProposta]
+        return sa_select(
+            p.c.id, p.c.user_id, p.c.subusuario_id, p.c.numero_processo, p.c.cnpj, p.c.razao_social,
+            p.c.status, p.c.validade_proposta, p.c.prazo_pagamento, p.c.prazo_entrega, p.c.frete,
+            p.c.criado_em, r.c.quantidade_itens, r.c.custo_total, r.c.referencia_total,
+            r.c.valor_total_venda, r.c.imposto_total, r.c.lucro_total,
+            literal(arquivada, Boolean).label('arquivada')
+        ).select_from(p.outerjoin(r, r.c.proposta_id == p.c.id))
+    return _camadas(montar, apos_id, ate_id)
+
+
+def _consulta_itens_propostas(apos_id, ate_id):
+    def montar(t, arquivada):
+        i = t[Produto]
+        return sa_select(
+            i.c.id, i.c.user_id, i.c.calculadora_passo1_id, i.c.numero_item, i.c.nome, i.c.marca_modelo,
+            i.c.unidade_medida, i.c.quantidade, i.c.custo, i.c.referencia, i.c.venda, i.c.frete,
+            i.c.status_item, i.c.produto_fornecedor_id, i.c.criado_em,
+            literal(arquivada, Boolean).label('arquivada')
+        )
+    return _camadas(montar, apos_id, ate_id)
+
+
+def _consulta_cenarios(apos_id, ate_id):
+    tabela = SvcScenario.__table__
+    return sa_select(tabela).where(tabela.c.id > apos_id, tabela.c.id <= ate_id)
+
+
+def _consulta_resultados(apos_id, ate_id):
+    return sa_select(
+        SvcOutput.id, SvcOutput.scenario_id, SvcScenario.user_id, SvcOutput.tipo, SvcOutput.criado_em,
+        prefixo_blob(SvcOutput.resultado_comprimido).label('cabecalho_resultado')
+    ).join(SvcScenario, SvcScenario.id == SvcOutput.scenario_id).where(
+        SvcOutput.id > apos_id, SvcOutput.id <= ate_id
+    )
+
+
+def _consulta_catalogo(apos_id, ate_id):
+    return sa_select(
+        ProdutosFornecedores.id, ProdutosFornecedores.user_id, ProdutosFornecedores.nome,
+        ProdutosFornecedores.marca, ProdutosFornecedores.modelo, ProdutosFornecedores.unidade_medida,
+        ProdutosFornecedores.custo, ProdutosFornecedores.fornecedor_id,
+        FornecedorProdutos.nome_empresa.label('fornecedor_nome'), ProdutosFornecedores.tem_foto,
+        ProdutosFornecedores.tem_descricao, ProdutosFornecedores.data_cadastro
+    ).outerjoin(
+        FornecedorProdutos, FornecedorProdutos.id == ProdutosFornecedores.fornecedor_id
+    ).where(ProdutosFornecedores.id > apos_id, ProdutosFornecedores.id <= ate_id)
+
+
+def _total_contrato(prefixo):
+    """total_contrato do cabeçalho do blob do resultado (None sem resultado comprimido)"""
+    if not prefixo:
+        return None
+    try:
+        total = ler_cabecalho(prefixo)[1].get('total_contrato')
+    except ValueError:
+        return None
+    return float(total) if total is not None else None
+
+
+CONJUNTOS = (
+    Conjunto('propostas', _consulta_propostas,
+             (_TABELAS_ATIVAS[CalculadoraPasso1], TABELAS_ARQUIVO[CalculadoraPasso1]), 'criado_em'),
+    Conjunto('itens_propostas', _consulta_itens_propostas,
+             (_TABELAS_ATIVAS[Produto], TABELAS_ARQUIVO[Produto]), 'criado_em'),
+    Conjunto('cenarios_servicos', _consulta_cenarios, (SvcScenario.__table__,), 'criado_em'),
+    Conjunto('resultados_servicos', _consulta_resultados, (SvcOutput.__table__,), 'criado_em',
+             (Derivada('total_contrato', pa.float64(), 'cabecalho_resultado', _total_contrato),)),
+    Conjunto('catalogo', _consulta_catalogo, (ProdutosFornecedores.__table__,), 'data_cadastro'),
+)
+
+
+class ExportacaoAnalitica:
+    """
+    Exportação incremental dos datasets analíticos.
+
+    Recursos:
+    - Leitura em partes pela conexão (yield_per), sem objetos ORM; cada parte vira um
+      RecordBatch com tipos fixos (decimais exatos, timestamps, booleanos)
+    - Gravação pelo pyarrow.dataset, particionada por user_id e mês da data de criação,
+      com compressão zstd e colunas de partição fora dos arquivos (estão no caminho)
+    - Marca por conjunto: cada execução exporta os ids após a marca, até uma janela de ids
+      (a carga inicial de tabelas grandes se divide em várias execuções)
+    - Linhas criadas há menos de `margem_segundos` ficam para a próxima execução: um id
+      reservado por uma transação ainda aberta não fica para trás da marca
+    - Falha no meio: os arquivos da execução são removidos e a marca não avança
+    - Exportação completa grava numa pasta nova e troca pela atual no fim
+    - Trava exclusiva por conjunto (flock) da leitura da marca até a gravação da nova:
+      uma execução concorrente (outro líder do agendador, a linha de comando) pula o
+      conjunto em vez de exportar o mesmo intervalo de ids de novo
+
+    Alterações em linhas já exportadas (ex.: status de uma proposta) entram só na
+    exportação completa; cada arquivo é imutável depois de gravado.
+    """
+
+    def __init__(self, pasta, linhas_por_leitura=50000, janela_ids=500000, margem_segundos=300,
+                 compressao='zstd'):
+        """
+        Inicializa a exportação.
+
+        Args:
+            pasta: Diretório de destino (uma subpasta por conjunto)
+            linhas_por_leitura: Linhas buscadas do banco (e gravadas) por vez
+            janela_ids: Ids após a marca exportados por execução de cada conjunto
+            margem_segundos: Idade mínima da linha de maior id considerada na execução
+            compressao: Codec dos arquivos Parquet
+        """
+        self.pasta = pasta
+        self.linhas_por_leitura = linhas_por_leitura
+        self.janela_ids = janela_ids
+        self.margem_segundos = margem_segundos
+        self.compressao = compressao
+
+    # ------------------------------------------------------------------
+    # Marcas
+    # ------------------------------------------------------------------
+
+    def _caminho(self, conjunto):
+        return os.path.join(self.pasta, conjunto.nome)
+
+    @staticmethod
+    def _ler_marca(pasta):
+        try:
+            with open(os.path.join(pasta, '_marca.json'), encoding='utf-8') as arquivo:
+                return json.load(arquivo)
+        except FileNotFoundError:
+            return {'ultimo_id': 0}
+
+    @staticmethod
+    def _gravar_marca(pasta, marca):
+        caminho = os.path.join(pasta, '_marca.json')
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as arquivo:
+            json.dump(marca, arquivo)
+        os.replace(caminho + '.tmp', caminho)
+
+    @contextmanager
+    def _trava(self, conjunto):
+        """
+        Trava exclusiva do conjunto, sem espera.
+
+        O arquivo fica ao lado da pasta do conjunto (não dentro dela): a troca da
+        exportação completa substitui a pasta, e a trava precisa continuar no mesmo arquivo.
+
+        Yields:
+            bool: True se a trava foi obtida; False se outra execução está com o conjunto
+        """
+        os.makedirs(self.pasta, exist_ok=True)
+        with open(os.path.join(self.pasta, f'_trava-{conjunto.nome}'), 'a') as arquivo:
+            try:
+                fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+    def marca(self, nome):
+        """Marca atual do conjunto: ultimo_id exportado, data e linhas da última execução"""
+        return self._ler_marca(os.path.join(self.pasta, nome))
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def _maior_id(self, conexao, conjunto, apos_id):
+        """Maior id das tabelas do conjunto entre as linhas com idade acima da margem"""
+        limite = datetime.utcnow() - timedelta(seconds=self.margem_segundos)
+        maior = apos_id
+        for tabela in conjunto.tabelas:
+            valor = conexao.execute(
+                sa_select(func.max(tabela.c.id)).where(tabela.c[conjunto.coluna_data] <= limite)
+            ).scalar()
+            maior = max(maior, valor or 0)
+        return min(maior, apos_id + self.janela_ids)
+
+    @staticmethod
+    def _esquema(consulta, conjunto):
+        derivadas = {derivada.origem: derivada for derivada in conjunto.derivadas}
+        campos = []
+        for coluna in consulta.selected_columns:
+            if coluna.name in derivadas:
+                derivada = derivadas[coluna.name]
+                campos.append(pa.field(derivada.nome, derivada.tipo))
+            else:
+                campos.append(pa.field(coluna.name, _tipo_arrow(coluna.type)))
+        return pa.schema(campos + [pa.field('mes', pa.string())])
+
+    def _lotes(self, conexao, consulta, conjunto, esquema, contagem):
+        """RecordBatches da consulta, uma parte de linhas_por_leitura por vez"""
+        funcoes = {indice: derivada.funcao for indice, coluna in enumerate(consulta.selected_columns)
+                   for derivada in conjunto.derivadas if derivada.origem == coluna.name}
+        indice_data = esquema.get_field_index(conjunto.coluna_data)
+        resultado = conexao.execution_options(yield_per=self.linhas_por_leitura).execute(consulta)
+        for linhas in resultado.partitions():
+            arrays = []
+            for indice, valores in enumerate(zip(*linhas)):
+                if indice in funcoes:
+                    valores = [funcoes[indice](valor) for valor in valores]
+                arrays.append(pa.array(valores, type=esquema.field(indice).type))
+            mes = pc.fill_null(pc.strftime(arrays[indice_data], format='%Y-%m'), MES_SEM_DATA)
+            contagem[0] += len(linhas)
+            yield pa.RecordBatch.from_arrays(arrays + [mes], schema=esquema)
+
+    # ------------------------------------------------------------------
+    # Gravação
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _remover_execucao(pasta, execucao):
+        """Arquivos gravados por uma execução que falhou"""
+        prefixo = f'parte-{execucao}-'
+        for raiz, _, arquivos in os.walk(pasta):
+            for nome in arquivos:
+                if nome.startswith(prefixo):
+                    os.remove(os.path.join(raiz, nome))
+
+    def _exportar_conjunto(self, conjunto, completo):
+        with self._trava(conjunto) as obtida:
+            if not obtida:
+                marca = self._ler_marca(self._caminho(conjunto))
+                return {'linhas': 0, 'ultimo_id': marca.get('ultimo_id', 0), 'em_andamento': True}
+            return self._exportar_conjunto_travado(conjunto, completo)
+
+    def _exportar_conjunto_travado(self, conjunto, completo):
+        pasta_final = self._caminho(conjunto)
+        execucao = f"{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        pasta = f'{pasta_final}.novo-{execucao}' if completo else pasta_final
+        apos_id = 0 if completo else self._ler_marca(pasta_final).get('ultimo_id', 0)
+
+        with db.engine.connect() as conexao:
+            ate_id = self._maior_id(conexao, conjunto, apos_id)
+            if ate_id <= apos_id and not completo:
+                return {'linhas': 0, 'ultimo_id': apos_id}
+
+            consulta = conjunto.consulta(apos_id, ate_id)
+            esquema = self._esquema(consulta, conjunto)
+            contagem = [0]
+            os.makedirs(pasta, exist_ok=True)
+            try:
+                pads.write_dataset(
+                    pa.RecordBatchReader.from_batches(
+                        esquema, self._lotes(conexao, consulta, conjunto, esquema, contagem)
+                    ),
+                    pasta,
+                    format='parquet',
+                    partitioning=pads.partitioning(PARTICIONAMENTO, flavor='hive'),
+                    basename_template=f'parte-{execucao}-{{i}}.parquet',
+                    existing_data_behavior='overwrite_or_ignore',
+                    file_options=pads.ParquetFileFormat().make_write_options(compression=self.compressao),
+                    max_rows_per_group=self.linhas_por_leitura,
+                )
+            except Exception:
+                if completo:
+                    shutil.rmtree(pasta, ignore_errors=True)
+                else:
+                    self._remover_execucao(pasta, execucao)
+                raise
+
+        marca = {'ultimo_id': ate_id, 'exportado_em': datetime.utcnow().isoformat(), 'linhas': contagem[0]}
+        self._gravar_marca(pasta, marca)
+        if completo:
+            antiga = f'{pasta_final}.antigo-{execucao}'
+            if os.path.isdir(pasta_final):
+                os.replace(pasta_final, antiga)
+            os.replace(pasta, pasta_final)
+            shutil.rmtree(antiga, ignore_errors=True)
+        return {'linhas': contagem[0], 'ultimo_id': ate_id}
+
+    def exportar(self, nomes=None, completo=False):
+        """
+        Exporta os conjuntos (dentro de um app_context).
+
+        Args:
+            nomes: Nomes dos conjuntos (padrão: todos de CONJUNTOS)
+            completo: Se True, regrava o conjunto inteiro e reinicia a marca
+
+        Returns:
+            dict: nome do conjunto -> {'linhas': gravadas, 'ultimo_id': nova marca}; conjuntos
+            travados por outra execução voltam com 'em_andamento': True e nada gravado
+        """
+        resumo = {}
+        for conjunto in CONJUNTOS:
+            if nomes is None or conjunto.nome in nomes:
+                resumo[conjunto.nome] = self._exportar_conjunto(conjunto, completo)
+        return resumo
+
+
+if __name__ == '__main__':
+    # Exportação manual: python3 exportacao_parquet.py <pasta> [--completo] [conjunto ...]
+    import sys
+
+    from app import app
+
+    argumentos = [argumento for argumento in sys.argv[1:] if argumento != '--completo']
+    if not argumentos:
+        print("Uso: python3 exportacao_parquet.py <pasta> [--completo] [conjunto ...]")
+        sys.exit(1)
+    with app.app_context():
+        exportacao = ExportacaoAnalitica(
+            argumentos[0],
+            linhas_por_leitura=app.config.get('EXPORTACAO_ANALITICA_LEITURA', 50000),
+            janela_ids=sys.maxsize if '--completo' in sys.argv else app.config.get('EXPORTACAO_ANALITICA_JANELA', 500000),
+        )
+        for nome, resultado in exportacao.exportar(argumentos[1:] or None, completo='--completo' in sys.argv).items():
+            if resultado.get('em_andamento'):
+                print(f"⏳ {nome}: exportação em andamento em outro processo, ignorado")
+            else:
+                print(f"✓ {nome}: {resultado['linhas']} linha(s), marca {resultado['ultimo_id']}")
@@ -0,0 +1,128 @@
+"""
+Exportação de XLSX em Fluxo
+Planilhas Excel gravadas com o openpyxl em modo write_only: cada linha vai para o
+arquivo assim que é adicionada, os estilos de cada coluna são montados uma única vez
+e o .xlsx final fica num arquivo temporário, não na memória. A memória usada não
+cresce com o número de linhas
+"""
+
+import tempfile
+from collections import namedtuple
+
+from flask import send_file
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+FORMATO_MOEDA = '"R$" #,##0.00'
+FORMATO_INTEIRO = '0'
+FORMATO_DATA = 'DD/MM/YYYY'
+FORMATO_DATA_HORA = 'DD/MM/YYYY HH:MM'
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+Coluna = namedtuple('Coluna', ['titulo', 'largura', 'formato'], defaults=(15, None))
+Coluna.__doc__ = """Coluna da planilha: título do cabeçalho, largura e formato numérico (opcional)"""
+
+
+class PlanilhaFluxo:
+    """
+    Planilha de uma aba gravada linha a linha.
+
+    Recursos:
+    - Workbook write_only: as linhas são serializadas no append, sem células em memória
+    - Estilos compartilhados: uma célula-modelo por coluna formatada, reaproveitada em
+      todas as linhas (o estilo é registrado no workbook uma vez só)
+    - Colunas sem formato recebem o valor direto, sem objeto de célula
+    - Textos com caracteres de controle (inválidos no XML) são limpos antes de gravar
+    - salvar() grava o .xlsx num arquivo temporário anônimo, pronto para send_file
+    """
+
+    def __init__(self, titulo, colunas):
+        """
+        Cria a aba e grava o cabeçalho.
+
+        Args:
+            titulo: Nome da aba (até 31 caracteres)
+            colunas: Lista de Coluna, na ordem dos valores de cada linha
+        """
+        self.workbook = Workbook(write_only=True)
+        self.aba = self.workbook.create_sheet(title=titulo[:31])
+        self.linhas = 0
+
+        for indice, coluna in enumerate(colunas, 1):
+            self.aba.column_dimensions[get_column_letter(indice)].width = coluna.largura
+        self.aba.freeze_panes = 'A2'
+
+        fonte = Font(bold=True, color='FFFFFF')
+        preenchimento = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+        alinhamento = Alignment(horizontal='center', vertical='center')
+        cabecalho = []
+        for coluna in colunas:
+            celula = WriteOnlyCell(self.aba, value=coluna.titulo)
+            celula.font, celula.fill, celula.alignment = fonte, preenchimento, alinhamento
+            cabecalho.append(celula)
+        self.aba.append(cabecalho)
+
+        # Células-modelo: o append serializa a linha na hora, então a mesma célula serve a todas
+        self._modelos = []
+        for coluna in colunas:
+            modelo = None
+            if coluna.formato:
+                modelo = WriteOnlyCell(self.aba)
+                modelo.number_format = coluna.formato
+            self._modelos.append(modelo)
+
+    def adicionar(self, valores):
+        """Grava uma linha (valores na ordem das colunas; None deixa a célula vazia)"""
+        linha = []
+        for valor, modelo in zip(valores, self._modelos):
+            if isinstance(valor, str):
+                valor = ILLEGAL_CHARACTERS_RE.sub('', valor)
+            if modelo is not None and valor is not None:
+                modelo.value = valor
+                valor = modelo
+            linha.append(valor)
+        self.aba.append(linha)
+        self.linhas += 1
+
+    def adicionar_todas(self, linhas):
+        """Grava todas as linhas de um iterável (ex.: consulta com yield_per)"""
+        for valores in linhas:
+            self.adicionar(valores)
+
+    def salvar(self):
+        """
+        Fecha a planilha e grava o .xlsx.
+
+        Returns:
+            Arquivo temporário (removido ao ser fechado) posicionado no início
+        """
+        arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+        try:
+            self.workbook.save(arquivo)
+        except Exception:
+            arquivo.close()
+            raise
+        arquivo.seek(0)
+        return arquivo
+
+
+def resposta_xlsx(nome_arquivo, titulo, colunas, linhas):
+    """
+    Gera a planilha e devolve a resposta de download.
+
+    Args:
+        nome_arquivo: Nome sugerido para o download
+        titulo: Nome da aba
+        colunas: Lista de Coluna
+        linhas: Iterável de sequências de valores
+
+    Returns:
+        Response: o arquivo temporário é fechado (e removido) pelo servidor ao fim do envio
+    """
+    planilha = PlanilhaFluxo(titulo, colunas)
+    planilha.adicionar_todas(linhas)
+    return send_file(planilha.salvar(), as_attachment=True, download_name=nome_arquivo, mimetype=MIMETYPE_XLSX)
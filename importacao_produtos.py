@@ -0,0 +1,743 @@
+"""
+Importação de Produtos do Catálogo
+Pipeline em streaming para planilhas de preços de fornecedores: as linhas são lidas
+aos poucos, validadas e convertidas uma a uma e gravadas por INSERT em massa, com
+commit por lote; a memória fica limitada ao tamanho do lote, qualquer que seja o arquivo
+
+Leitores: CSV (csv.DictReader) e XLSX (openpyxl em modo read_only), ambos entregando pares (número da linha, dict) ao mesmo ImportadorProdutos
+
+Modo 'atualizar': cada linha é casada com o catálogo pela chave natural (hash de nome,
+marca, modelo e fornecedor); só linhas novas ou com valores diferentes geram escrita
+
+Retomada: o número da última linha de cada lote gravado pode ser persistido na mesma
+transação do lote (antes_do_commit); importar(..., retomar_apos=N) pula as linhas até N
+
+Simulação: SimulacaoImportacao passa pelo arquivo com a mesma conversão, sem gravar,
+e resume custos inválidos, fornecedores desconhecidos e linhas repetidas
+"""
+
+import csv
+from datetime import date, datetime
+
+from sqlalchemy import bindparam, false, insert as sa_insert, select as sa_select, update as sa_update
+
+from models import db, FornecedorProdutos, ProdutosFornecedores, chave_natural_produto, normalizar_busca
+
+MODOS_IMPORTACAO = ('inserir', 'atualizar')
+
+# Colunas comparadas e regravadas quando uma linha casa com um produto existente
+CAMPOS_ATUALIZAVEIS = ('nome', 'marca', 'modelo', 'unidade_medida', 'custo', 'busca_normalizada')
+# Caracteres de uma célula repetidos numa mensagem de erro (o relatório é gravado a cada lote)
+TAMANHO_TRECHO_ERRO = 100
+
+
+def trecho(valor, limite=TAMANHO_TRECHO_ERRO):
+    """Texto de uma célula encurtado para mensagens e amostras do relatório"""
+    return valor if len(valor) <= limite else valor[:limite] + '...'
+
+
+class ErroLinha(ValueError):
+    """Linha rejeitada na validação (a mensagem vai para o relatório de erros)"""
+
+    def __init__(self, mensagem, tipo='campo'):
+        super().__init__(mensagem)
+        # 'custo', 'fornecedor' ou 'campo' (em branco, longo demais): agrupa os erros na simulação
+        self.tipo = tipo
+
+
+class ArquivoInvalido(ValueError):
+    """Arquivo que não pode ser importado (sem planilha/cabeçalho reconhecível)"""
+
+
+class RelatorioImportacao:
+    """Totais da importação e os primeiros erros por linha (limitados a `max_erros`)"""
+
+    def __init__(self, max_erros=200):
+        self.max_erros = max_erros
+        self.linhas_lidas = 0
+        self.importados = 0
+        self.atualizados = 0
+        self.inalterados = 0
+        self.ausentes = 0
+        self.total_erros = 0
+        self.lotes = 0
+        self.lotes_falhos = 0
+        self.erros = []
+
+    @classmethod
+    def de_dict(cls, dados, max_erros=200):
+        """Relatório com os totais de um to_dict() anterior (retomada de uma importação)"""
+        relatorio = cls(max_erros)
+        for campo in ('linhas_lidas', 'importados', 'atualizados', 'inalterados', 'ausentes',
+                      'total_erros', 'lotes', 'lotes_falhos'):
+            setattr(relatorio, campo, dados.get(campo, 0))
+        relatorio.erros = list(dados.get('erros', []))[:max_erros]
+        return relatorio
+
+    def registrar_erro(self, linha, mensagem, quantidade=1):
+        self.total_erros += quantidade
+        if len(self.erros) < self.max_erros:
+            self.erros.append({'linha': linha, 'erro': mensagem})
+
+    def resumo_erros(self, quantidade=3):
+        """Primeiros erros em texto, para mensagens flash"""
+        return '; '.join(f"Linha {e['linha']}: {e['erro']}" for e in self.erros[:quantidade])
+
+    def to_dict(self):
+        return {
+            'linhas_lidas': self.linhas_lidas,
+            'importados': self.importados,
+            'atualizados': self.atualizados,
+            'inalterados': self.inalterados,
+            'ausentes': self.ausentes,
+            'total_erros': self.total_erros,
+            'lotes': self.lotes,
+            'lotes_falhos': self.lotes_falhos,
+            'erros': self.erros,
+            'erros_truncados': self.total_erros > len(self.erros),
+        }
+
+
+# Campo -> (nomes exatos, trechos aceitos no nome da coluna). Os campos do fornecedor vêm
+# primeiro para que 'nome_fornecedor' não seja tomado como o nome do produto
+COLUNAS_PRODUTO = (
+    ('fornecedor_id', ('fornecedor_id', 'id_fornecedor'), ('fornecedor_id', 'id_fornecedor')),
+    ('fornecedor_cnpj', ('cnpj', 'fornecedor_cnpj', 'cnpj_fornecedor'), ('cnpj',)),
+    ('fornecedor_nome', ('fornecedor', 'nome_fornecedor', 'fornecedor_nome'), ('fornecedor',)),
+    ('nome', ('nome', 'produto', 'descrição', 'descricao'), ('nome', 'produto')),
+    ('marca', ('marca',), ('marca',)),
+    ('modelo', ('modelo',), ('modelo',)),
+    ('unidade_medida', ('unidade', 'unidade_medida', 'un'), ('unidade', 'medida')),
+    ('custo', ('custo', 'preço', 'preco', 'valor'), ('custo', 'preço', 'preco', 'valor')),
+)
+
+
+def mapear_colunas(cabecalho):
+    """
+    Associa os campos do produto às colunas do arquivo pelo nome: primeiro o nome exato,
+    depois a primeira coluna livre que contém um dos trechos aceitos.
+
+    Args:
+        cabecalho: Nomes das colunas, na ordem do arquivo
+
+    Returns:
+        dict: campo -> nome da coluna (None se ausente)
+    """
+    colunas = [(c, c.strip().lower()) for c in cabecalho if c]
+    usadas = set()
+    mapa = {}
+    for campo, exatos, trechos in COLUNAS_PRODUTO:
+        livres = [(c, nome) for c, nome in colunas if c not in usadas]
+        coluna = next((c for c, nome in livres if nome in exatos), None)
+        if coluna is None:
+            coluna = next((c for c, nome in livres if any(t in nome for t in trechos)), None)
+        if coluna is not None:
+            usadas.add(coluna)
+        mapa[campo] = coluna
+    return mapa
+
+
+# Linhas do início de cada planilha examinadas à procura do cabeçalho
+LINHAS_BUSCA_CABECALHO = 20
+
+
+def _texto_celula(valor):
+    """Valor de célula do Excel como texto, no formato que o leitor de CSV entregaria"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if isinstance(valor, float):
+        # Sem notação científica e sem '.0' em inteiros gravados como número (ex.: fornecedor_id 3.0)
+        return f'{valor:.10f}'.rstrip('0').rstrip('.')
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return str(valor).strip()
+
+
+def _cabecalho_valido(mapa):
+    return bool(mapa['nome'] and mapa['custo'])
+
+
+def abrir_csv(caminho, encoding, delimitador):
+    """
+    Abre um CSV para leitura em streaming.
+
+    Args:
+        caminho: Arquivo em disco
+        encoding: Encoding do arquivo (já detectado)
+        delimitador: Separador de colunas (já detectado)
+
+    Returns:
+        tuple: (nomes das colunas, gerador de (número da linha, dict coluna -> texto));
+        o arquivo é fechado quando o gerador termina
+
+    Raises:
+        ArquivoInvalido: se o arquivo não tiver cabeçalho com nome e custo
+    """
+    arquivo = open(caminho, 'r', encoding=encoding, newline='')
+    leitor = csv.DictReader(arquivo, delimiter=delimitador)
+    cabecalho = leitor.fieldnames
+    if not cabecalho:
+        arquivo.close()
+        raise ArquivoInvalido("Arquivo CSV vazio ou sem cabeçalhos.")
+    if not _cabecalho_valido(mapear_colunas(cabecalho)):
+        arquivo.close()
+        raise ArquivoInvalido("O arquivo deve conter colunas para 'nome' e 'custo' "
+                              "(ou variações como 'produto', 'preço', 'valor').")
+
+    def linhas():
+        with arquivo:
+            for i, row in enumerate(leitor):
+                yield i + 2, row
+
+    return cabecalho, linhas()
+
+
+def abrir_xlsx(caminho):
+    """
+    Abre uma pasta de trabalho XLSX em streaming (openpyxl read_only) e localiza a planilha
+    e a linha de cabeçalho: a primeira, na ordem das abas, entre as LINHAS_BUSCA_CABECALHO
+    iniciais, cujas colunas tenham nome e custo reconhecidos por mapear_colunas.
+
+    Args:
+        caminho: Arquivo .xlsx em disco
+
+    Returns:
+        tuple: (nomes das colunas, gerador de (número da linha na planilha, dict coluna -> texto));
+        o arquivo é fechado quando o gerador termina
+
+    Raises:
+        ArquivoInvalido: se nenhuma planilha tiver cabeçalho reconhecível
+    """
+    import openpyxl
+
+    try:
+        pasta = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    except Exception as e:
+        raise ArquivoInvalido(f'Não foi possível abrir a planilha: {e}')
+
+    for planilha in pasta.worksheets:
+        linhas = planilha.iter_rows(max_row=LINHAS_BUSCA_CABECALHO, values_only=True)
+        for numero, valores in enumerate(linhas, 1):
+            cabecalho = [_texto_celula(v) for v in valores]
+            if _cabecalho_valido(mapear_colunas(cabecalho)):
+                return cabecalho, _linhas_planilha(pasta, planilha, numero, cabecalho)
+
+    pasta.close()
+    raise ArquivoInvalido("Nenhuma planilha com colunas de 'nome' e 'custo' foi encontrada.")
+
+
+def _linhas_planilha(pasta, planilha, linha_cabecalho, cabecalho):
+    try:
+        linhas = planilha.iter_rows(min_row=linha_cabecalho + 1, values_only=True)
+        for numero, valores in enumerate(linhas, linha_cabecalho + 1):
+            textos = [_texto_celula(v) for v in valores]
+            if not any(textos):
+                # Linhas vazias (formatação no fim da planilha) não são erro
+                continue
+            yield numero, {coluna: texto for coluna, texto in zip(cabecalho, textos) if coluna}
+    finally:
+        pasta.close()
+
+
+def chave_cnpj(cnpj):
+    return ''.join(filter(str.isdigit, cnpj or ''))
+
+
+class MapaFornecedores:
+    """Fornecedores do usuário carregados uma vez, por id, CNPJ (só dígitos) e nome normalizado"""
+
+    def __init__(self, user_id):
+        self.ids = set()
+        self.por_cnpj = {}
+        self.por_nome = {}
+        consulta = db.session.query(
+            FornecedorProdutos.id, FornecedorProdutos.cnpj, FornecedorProdutos.nome_empresa
+        ).filter_by(user_id=user_id).order_by(FornecedorProdutos.id)
+        for fornecedor_id, cnpj, nome in consulta:
+            self.ids.add(fornecedor_id)
+            if chave_cnpj(cnpj):
+                self.por_cnpj.setdefault(chave_cnpj(cnpj), fornecedor_id)
+            if normalizar_busca(nome):
+                self.por_nome.setdefault(normalizar_busca(nome), fornecedor_id)
+
+    def resolver(self, fornecedor_id='', cnpj='', nome=''):
+        """
+        Id do fornecedor da linha: pelo id informado, senão pelo CNPJ, senão pelo nome.
+
+        Raises:
+            ErroLinha: se um id foi informado e não é de um fornecedor do usuário
+
+        Returns:
+            int ou None: None se CNPJ/nome não correspondem a nenhum fornecedor
+        """
+        if fornecedor_id:
+            try:
+                encontrado = int(fornecedor_id)
+            except ValueError:
+                encontrado = None
+            if encontrado not in self.ids:
+                raise ErroLinha(f"ID de fornecedor '{trecho(fornecedor_id)}' inválido ou não encontrado.", tipo='fornecedor')
+            return encontrado
+        if cnpj and chave_cnpj(cnpj) in self.por_cnpj:
+            return self.por_cnpj[chave_cnpj(cnpj)]
+        if nome:
+            return self.por_nome.get(normalizar_busca(nome))
+        return None
+
+
+class ImportadorProdutos:
+    """
+    Importação em lotes para ProdutosFornecedores.
+
+    Recursos:
+    - Recebe as linhas de qualquer leitor como pares (número da linha, dict)
+    - Fornecedor por id, CNPJ ou nome resolvido em memória (MapaFornecedores),
+      sem consulta por linha
+    - Validação e conversão por linha (o custo, opcionalmente, de uma vez por lote);
+      linhas inválidas vão para o relatório e não interrompem a importação
+    - INSERT em massa (Core) por lote com commit: um erro de gravação descarta só
+      aquele lote, os anteriores já estão gravados
+    - Modo 'atualizar': casa as linhas do lote com o catálogo por chave_natural numa
+      consulta, regrava só as que mudaram (UPDATE em massa) e insere as novas; linhas
+      repetidas no arquivo valem pela última ocorrência
+    - Opcionalmente marca ausente_na_lista nos produtos dos fornecedores da lista que
+      não vieram no arquivo (guarda os ids casados em memória até o fim)
+    - busca_normalizada e chave_natural calculadas aqui, já que o INSERT em massa não passa pelo flush
+      (contadores do catálogo, dashboard e autocomplete ficam a cargo de quem chama)
+    - Retomável: antes_do_commit recebe a última linha de cada lote para gravar o cursor na
+      mesma transação, e importar(retomar_apos=...) continua do lote seguinte
+    """
+
+    def __init__(self, user_id, converter_valor, fornecedores=None, tamanho_lote=1000, max_erros=200,
+                 modo='inserir', marcar_ausentes=False, relatorio=None, inicio=None, antes_do_commit=None,
+                 converter_valores=None, ao_progredir=None):
+        """
+        Inicializa o importador.
+
+        Args:
+            user_id: Dono dos produtos importados
+            converter_valor: Função que converte o texto do custo em número (ex.: processar_valor_monetario)
+            converter_valores: Versão vetorizada opcional (lista de textos -> np.ndarray), aplicada
+                à coluna de custo de cada lote (ex.: processar_valores_monetarios)
+            fornecedores: MapaFornecedores do usuário (carregado aqui se omitido)
+            tamanho_lote: Linhas por INSERT/commit
+            max_erros: Erros guardados no relatório (os demais só são contados)
+            modo: 'inserir' (toda linha vira um produto) ou 'atualizar' (casa pela chave natural)
+            marcar_ausentes: No modo 'atualizar', marca os produtos dos fornecedores da lista
+                que não vieram no arquivo
+            relatorio: RelatorioImportacao a continuar (retomada); um novo se omitido
+            inicio: Início original da importação (retomada); só produtos cadastrados antes
+                dele podem ser marcados como ausentes
+            antes_do_commit: Função chamada com (última linha do lote, relatório) antes do
+                commit de cada lote, gravado ou não, para persistir o progresso na mesma transação
+            ao_progredir: Função chamada com o relatório nas etapas sem lote gravado (linhas
+                revisitadas numa retomada, cada faixa de ids da marcação de ausentes), com a
+                sessão livre para commit: mantém a tarefa em segundo plano visivelmente ativa
+        """
+        if modo not in MODOS_IMPORTACAO:
+            raise ValueError(f'modo de importação inválido: {modo}')
+        self.user_id = user_id
+        self.converter_valor = converter_valor
+        self.converter_valores = converter_valores
+        self.fornecedores = fornecedores if fornecedores is not None else MapaFornecedores(user_id)
+        self.tamanho_lote = tamanho_lote
+        self.modo = modo
+        self.marcar_ausentes = marcar_ausentes and modo == 'atualizar'
+        self.relatorio = relatorio if relatorio is not None else RelatorioImportacao(max_erros)
+        self.antes_do_commit = antes_do_commit
+        self.ao_progredir = ao_progredir
+        self._tabela = ProdutosFornecedores.__table__
+        self._inicio = inicio or datetime.utcnow()
+        self._vistos = set()
+        self._fornecedores_vistos = set()
+
+    @staticmethod
+    def _valor(row, coluna):
+        return str(row.get(coluna) or '').strip() if coluna else ''
+
+    def _texto(self, row, coluna, campo):
+        valor = self._valor(row, coluna)
+        tamanho = self._tabela.c[campo].type.length
+        if tamanho and len(valor) > tamanho:
+            raise ErroLinha(f"{campo} com mais de {tamanho} caracteres.")
+        return valor
+
+    def converter_linha(self, row, mapa, custo=None):
+        """
+        Valida e converte uma linha do arquivo nos valores da tabela.
+        `custo` já convertido (conversão vetorizada do lote) dispensa converter_valor.
+
+        Raises:
+            ErroLinha: se a linha não puder ser importada
+        """
+        nome = self._texto(row, mapa['nome'], 'nome')
+        custo_str = self._valor(row, mapa['custo'])
+        if not nome or not custo_str:
+            raise ErroLinha("Nome ou custo em branco.")
+
+        if custo is None:
+            custo = self.converter_valor(custo_str)
+        if custo <= 0:
+            raise ErroLinha(f"Custo '{trecho(custo_str)}' inválido.", tipo='custo')
+
+        fornecedor_id = self.fornecedores.resolver(
+            fornecedor_id=self._valor(row, mapa.get('fornecedor_id')),
+            cnpj=self._valor(row, mapa.get('fornecedor_cnpj')),
+            nome=self._valor(row, mapa.get('fornecedor_nome'))
+        )
+
+        marca = self._texto(row, mapa['marca'], 'marca') or None
+        modelo = self._texto(row, mapa['modelo'], 'modelo') or None
+        return {
+            'nome': nome,
+            'marca': marca,
+            'modelo': modelo,
+            'unidade_medida': self._texto(row, mapa['unidade_medida'], 'unidade_medida') or 'UN',
+            'custo': custo,
+            'fornecedor_id': fornecedor_id,
+            'user_id': self.user_id,
+            'data_cadastro': datetime.utcnow(),
+            'tem_foto': False,
+            'tem_descricao': False,
+            'busca_normalizada': normalizar_busca(nome, marca, modelo)[:self._tabela.c.busca_normalizada.type.length],
+            'chave_natural': chave_natural_produto(nome, marca, modelo, fornecedor_id),
+            'ausente_na_lista': False,
+        }
+
+    @staticmethod
+    def _mudou(linha, valores):
+        if linha.ausente_na_lista:
+            return True
+        if round(float(linha.custo or 0), 2) != round(float(valores['custo']), 2):
+            return True
+        return any(getattr(linha, campo) != valores[campo] for campo in CAMPOS_ATUALIZAVEIS if campo != 'custo')
+
+    def _mesclar_existentes(self, lote):
+        """
+        Separa o lote em (novos, atualizações) casando as chaves com o catálogo numa consulta.
+        Linhas sem mudança só entram no total de inalteradas.
+        """
+        t = self._tabela
+        por_chave = {}
+        for valores in lote:
+            por_chave[valores['chave_natural']] = valores
+            if valores['fornecedor_id'] is not None:
+                self._fornecedores_vistos.add(valores['fornecedor_id'])
+        self.relatorio.inalterados += len(lote) - len(por_chave)
+
+        existentes = db.session.execute(
+            sa_select(t.c.id, t.c.chave_natural, t.c.ausente_na_lista, *[t.c[c] for c in CAMPOS_ATUALIZAVEIS])
+            .where(t.c.user_id == self.user_id, t.c.chave_natural.in_(list(por_chave)))
+        ).all()
+
+        casadas, atualizacoes = set(), []
+        for linha in existentes:
+            valores = por_chave[linha.chave_natural]
+            casadas.add(linha.chave_natural)
+            if self.marcar_ausentes:
+                self._vistos.add(linha.id)
+            if self._mudou(linha, valores):
+                atualizacoes.append({'b_id': linha.id, **{f'b_{c}': valores[c] for c in CAMPOS_ATUALIZAVEIS}})
+            else:
+                self.relatorio.inalterados += 1
+
+        novos = [valores for chave, valores in por_chave.items() if chave not in casadas]
+        return novos, atualizacoes
+
+    def _registrar_vistos(self, lote):
+        """Produtos já casados por linhas gravadas antes de uma retomada (só para marcar_ausentes)"""
+        t = self._tabela
+        chaves = {valores['chave_natural'] for valores in lote}
+        self._fornecedores_vistos.update(
+            valores['fornecedor_id'] for valores in lote if valores['fornecedor_id'] is not None
+        )
+        self._vistos.update(db.session.execute(
+            sa_select(t.c.id).where(t.c.user_id == self.user_id, t.c.chave_natural.in_(list(chaves)))
+        ).scalars())
+        if self.ao_progredir:
+            self.ao_progredir(self.relatorio)
+
+    def _gravar_lote(self, lote, primeira_linha, ultima_linha):
+        t = self._tabela
+        relatorio = self.relatorio
+        contadores = (relatorio.importados, relatorio.atualizados, relatorio.inalterados, relatorio.lotes)
+        try:
+            novos, atualizacoes = lote, []
+            if self.modo == 'atualizar':
+                novos, atualizacoes = self._mesclar_existentes(lote)
+            if atualizacoes:
+                db.session.execute(
+                    sa_update(t).where(t.c.id == bindparam('b_id')).values(
+                        ausente_na_lista=False, **{c: bindparam(f'b_{c}') for c in CAMPOS_ATUALIZAVEIS}
+                    ),
+                    atualizacoes
+                )
+            if novos:
+                db.session.execute(sa_insert(t), novos)
+            relatorio.importados += len(novos)
+            relatorio.atualizados += len(atualizacoes)
+            relatorio.lotes += 1
+            if self.antes_do_commit:
+                self.antes_do_commit(ultima_linha, relatorio)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            relatorio.importados, relatorio.atualizados, relatorio.inalterados, relatorio.lotes = contadores
+            relatorio.lotes_falhos += 1
+            relatorio.registrar_erro(f'{primeira_linha}-{ultima_linha}',
+                                     f'Erro ao gravar o lote: {str(getattr(e, "orig", e))[:300]}',
+                                     quantidade=len(lote))
+            # O lote perdido também avança o cursor: uma retomada não o grava pela metade
+            if self.antes_do_commit:
+                try:
+                    self.antes_do_commit(ultima_linha, relatorio)
+                    db.session.commit()
+                except Exception:
+                    # Sem o cursor gravado, uma retomada só tenta este lote de novo
+                    db.session.rollback()
+
+    def _marcar_ausentes(self):
+        """
+        Marca os produtos dos fornecedores da lista, cadastrados antes desta importação,
+        que não casaram com nenhuma linha; percorre o catálogo por faixas de id.
+        Produtos sem fornecedor nunca são marcados: linhas cujo fornecedor não foi
+        reconhecido não dizem a qual lista pertencem
+        """
+        t = self._tabela
+        for fornecedor_id in self._fornecedores_vistos:
+            filtro_fornecedor = t.c.fornecedor_id == fornecedor_id
+            ultimo_id = 0
+            while True:
+                ids = db.session.execute(
+                    sa_select(t.c.id).where(
+                        t.c.user_id == self.user_id, filtro_fornecedor, t.c.id > ultimo_id,
+                        t.c.data_cadastro < self._inicio, t.c.ausente_na_lista == false()
+                    ).order_by(t.c.id).limit(self.tamanho_lote)
+                ).scalars().all()
+                if not ids:
+                    break
+                ultimo_id = ids[-1]
+                ausentes = [produto_id for produto_id in ids if produto_id not in self._vistos]
+                if ausentes:
+                    db.session.execute(sa_update(t).where(t.c.id.in_(ausentes)).values(ausente_na_lista=True))
+                    db.session.commit()
+                    self.relatorio.ausentes += len(ausentes)
+                if self.ao_progredir:
+                    self.ao_progredir(self.relatorio)
+
+    def converter_lote(self, pendentes, mapa):
+        """
+        Converte um lote de linhas lidas (custos de uma vez, se houver conversor vetorizado).
+
+        Returns:
+            tuple: ([(número da linha, valores)], [(número da linha, row, exceção)])
+        """
+        custos = [None] * len(pendentes)
+        if self.converter_valores:
+            custos = self.converter_valores([self._valor(row, mapa['custo']) for _, row in pendentes]).tolist()
+
+        validas, erros = [], []
+        for (numero, row), custo in zip(pendentes, custos):
+            try:
+                validas.append((numero, self.converter_linha(row, mapa, custo)))
+            except Exception as e:
+                erros.append((numero, row, e))
+        return validas, erros
+
+    def _processar_lote(self, pendentes, mapa):
+        validas, erros = self.converter_lote(pendentes, mapa)
+        for numero, _, erro in erros:
+            self.relatorio.registrar_erro(numero, str(erro))
+        if validas:
+            self._gravar_lote([valores for _, valores in validas], pendentes[0][0], pendentes[-1][0])
+
+    def importar(self, linhas, mapa, retomar_apos=0):
+        """
+        Importa as linhas em lotes.
+
+        Args:
+            linhas: Iterável de (número da linha no arquivo, dict coluna -> texto)
+            mapa: Resultado de mapear_colunas para o cabeçalho do arquivo
+            retomar_apos: Última linha já gravada numa execução anterior; as linhas até ela
+                são puladas (os totais vêm do relatório informado no construtor)
+
+        Returns:
+            RelatorioImportacao: Totais e erros por linha
+        """
+        pendentes, revisitar = [], []
+        for numero, row in linhas:
+            if numero <= retomar_apos:
+                # Já gravada: só reconstrói os produtos casados, usados para marcar os ausentes
+                if self.marcar_ausentes:
+                    try:
+                        revisitar.append(self.converter_linha(row, mapa))
+                    except Exception:
+                        continue
+                    if len(revisitar) >= self.tamanho_lote:
+                        self._registrar_vistos(revisitar)
+                        revisitar = []
+                continue
+            if revisitar:
+                self._registrar_vistos(revisitar)
+                revisitar = []
+
+            self.relatorio.linhas_lidas += 1
+            pendentes.append((numero, row))
+            if len(pendentes) >= self.tamanho_lote:
+                self._processar_lote(pendentes, mapa)
+                pendentes = []
+
+        if pendentes:
+            self._processar_lote(pendentes, mapa)
+        if revisitar:
+            self._registrar_vistos(revisitar)
+
+        # Com um lote perdido, produtos presentes no arquivo seriam marcados por engano
+        if self.marcar_ausentes and not self.relatorio.lotes_falhos:
+            self._marcar_ausentes()
+        return self.relatorio
+
+
+# Chaves naturais guardadas pela simulação para achar linhas repetidas (limita a memória da passada)
+MAX_CHAVES_SIMULACAO = 200000
+
+
+class Ocorrencias:
+    """Total de um tipo de problema e as primeiras `maximo` ocorrências como amostra"""
+
+    def __init__(self, maximo=20):
+        self.maximo = maximo
+        self.total = 0
+        self.amostra = []
+
+    def registrar(self, linha, **detalhes):
+        self.total += 1
+        if len(self.amostra) < self.maximo:
+            self.amostra.append({'linha': linha, **detalhes})
+
+    def to_dict(self):
+        return {'total': self.total, 'amostra': self.amostra}
+
+
+class SimulacaoImportacao:
+    """
+    Validação de um arquivo de produtos sem gravar nada (simulação da importação).
+
+    Recursos:
+    - Uma passada pelas linhas do leitor, em lotes, com a mesma conversão do
+      ImportadorProdutos (custo vetorizado por lote, fornecedores resolvidos em memória)
+    - Custos inválidos, ids de fornecedor desconhecidos, fornecedores informados sem
+      correspondência, demais erros e linhas repetidas (mesma chave natural), cada um
+      com o total e uma amostra limitada
+    - Memória constante: um lote por vez e no máximo `max_chaves` chaves guardadas
+      para as repetidas (além disso a verificação fica parcial e o resultado avisa)
+    - Nenhuma escrita no catálogo: só a leitura dos fornecedores do usuário (o progresso
+      pode ser gravado por quem chama, via ao_progredir)
+    """
+
+    def __init__(self, user_id, converter_valor, converter_valores=None, fornecedores=None, tamanho_lote=1000,
+                 amostras=20, max_chaves=MAX_CHAVES_SIMULACAO, ao_progredir=None):
+        """
+        Inicializa a simulação.
+
+        Args:
+            user_id: Dono do catálogo (fornecedores válidos)
+            converter_valor: Conversão do custo por valor (ex.: processar_valor_monetario)
+            converter_valores: Conversão vetorizada opcional, por lote (ex.: processar_valores_monetarios)
+            fornecedores: MapaFornecedores do usuário (carregado aqui se omitido)
+            tamanho_lote: Linhas convertidas por vez
+            amostras: Ocorrências guardadas por tipo de problema
+            max_chaves: Chaves naturais guardadas para detectar linhas repetidas
+            ao_progredir: Função chamada com o total de linhas lidas após cada lote
+                (ex.: para gravar o progresso da tarefa em segundo plano)
+        """
+        self.importador = ImportadorProdutos(user_id, converter_valor, fornecedores=fornecedores,
+                                             tamanho_lote=tamanho_lote, converter_valores=converter_valores)
+        self.tamanho_lote = tamanho_lote
+        self.max_chaves = max_chaves
+        self.ao_progredir = ao_progredir
+        self.linhas_lidas = 0
+        self.linhas_validas = 0
+        self.custos_invalidos = Ocorrencias(amostras)
+        self.fornecedores_desconhecidos = Ocorrencias(amostras)
+        self.fornecedores_sem_correspondencia = Ocorrencias(amostras)
+        self.outros_erros = Ocorrencias(amostras)
+        self.repetidas = Ocorrencias(amostras)
+        self._primeira_linha_por_chave = {}
+        self._chaves_esgotadas = False
+
+    def _verificar_lote(self, pendentes, mapa):
+        validas, erros = self.importador.converter_lote(pendentes, mapa)
+        for numero, row, erro in erros:
+            tipo = getattr(erro, 'tipo', None)
+            if tipo == 'custo':
+                self.custos_invalidos.registrar(numero, valor=trecho(self.importador._valor(row, mapa['custo'])))
+            elif tipo == 'fornecedor':
+                self.fornecedores_desconhecidos.registrar(
+                    numero, valor=trecho(self.importador._valor(row, mapa.get('fornecedor_id'))))
+            else:
+                self.outros_erros.registrar(numero, erro=str(erro))
+
+        self.linhas_validas += len(validas)
+        informou_fornecedor = mapa.get('fornecedor_cnpj') or mapa.get('fornecedor_nome')
+        linhas = dict(pendentes)
+        for numero, valores in validas:
+            if informou_fornecedor and valores['fornecedor_id'] is None:
+                row = linhas[numero]
+                cnpj = self.importador._valor(row, mapa.get('fornecedor_cnpj'))
+                nome = self.importador._valor(row, mapa.get('fornecedor_nome'))
+                if cnpj or nome:
+                    self.fornecedores_sem_correspondencia.registrar(numero, cnpj=trecho(cnpj), nome=trecho(nome))
+
+            # 64 bits do hash bastam para distinguir as linhas e ocupam menos que o texto
+            chave = int(valores['chave_natural'][:16], 16)
+            primeira = self._primeira_linha_por_chave.get(chave)
+            if primeira is not None:
+                self.repetidas.registrar(numero, primeira_linha=primeira, nome=valores['nome'])
+            elif len(self._primeira_linha_por_chave) < self.max_chaves:
+                self._primeira_linha_por_chave[chave] = numero
+            else:
+                self._chaves_esgotadas = True
+
+        if self.ao_progredir:
+            self.ao_progredir(self.linhas_lidas)
+
+    def validar(self, linhas, cabecalho):
+        """
+        Percorre o arquivo uma vez e resume o que a importação faria.
+
+        Args:
+            linhas: Iterável de (número da linha no arquivo, dict coluna -> texto)
+            cabecalho: Nomes das colunas do arquivo
+
+        Returns:
+            dict: Mapeamento das colunas, contagens e os problemas encontrados (total e amostra)
+        """
+        mapa = mapear_colunas(cabecalho)
+        pendentes = []
+        for numero, row in linhas:
+            self.linhas_lidas += 1
+            pendentes.append((numero, row))
+            if len(pendentes) >= self.tamanho_lote:
+                self._verificar_lote(pendentes, mapa)
+                pendentes = []
+        if pendentes:
+            self._verificar_lote(pendentes, mapa)
+
+        mapeadas = {coluna for coluna in mapa.values() if coluna}
+        return {
+            'colunas': [coluna for coluna in cabecalho if coluna],
+            'mapeamento': mapa,
+            'colunas_ignoradas': [coluna for coluna in cabecalho if coluna and coluna not in mapeadas],
+            'linhas_lidas': self.linhas_lidas,
+            'linhas_validas': self.linhas_validas,
+            'linhas_com_erro': self.linhas_lidas - self.linhas_validas,
+            'custos_invalidos': self.custos_invalidos.to_dict(),
+            'fornecedores_desconhecidos': self.fornecedores_desconhecidos.to_dict(),
+            'fornecedores_sem_correspondencia': self.fornecedores_sem_correspondencia.to_dict(),
+            'outros_erros': self.outros_erros.to_dict(),
+            'repetidas': self.repetidas.to_dict(),
+            'repetidas_verificacao_parcial': self._chaves_esgotadas,
+        }
@@ -0,0 +1,188 @@
+"""
+Instrumentação de SQL por Requisição
+Conta as consultas e o tempo de banco de cada requisição pelos eventos do engine,
+agrupa as consultas pela forma (SQL sem valores) e registra no log as formas
+repetidas acima do limite, com a rota: é o sintoma de N+1 (uma consulta por linha)
+
+Nos testes, orcamento_consultas() limita as consultas de um trecho:
+    with app.instrumentacao_sql.orcamento_consultas(5):
+        client.get('/produtos_fornecedores')
+"""
+
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_MARCADORES = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_POSTCOMPILE = re.compile(r'\(?__\[POSTCOMPILE_\w+\]\)?')
+_ESPACOS = re.compile(r'\s+')
+
+
+def forma_consulta(sql):
+    """
+    SQL normalizado para agrupar execuções da mesma consulta com valores diferentes.
+
+    Literais e marcadores viram '?', listas de IN e blocos VALUES viram '(?)'
+    """
+    forma = _POSTCOMPILE.sub('(?)', sql)
+    forma = _LITERAIS.sub('?', forma)
+    forma = _MARCADORES.sub('?', forma)
+    forma = _LISTAS.sub('(?)', forma)
+    return _ESPACOS.sub(' ', forma).strip()
+
+
+class OrcamentoExcedido(AssertionError):
+    """O trecho medido executou mais consultas que o orçamento"""
+
+
+class ContadorConsultas:
+    """Consultas, tempo de banco e repetições por forma de um trecho medido"""
+
+    def __init__(self):
+        self.total = 0
+        self.tempo_ms = 0.0
+        self.formas = Counter()
+
+    def registrar(self, forma, duracao_ms):
+        self.total += 1
+        self.tempo_ms += duracao_ms
+        self.formas[forma] += 1
+
+    def repetidas(self, limite):
+        """Formas executadas `limite` vezes ou mais, da mais repetida para a menos"""
+        return [(forma, n) for forma, n in self.formas.most_common() if n >= limite]
+
+
+class InstrumentacaoSQL:
+    """
+    Métricas de SQL por requisição.
+
+    Recursos:
+    - Eventos before/after_cursor_execute do engine medem cada consulta da thread
+    - Por requisição: total de consultas, tempo de banco e formas repetidas no log,
+      com o endpoint e o método (sem custo fora dos trechos medidos)
+    - Cabeçalho Server-Timing opcional (db;dur=...;desc="N consultas") para o navegador
+    - Orçamento de consultas para testes com orcamento_consultas(maximo)
+    """
+
+    def __init__(self, app, limite_repeticoes=5, server_timing=False):
+        """
+        Inicializa a instrumentação e registra os hooks da aplicação.
+
+        Args:
+            app: Aplicação Flask
+            limite_repeticoes: Execuções da mesma forma de consulta, numa requisição,
+                a partir das quais ela é registrada como suspeita de N+1
+            server_timing: Se True, adiciona o cabeçalho Server-Timing às respostas
+        """
+        self.app = app
+        self.limite_repeticoes = limite_repeticoes
+        self.server_timing = server_timing
+        # Contadores ativos por thread: a requisição e os orçamentos abertos nos testes
+        self._local = threading.local()
+
+        event.listen(Engine, 'before_cursor_execute', self._antes_execucao)
+        event.listen(Engine, 'after_cursor_execute', self._depois_execucao)
+        app.before_request(self._iniciar_requisicao)
+        app.after_request(self._finalizar_resposta)
+        app.teardown_request(self._encerrar_requisicao)
+
+    # ------------------------------------------------------------------
+    # Contadores ativos na thread
+    # ------------------------------------------------------------------
+
+    def _ativos(self):
+        ativos = getattr(self._local, 'contadores', None)
+        if ativos is None:
+            ativos = self._local.contadores = []
+        return ativos
+
+    @contextmanager
+    def medir(self):
+        """Conta as consultas executadas nesta thread dentro do bloco"""
+        contador = ContadorConsultas()
+        ativos = self._ativos()
+        ativos.append(contador)
+        try:
+            yield contador
+        finally:
+            ativos.remove(contador)
+
+    @contextmanager
+    def orcamento_consultas(self, maximo):
+        """
+        Falha se o bloco executar mais de `maximo` consultas (para testes).
+
+        Raises:
+            OrcamentoExcedido: com as formas mais repetidas na mensagem
+        """
+        with self.medir() as contador:
+            yield contador
+        if contador.total > maximo:
+            detalhes = '\n'.join(f'  {n}x {forma[:200]}' for forma, n in contador.formas.most_common(5))
+            raise OrcamentoExcedido(f'{contador.total} consultas (orçamento: {maximo})\n{detalhes}')
+
+    # ------------------------------------------------------------------
+    # Eventos do engine
+    # ------------------------------------------------------------------
+
+    # O início fica no contexto da execução, descartado com ela: uma consulta que falha
+    # (after_cursor_execute não é chamado) não deixa resto na conexão do pool
+
+    def _antes_execucao(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None and self._ativos():
+            context._instrumentacao_inicio = time.perf_counter()
+
+    def _depois_execucao(self, conn, cursor, statement, parameters, context, executemany):
+        ativos = self._ativos()
+        inicio = getattr(context, '_instrumentacao_inicio', None)
+        if not ativos or inicio is None:
+            return
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        forma = forma_consulta(statement)
+        for contador in ativos:
+            contador.registrar(forma, duracao_ms)
+
+    # ------------------------------------------------------------------
+    # Hooks da requisição
+    # ------------------------------------------------------------------
+
+    def _iniciar_requisicao(self):
+        contador = ContadorConsultas()
+        self._ativos().append(contador)
+        self._local.requisicao = contador
+
+    def _finalizar_resposta(self, resposta):
+        contador = getattr(self._local, 'requisicao', None)
+        if self.server_timing and contador is not None:
+            resposta.headers.add('Server-Timing',
+                                 f'db;dur={contador.tempo_ms:.1f};desc="{contador.total} consultas"')
+        return resposta
+
+    def _encerrar_requisicao(self, erro=None):
+        contador = getattr(self._local, 'requisicao', None)
+        if contador is None:
+            return
+        self._local.requisicao = None
+        ativos = self._ativos()
+        if contador in ativos:
+            ativos.remove(contador)
+
+        rota = f'{request.method} {request.endpoint or request.path}'
+        self.app.logger.debug(f"SQL {rota}: {contador.total} consultas, {contador.tempo_ms:.1f} ms")
+
+        repetidas = contador.repetidas(self.limite_repeticoes)
+        if repetidas:
+            formas = '; '.join(f'{n}x {forma[:200]}' for forma, n in repetidas[:3])
+            self.app.logger.warning(
+                f"⚠️ Possível N+1 em {rota}: {contador.total} consultas, "
+                f"{contador.tempo_ms:.1f} ms de banco - {formas}"
+            )
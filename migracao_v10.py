@@ -0,0 +1,80 @@
+"""
+Script de Migração V10 - Agendador de tarefas de manutenção
+Cria a tabela de trava de liderança do agendador (agendador_lider) e os índices
+de expires_at usados na exclusão em lote das sessões expiradas das calculadoras
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v10.py
+"""
+
+from app import app, db
+from models import LiderAgendador
+from sqlalchemy import text
+
+
+def executar_migracao():
+    """
+    Executa a migração criando a tabela da trava e os índices
+    """
+    print("="*60)
+    print("MIGRAÇÃO V10 - Agendador de tarefas")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            LiderAgendador.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ Tabela agendador_lider verificada")
+
+            comandos = [
+                "CREATE INDEX ix_calculadora_sessoes_expires_at ON calculadora_sessoes (expires_at)",
+                "CREATE INDEX ix_calculadora_sessoes_servicos_expires_at ON calculadora_sessoes_servicos (expires_at)",
+            ]
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se o índice já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V10 - AGENDADOR DE TAREFAS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,145 @@
+"""
+Script de Migração V11 - Blobs comprimidos dos cálculos
+Adiciona as colunas comprimidas (codec_blob: zlib + cabeçalho versionado com os totais)
+em svc_outputs, servico_legislacao e historico_calculo_legislacao e recomprime
+em lotes os JSONs já gravados em texto
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v11.py
+"""
+
+import json
+
+from app import app, db
+from models import ServicoLegislacao, HistoricoCalculoLegislacao
+from models_nova_lei import SvcOutput
+from codec_blob import codificar
+from sqlalchemy import text, bindparam, select as sa_select, update as sa_update
+
+TAMANHO_LOTE = 200
+
+# (modelo, coluna de texto legada, coluna comprimida, valor que fica no texto, default do json.dumps)
+COLUNAS = [
+    (SvcOutput, 'resultado_json', 'resultado_comprimido', None, None),
+    (ServicoLegislacao, 'dados_calculo_completo', 'dados_calculo_comprimido', None, str),
+    (HistoricoCalculoLegislacao, 'dados_entrada', 'dados_entrada_comprimido', '', str),
+    (HistoricoCalculoLegislacao, 'dados_calculo', 'dados_calculo_comprimido', '', str),
+]
+
+
+def recomprimir(modelo, coluna_texto, coluna_blob, texto_restante, default):
+    """Comprime em lotes por id os JSONs em texto que ainda não têm blob"""
+    tabela = modelo.__table__
+    texto = tabela.c[coluna_texto]
+    blob = tabela.c[coluna_blob]
+    versao_schema = getattr(modelo, 'VERSAO_SCHEMA_RESULTADO', getattr(modelo, 'VERSAO_SCHEMA_CALCULO', 1))
+    campos_cabecalho = getattr(modelo, 'CAMPOS_TOTAIS_RESULTADO', None)
+    atualizacao = (
+        sa_update(tabela)
+        .where(tabela.c.id == bindparam('b_id'))
+        .values({coluna_blob: bindparam('b_blob'), coluna_texto: texto_restante})
+    )
+
+    ultimo_id = 0
+    total = bytes_antes = bytes_depois = 0
+    while True:
+        linhas = db.session.execute(
+            sa_select(tabela.c.id, texto)
+            .where(tabela.c.id > ultimo_id, blob.is_(None), texto.isnot(None), texto != '')
+            .order_by(tabela.c.id)
+            .limit(TAMANHO_LOTE)
+        ).all()
+        if not linhas:
+            break
+
+        lote = []
+        for id_linha, conteudo in linhas:
+            try:
+                dados = json.loads(conteudo)
+            except ValueError:
+                print(f"⚠ {tabela.name} {id_linha}: JSON inválido em {coluna_texto} (mantido em texto)")
+                continue
+            comprimido = codificar(dados, versao_schema=versao_schema,
+                                   campos_cabecalho=campos_cabecalho, default=default)
+            bytes_antes += len(conteudo.encode('utf-8'))
+            bytes_depois += len(comprimido)
+            lote.append({'b_id': id_linha, 'b_blob': comprimido})
+
+        if lote:
+            db.session.execute(atualizacao, lote)
+        db.session.commit()
+
+        ultimo_id = linhas[-1][0]
+        total += len(lote)
+        print(f"✓ {tabela.name}.{coluna_texto}: {total} registro(s) "
+              f"({bytes_antes / 1024:.0f} KB → {bytes_depois / 1024:.0f} KB)")
+
+
+def executar_migracao():
+    """
+    Executa a migração adicionando as colunas e recomprimindo os dados existentes
+    """
+    print("="*60)
+    print("MIGRAÇÃO V11 - Blobs comprimidos dos cálculos")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            tipo_blob = 'MEDIUMBLOB' if db.engine.dialect.name == 'mysql' else 'BLOB'
+            comandos = [
+                f"ALTER TABLE {modelo.__tablename__} ADD COLUMN {coluna_blob} {tipo_blob}"
+                for modelo, _, coluna_blob, _, _ in COLUNAS
+            ]
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se a coluna já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            print("\nRecomprimindo dados existentes...")
+            for coluna in COLUNAS:
+                recomprimir(*coluna)
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V11 - BLOBS COMPRIMIDOS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,57 @@
+"""
+Script de Migração V12 - Tarefas em segundo plano
+Cria a tabela tarefas_segundo_plano, onde as exclusões em massa do catálogo
+gravam status, progresso e o cursor do último lote processado
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v12.py
+"""
+
+from app import app, db
+from models import TarefaSegundoPlano
+
+
+def executar_migracao():
+    """
+    Executa a migração criando a tabela de tarefas
+    """
+    print("="*60)
+    print("MIGRAÇÃO V12 - Tarefas em segundo plano")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            TarefaSegundoPlano.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ Tabela tarefas_segundo_plano verificada")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V12 - TAREFAS EM SEGUNDO PLANO".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
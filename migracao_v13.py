@@ -0,0 +1,60 @@
+"""
+Script de Migração V13 - Arquivo de propostas encerradas
+Cria as tabelas *_arquivo (propostas, resumos, itens, lotes, serviços e despesas),
+para onde o agendador move as propostas encerradas mais antigas que ARQUIVO_PROPOSTAS_DIAS
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v13.py
+"""
+
+from app import app, db
+from models import TABELAS_ARQUIVO
+
+
+def executar_migracao():
+    """
+    Executa a migração criando as tabelas de arquivo
+    """
+    print("="*60)
+    print("MIGRAÇÃO V13 - Arquivo de propostas encerradas")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            for tabela in TABELAS_ARQUIVO.values():
+                tabela.create(bind=db.engine, checkfirst=True)
+                print(f"✓ Tabela {tabela.name} verificada")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+            print("\nAs propostas serão arquivadas aos poucos pelo agendador")
+            print(f"(encerradas há mais de {app.config.get('ARQUIVO_PROPOSTAS_DIAS', 365)} dias).")
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V13 - ARQUIVO DE PROPOSTAS ENCERRADAS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
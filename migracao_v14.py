@@ -0,0 +1,116 @@
+"""
+Script de Migração V14 - Chave natural do catálogo para importação com atualização
+Adiciona chave_natural (hash de nome + marca + modelo + fornecedor) e ausente_na_lista
+em produtos_fornecedores, cria o índice (user_id, chave_natural) e calcula em lotes
+a chave dos produtos já cadastrados
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v14.py
+"""
+
+from app import app, db
+from models import ProdutosFornecedores, chave_natural_produto
+from sqlalchemy import text, bindparam, select as sa_select, update as sa_update
+
+TAMANHO_LOTE = 1000
+
+
+def calcular_chaves():
+    """Preenche em lotes a chave_natural dos produtos que ainda não a têm"""
+    tabela = ProdutosFornecedores.__table__
+    atualizacao = (
+        sa_update(tabela)
+        .where(tabela.c.id == bindparam('b_id'))
+        .values(chave_natural=bindparam('b_chave'))
+    )
+
+    ultimo_id = 0
+    total = 0
+    while True:
+        linhas = db.session.execute(
+            sa_select(tabela.c.id, tabela.c.nome, tabela.c.marca, tabela.c.modelo, tabela.c.fornecedor_id)
+            .where(tabela.c.id > ultimo_id, tabela.c.chave_natural.is_(None))
+            .order_by(tabela.c.id)
+            .limit(TAMANHO_LOTE)
+        ).all()
+        if not linhas:
+            break
+
+        db.session.execute(atualizacao, [
+            {'b_id': id_produto, 'b_chave': chave_natural_produto(nome, marca, modelo, fornecedor_id)}
+            for id_produto, nome, marca, modelo, fornecedor_id in linhas
+        ])
+        db.session.commit()
+
+        ultimo_id = linhas[-1][0]
+        total += len(linhas)
+        print(f"✓ produtos_fornecedores: {total} chave(s) calculada(s)")
+
+
+def executar_migracao():
+    """
+    Executa a migração adicionando as colunas e o índice e calculando as chaves
+    """
+    print("="*60)
+    print("MIGRAÇÃO V14 - Chave natural do catálogo")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            comandos = [
+                "ALTER TABLE produtos_fornecedores ADD COLUMN chave_natural VARCHAR(40)",
+                "ALTER TABLE produtos_fornecedores ADD COLUMN ausente_na_lista BOOLEAN NOT NULL DEFAULT 0",
+                "CREATE INDEX ix_produtos_fornecedores_user_chave ON produtos_fornecedores (user_id, chave_natural)",
+            ]
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se a coluna ou o índice já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            print("\nCalculando chaves dos produtos existentes...")
+            calcular_chaves()
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V14 - CHAVE NATURAL DO CATÁLOGO".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,81 @@
+"""
+Script de Migração V15 - Retomada de tarefas em segundo plano
+Adiciona resultado (JSON com o relatório parcial da importação; MEDIUMTEXT no MySQL)
+em tarefas_segundo_plano e o índice (status, atualizado_em) usado para localizar as tarefas paradas
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v15.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+
+def executar_migracao():
+    """
+    Executa a migração adicionando a coluna e o índice
+    """
+    print("="*60)
+    print("MIGRAÇÃO V15 - Retomada de tarefas em segundo plano")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            # O relatório é regravado a cada lote: no MySQL, TEXT (64 KB) não comporta os erros guardados
+            mysql = db.engine.dialect.name == 'mysql'
+            comandos = [
+                f"ALTER TABLE tarefas_segundo_plano ADD COLUMN resultado {'MEDIUMTEXT' if mysql else 'TEXT'}",
+                "CREATE INDEX ix_tarefas_segundo_plano_status_atualizado ON tarefas_segundo_plano (status, atualizado_em)",
+            ]
+            if mysql:
+                # Bancos em que a coluna já foi criada como TEXT
+                comandos.append("ALTER TABLE tarefas_segundo_plano MODIFY COLUMN resultado MEDIUMTEXT")
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se a coluna ou o índice já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V15 - RETOMADA DE TAREFAS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,57 @@
+"""
+Script de Migração V16 - Calendário do agendador de tarefas
+Cria a tabela agendador_execucoes com a próxima execução de cada tarefa periódica,
+para que um novo líder do agendador continue o calendário do anterior
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v16.py
+"""
+
+from app import app, db
+from models import ExecucaoAgendador
+
+
+def executar_migracao():
+    """
+    Executa a migração criando a tabela do calendário
+    """
+    print("="*60)
+    print("MIGRAÇÃO V16 - Calendário do agendador")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            ExecucaoAgendador.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ Tabela agendador_execucoes verificada")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V16 - CALENDÁRIO DO AGENDADOR".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
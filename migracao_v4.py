@@ -0,0 +1,107 @@
+"""
+Script de Migração V4 - Flags e contadores do catálogo de produtos
+Adiciona as colunas tem_foto/tem_descricao em produtos_fornecedores,
+preenche as flags a partir de produto_detalhes e recalcula os contadores por usuário
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v4.py
+"""
+
+from app import app, db
+from models import ContadoresCatalogo, recalcular_contadores_catalogo
+from sqlalchemy import text
+
+
+def executar_migracao():
+    """
+    Executa a migração adicionando colunas, índices e preenchendo os dados
+    """
+    print("="*60)
+    print("MIGRAÇÃO V4 - Flags e contadores do catálogo")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            comandos = [
+                "ALTER TABLE produtos_fornecedores ADD COLUMN tem_foto BOOLEAN NOT NULL DEFAULT 0",
+                "ALTER TABLE produtos_fornecedores ADD COLUMN tem_descricao BOOLEAN NOT NULL DEFAULT 0",
+                "CREATE INDEX ix_produtos_fornecedores_user_foto ON produtos_fornecedores (user_id, tem_foto)",
+                "CREATE INDEX ix_produtos_fornecedores_user_descricao ON produtos_fornecedores (user_id, tem_descricao)",
+            ]
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se a coluna/índice já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            # Tabela nova de contadores
+            ContadoresCatalogo.__table__.create(bind=db.engine, checkfirst=True)
+
+            print("\nPreenchendo flags a partir de produto_detalhes...")
+            db.session.execute(text("""
+                UPDATE produtos_fornecedores SET
+                    tem_foto = CASE WHEN EXISTS (
+                        SELECT 1 FROM produto_detalhes d
+                        WHERE d.produto_id = produtos_fornecedores.id
+                          AND d.foto_url IS NOT NULL AND d.foto_url <> ''
+                    ) THEN 1 ELSE 0 END,
+                    tem_descricao = CASE WHEN EXISTS (
+                        SELECT 1 FROM produto_detalhes d
+                        WHERE d.produto_id = produtos_fornecedores.id
+                          AND d.descricao_detalhada IS NOT NULL AND d.descricao_detalhada <> ''
+                    ) THEN 1 ELSE 0 END
+            """))
+            db.session.commit()
+
+            print("Recalculando contadores por usuário...")
+            user_ids = [row[0] for row in db.session.execute(text(
+                "SELECT DISTINCT user_id FROM produtos_fornecedores "
+                "UNION SELECT DISTINCT user_id FROM fornecedor_produtos"
+            ))]
+            for user_id in user_ids:
+                recalcular_contadores_catalogo(user_id)
+            print(f"✓ {len(user_ids)} contador(es) recalculado(s)")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V4 - CATÁLOGO DE PRODUTOS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
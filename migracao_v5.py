@@ -0,0 +1,92 @@
+"""
+Script de Migração V5 - Resumo das propostas de produtos
+Cria a tabela resumo_proposta, o índice (user_id, status) em calculadora_passo1
+e preenche o resumo de todas as propostas existentes em lotes
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v5.py
+"""
+
+from app import app, db
+from models import CalculadoraPasso1, ResumoProposta, atualizar_resumo_proposta
+from sqlalchemy import text
+
+TAMANHO_LOTE = 500
+
+
+def executar_migracao():
+    """
+    Executa a migração criando a tabela de resumo e preenchendo os dados
+    """
+    print("="*60)
+    print("MIGRAÇÃO V5 - Resumo das propostas")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            ResumoProposta.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ Tabela resumo_proposta verificada")
+
+            try:
+                db.session.execute(text(
+                    "CREATE INDEX ix_calculadora_passo1_user_status ON calculadora_passo1 (user_id, status)"
+                ))
+                db.session.commit()
+                print("✓ Índice ix_calculadora_passo1_user_status criado")
+            except Exception as e:
+                db.session.rollback()
+                erro = str(e).lower()
+                if "duplicate" in erro or "already exists" in erro:
+                    print("⚠ Índice ix_calculadora_passo1_user_status já existe (ignorado)")
+                else:
+                    raise
+
+            print("\nPreenchendo resumos...")
+            ultimo_id = 0
+            total = 0
+            while True:
+                propostas = CalculadoraPasso1.query.filter(
+                    CalculadoraPasso1.id > ultimo_id
+                ).order_by(CalculadoraPasso1.id).limit(TAMANHO_LOTE).all()
+                if not propostas:
+                    break
+
+                for proposta in propostas:
+                    atualizar_resumo_proposta(proposta)
+                db.session.commit()
+
+                ultimo_id = propostas[-1].id
+                total += len(propostas)
+                print(f"✓ {total} proposta(s) processada(s)")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V5 - RESUMO DAS PROPOSTAS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,55 @@
+"""
+Script de Migração V6 - Índice da paginação keyset do catálogo
+Cria o índice (user_id, nome, id) em produtos_fornecedores, usado pela
+listagem paginada por cursor
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v6.py
+"""
+
+from app import app, db
+from sqlalchemy import text
+
+
+def executar_migracao():
+    """
+    Executa a migração criando o índice
+    """
+    print("="*60)
+    print("MIGRAÇÃO V6 - Índice da paginação do catálogo")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            db.session.execute(text(
+                "CREATE INDEX ix_produtos_fornecedores_user_nome_id "
+                "ON produtos_fornecedores (user_id, nome, id)"
+            ))
+            db.session.commit()
+            print("✓ Índice ix_produtos_fornecedores_user_nome_id criado")
+
+        except Exception as e:
+            db.session.rollback()
+            erro = str(e).lower()
+            if "duplicate" in erro or "already exists" in erro:
+                print("⚠ Índice já existe (ignorado)")
+                return True
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    print("\n" + "="*60)
+    print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+    print("="*60)
+    return True
+
+
+if __name__ == '__main__':
+    resposta = input("Deseja executar a migração V6? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
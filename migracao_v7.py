@@ -0,0 +1,123 @@
+"""
+Script de Migração V7 - Busca sem acentos no catálogo e nos itens das propostas
+Adiciona a coluna busca_normalizada em produtos_fornecedores e produto,
+preenche o texto normalizado em lotes e instala o índice de texto
+(FTS5 no SQLite, FULLTEXT no MySQL)
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v7.py
+"""
+
+from app import app, db, indice_busca_catalogo, indice_busca_itens
+from models import Produto, ProdutosFornecedores, normalizar_busca
+from sqlalchemy import text, bindparam, select as sa_select, update as sa_update
+
+TAMANHO_LOTE = 2000
+
+
+def preencher_busca_normalizada(modelo):
+    """Preenche busca_normalizada em lotes por id, com a mesma normalização do evento de flush"""
+    tabela = modelo.__table__
+    tamanho = tabela.c.busca_normalizada.type.length
+    colunas = [tabela.c[campo] for campo in modelo.CAMPOS_BUSCA]
+    atualizacao = (
+        sa_update(tabela)
+        .where(tabela.c.id == bindparam('b_id'))
+        .values(busca_normalizada=bindparam('b_texto'))
+    )
+
+    ultimo_id = 0
+    total = 0
+    while True:
+        linhas = db.session.execute(
+            sa_select(tabela.c.id, *colunas)
+            .where(tabela.c.id > ultimo_id)
+            .order_by(tabela.c.id)
+            .limit(TAMANHO_LOTE)
+        ).all()
+        if not linhas:
+            break
+
+        db.session.execute(atualizacao, [
+            {'b_id': linha[0], 'b_texto': normalizar_busca(*linha[1:])[:tamanho]}
+            for linha in linhas
+        ])
+        db.session.commit()
+
+        ultimo_id = linhas[-1][0]
+        total += len(linhas)
+        print(f"✓ {tabela.name}: {total} registro(s) normalizado(s)")
+
+
+def executar_migracao():
+    """
+    Executa a migração adicionando a coluna, preenchendo os dados e criando o índice de texto
+    """
+    print("="*60)
+    print("MIGRAÇÃO V7 - Busca sem acentos")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            comandos = [
+                "ALTER TABLE produtos_fornecedores ADD COLUMN busca_normalizada VARCHAR(500)",
+                "ALTER TABLE produto ADD COLUMN busca_normalizada VARCHAR(600)",
+            ]
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se a coluna já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            print("\nPreenchendo texto normalizado...")
+            preencher_busca_normalizada(ProdutosFornecedores)
+            preencher_busca_normalizada(Produto)
+
+            print("\nInstalando índices de texto...")
+            indice_busca_catalogo.instalar()
+            indice_busca_itens.instalar()
+            print(f"✓ Modo de busca: {indice_busca_catalogo.modo()}")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V7 - BUSCA SEM ACENTOS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,71 @@
+"""
+Script de Migração V8 - Agregado das avaliações de fornecedores
+Cria a tabela resumo_avaliacao_fornecedor e preenche quantidade e somas
+das notas de cada fornecedor a partir de avaliacao_fornecedor
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v8.py
+"""
+
+from app import app, db
+from models import ResumoAvaliacaoFornecedor
+from sqlalchemy import text
+
+
+def executar_migracao():
+    """
+    Executa a migração criando a tabela do agregado e preenchendo os dados
+    """
+    print("="*60)
+    print("MIGRAÇÃO V8 - Agregado das avaliações de fornecedores")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            ResumoAvaliacaoFornecedor.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ Tabela resumo_avaliacao_fornecedor verificada")
+
+            print("\nPreenchendo agregados...")
+            db.session.execute(text("DELETE FROM resumo_avaliacao_fornecedor"))
+            resultado = db.session.execute(text("""
+                INSERT INTO resumo_avaliacao_fornecedor
+                    (fornecedor_id, total_avaliacoes, soma_prazo, soma_qualidade, soma_preco, atualizado_em)
+                SELECT fornecedor_id, COUNT(id), SUM(nota_prazo), SUM(nota_qualidade), SUM(nota_preco),
+                       CURRENT_TIMESTAMP
+                FROM avaliacao_fornecedor
+                GROUP BY fornecedor_id
+            """))
+            db.session.commit()
+            print(f"✓ {resultado.rowcount} fornecedor(es) com avaliações")
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V8 - AVALIAÇÕES DE FORNECEDORES".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -0,0 +1,135 @@
+"""
+Script de Migração V9 - Sessões das calculadoras com snapshot comprimido e deltas
+Adiciona as colunas de snapshot/versão em calculadora_sessoes e calculadora_sessoes_servicos,
+cria as tabelas de deltas (JSON Patch) e comprime em lotes as sessões já gravadas em texto
+
+Execute este script ANTES de acessar o sistema:
+python3 migracao_v9.py
+"""
+
+import json
+
+from app import app, db
+from models import (CalculadoraSessao, CalculadoraSessaoServicos,
+                    CalculadoraSessaoDelta, CalculadoraSessaoServicosDelta)
+from sessao_incremental import comprimir_json
+from sqlalchemy import text, bindparam, select as sa_select, update as sa_update
+
+TAMANHO_LOTE = 500
+
+
+def comprimir_sessoes(modelo):
+    """Converte em lotes o dados_sessao (texto JSON) das sessões antigas para o snapshot comprimido"""
+    tabela = modelo.__table__
+    atualizacao = (
+        sa_update(tabela)
+        .where(tabela.c.id == bindparam('b_id'))
+        .values(dados_comprimidos=bindparam('b_blob'), dados_sessao='')
+    )
+
+    ultimo_id = 0
+    total = 0
+    while True:
+        linhas = db.session.execute(
+            sa_select(tabela.c.id, tabela.c.dados_sessao)
+            .where(tabela.c.id > ultimo_id, tabela.c.dados_comprimidos.is_(None))
+            .order_by(tabela.c.id)
+            .limit(TAMANHO_LOTE)
+        ).all()
+        if not linhas:
+            break
+
+        lote = []
+        for id_sessao, dados_sessao in linhas:
+            try:
+                dados = json.loads(dados_sessao) if dados_sessao else {}
+            except ValueError:
+                print(f"⚠ {tabela.name} {id_sessao}: JSON inválido (mantido em texto)")
+                continue
+            lote.append({'b_id': id_sessao, 'b_blob': comprimir_json(dados)})
+
+        if lote:
+            db.session.execute(atualizacao, lote)
+        db.session.commit()
+
+        ultimo_id = linhas[-1][0]
+        total += len(lote)
+        print(f"✓ {tabela.name}: {total} sessão(ões) comprimida(s)")
+
+
+def executar_migracao():
+    """
+    Executa a migração adicionando as colunas, criando as tabelas de deltas e comprimindo as sessões
+    """
+    print("="*60)
+    print("MIGRAÇÃO V9 - Sessões com snapshot comprimido e deltas")
+    print("="*60)
+
+    with app.app_context():
+        try:
+            tipo_blob = 'MEDIUMBLOB' if db.engine.dialect.name == 'mysql' else 'BLOB'
+            comandos = []
+            for tabela in ('calculadora_sessoes', 'calculadora_sessoes_servicos'):
+                comandos += [
+                    f"ALTER TABLE {tabela} ADD COLUMN dados_comprimidos {tipo_blob}",
+                    f"ALTER TABLE {tabela} ADD COLUMN versao INTEGER NOT NULL DEFAULT 0",
+                    f"ALTER TABLE {tabela} ADD COLUMN versao_snapshot INTEGER NOT NULL DEFAULT 0",
+                    f"ALTER TABLE {tabela} ADD COLUMN tamanho_deltas INTEGER NOT NULL DEFAULT 0",
+                ]
+
+            print("\nExecutando comandos SQL...")
+
+            for i, comando in enumerate(comandos, 1):
+                try:
+                    db.session.execute(text(comando))
+                    db.session.commit()
+                    print(f"✓ Comando {i}/{len(comandos)} executado com sucesso")
+                except Exception as e:
+                    db.session.rollback()
+                    # Se a coluna já existe, ignora o erro
+                    erro = str(e).lower()
+                    if "duplicate" in erro or "already exists" in erro:
+                        print(f"⚠ Comando {i}/{len(comandos)} - Já existe (ignorado)")
+                    else:
+                        print(f"✗ Erro no comando {i}/{len(comandos)}: {e}")
+                        raise
+
+            CalculadoraSessaoDelta.__table__.create(bind=db.engine, checkfirst=True)
+            CalculadoraSessaoServicosDelta.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ Tabelas de deltas verificadas")
+
+            print("\nComprimindo sessões existentes...")
+            comprimir_sessoes(CalculadoraSessao)
+            comprimir_sessoes(CalculadoraSessaoServicos)
+
+            print("\n" + "="*60)
+            print("✅ MIGRAÇÃO CONCLUÍDA COM SUCESSO!")
+            print("="*60)
+
+        except Exception as e:
+            db.session.rollback()
+            print("\n" + "="*60)
+            print("❌ ERRO NA MIGRAÇÃO")
+            print("="*60)
+            print(f"\nErro: {e}")
+            return False
+
+    return True
+
+
+if __name__ == '__main__':
+    print("\n")
+    print("╔" + "="*58 + "╗")
+    print("║" + " "*58 + "║")
+    print("║" + "  MIGRAÇÃO V9 - SESSÕES INCREMENTAIS".center(58) + "║")
+    print("║" + " "*58 + "║")
+    print("╚" + "="*58 + "╝")
+    print("\n")
+
+    resposta = input("Deseja executar a migração? (s/n): ")
+
+    if resposta.lower() in ['s', 'sim', 'y', 'yes']:
+        executar_migracao()
+    else:
+        print("\nMigração cancelada.")
+        print("Execute manualmente quando estiver pronto.")
@@ -1,11 +1,25 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime, timedelta
+from decimal import Decimal
 import json  # ✅ ADICIONAR ESTA LINHA
 from flask_login import current_user
 from flask import current_app as app
 db = SQLAlchemy()
 from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Float
+from sqlalchemy import (event, func, case, true, bindparam, select as sa_select, update as sa_update,
+                        delete as sa_delete)
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
+from sqlalchemy.orm import Session as SASession
+import hashlib
+import re
+import unicodedata
+
+from codec_blob import codificar, decodificar
+from sessao_incremental import (
+    PatchInvalido, VersaoDesatualizada, aplicar_patch, comprimir_json,
+    descomprimir_json, serializar_json, validar_operacoes
+)
 
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
@@ -71,6 +85,10 @@ class CalculadoraPasso1(db.Model):
     # Correção: Alterado de Float para Numeric
     frete = db.Column(db.Numeric(15, 4), nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_calculadora_passo1_user_status', 'user_id', 'status'),
+    )
+
 # Em models.py
 
 class Produto(db.Model):
@@ -93,6 +111,7 @@ class Produto(db.Model):
     # Correção: Alterado de Float para Numeric
     frete = db.Column(db.Numeric(15, 4), nullable=True)
     custo_total = db.Column(db.Numeric(15, 4), nullable=True)
+    # Totais agregados da proposta: mantidos só por compatibilidade, o valor oficial fica em ResumoProposta
     referencia_total = db.Column(db.Numeric(15, 4), nullable=True)
     imposto_total = db.Column(db.Numeric(15, 4), nullable=True)
     valor_total_venda = db.Column(db.Numeric(15, 4), nullable=True)
@@ -112,6 +131,83 @@ class Produto(db.Model):
         backref=db.backref('itens_simulacao', lazy='dynamic')
     )
 
+    # Texto de busca sem acentos (nome + marca/modelo), mantido pelo evento de flush
+    CAMPOS_BUSCA = ('nome', 'marca_modelo')
+    busca_normalizada = db.Column(db.String(600), nullable=True)
+
+class ResumoProposta(db.Model):
+    """
+    Resumo agregado de cada proposta de produtos (totais, quantidade de itens e criador)
+    Recalculado ao salvar a proposta para que a listagem não precise carregar os itens
+    """
+    __tablename__ = 'resumo_proposta'
+
+    proposta_id = db.Column(db.Integer, db.ForeignKey('calculadora_passo1.id', ondelete='CASCADE'),
+                            primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    quantidade_itens = db.Column(db.Integer, nullable=False, default=0)
+    custo_total = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    referencia_total = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    valor_total_venda = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    imposto_total = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    frete = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    lucro_total = db.Column(db.Numeric(15, 4), nullable=False, default=0)
+    criador_nome = db.Column(db.String(150), nullable=True)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    proposta = db.relationship('CalculadoraPasso1', backref=db.backref('resumo', uselist=False,
+                                                                       cascade='all, delete-orphan'))
+
+
+def atualizar_resumo_proposta(proposta, imposto_venda=None):
+    """
+    Recalcula o resumo de uma proposta com um único SELECT agregado sobre os itens
+    Não faz commit: deve ser chamada antes do commit da própria gravação da proposta
+    """
+    db.session.flush()
+
+    quantidade_itens, custo_total, referencia_total, valor_total_venda, frete_itens = db.session.query(
+        func.count(Produto.id),
+        func.coalesce(func.sum(Produto.custo * Produto.quantidade), 0),
+        func.coalesce(func.sum(func.coalesce(Produto.referencia, 0) * Produto.quantidade), 0),
+        func.coalesce(func.sum(Produto.venda * Produto.quantidade), 0),
+        func.max(Produto.frete),
+    ).filter(Produto.calculadora_passo1_id == proposta.id).one()
+
+    if imposto_venda is None:
+        empresa = Empresa.query.filter_by(user_id=proposta.user_id).first()
+        imposto_venda = empresa.imposto_venda if empresa and empresa.imposto_venda is not None else 0
+
+    # O frete da proposta prevalece; propostas antigas só têm o frete repetido nos itens
+    frete = proposta.frete if proposta.frete is not None else (frete_itens or 0)
+
+    valor_total_venda = Decimal(str(valor_total_venda))
+    imposto_total = valor_total_venda * Decimal(str(imposto_venda)) / Decimal('100')
+    lucro_total = valor_total_venda - Decimal(str(custo_total)) - Decimal(str(frete)) - imposto_total
+
+    resumo = db.session.get(ResumoProposta, proposta.id)
+    if resumo is None:
+        resumo = ResumoProposta(proposta_id=proposta.id, user_id=proposta.user_id)
+        db.session.add(resumo)
+
+    if resumo.criador_nome is None:
+        if proposta.subusuario_id:
+            subusuario = db.session.get(Subusuario, proposta.subusuario_id)
+            resumo.criador_nome = subusuario.nome if subusuario else "Subusuário Desconhecido"
+        else:
+            usuario = db.session.get(User, proposta.user_id)
+            resumo.criador_nome = usuario.nome if usuario else "Usuário Desconhecido"
+
+    resumo.quantidade_itens = quantidade_itens
+    resumo.custo_total = custo_total
+    resumo.referencia_total = referencia_total
+    resumo.valor_total_venda = valor_total_venda
+    resumo.imposto_total = imposto_total
+    resumo.frete = frete
+    resumo.lucro_total = lucro_total
+    return resumo
+
+
 class Empresa(db.Model):
     __tablename__ = 'empresa'
     id = db.Column(db.Integer, primary_key=True)
@@ -175,6 +271,35 @@ class AvaliacaoFornecedor(db.Model):
     comentario = db.Column(db.Text, nullable=True)
     data_avaliacao = db.Column(db.DateTime, default=datetime.utcnow)
 
+
+class ResumoAvaliacaoFornecedor(db.Model):
+    """
+    Agregado das avaliações de cada fornecedor (quantidade e somas das notas)
+    Atualizado na mesma transação de cada avaliação gravada, alterada ou removida
+    """
+    __tablename__ = 'resumo_avaliacao_fornecedor'
+
+    fornecedor_id = db.Column(db.Integer, db.ForeignKey('fornecedor.id', ondelete='CASCADE'), primary_key=True)
+    total_avaliacoes = db.Column(db.Integer, nullable=False, default=0)
+    soma_prazo = db.Column(db.Integer, nullable=False, default=0)
+    soma_qualidade = db.Column(db.Integer, nullable=False, default=0)
+    soma_preco = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    fornecedor = db.relationship(
+        'Fornecedor',
+        backref=db.backref('resumo_avaliacao', uselist=False, cascade='all, delete-orphan')
+    )
+
+    @property
+    def media_geral(self):
+        """Média das três notas de todas as avaliações (0 sem avaliações)"""
+        if not self.total_avaliacoes:
+            return 0
+        soma = self.soma_prazo + self.soma_qualidade + self.soma_preco
+        return round(soma / (self.total_avaliacoes * 3), 2)
+
+
 class Banner(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
@@ -247,28 +372,39 @@ class ProdutosFornecedores(db.Model):
     data_cadastro = db.Column(db.DateTime, default=datetime.utcnow)
     detalhes_rel = db.relationship('ProdutoDetalhes', backref='produto', uselist=False, cascade='all, delete-orphan')
 
-    @property
-    def tem_foto(self):
-        """Verifica se o produto tem foto"""
-        detalhes = ProdutoDetalhes.query.filter_by(produto_id=self.id).first()
-        return bool(detalhes and detalhes.foto_url)
+    # Flags desnormalizadas, mantidas pelos eventos de flush a cada escrita em ProdutoDetalhes
+    tem_foto = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    tem_descricao = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
-    @property
-    def tem_descricao(self):
-        """Verifica se o produto tem descrição"""
-        detalhes = ProdutoDetalhes.query.filter_by(produto_id=self.id).first()
-        return bool(detalhes and detalhes.descricao_detalhada)
+    # Texto de busca sem acentos (nome + marca + modelo), mantido pelo evento de flush
+    CAMPOS_BUSCA = ('nome', 'marca', 'modelo')
+    busca_normalizada = db.Column(db.String(500), nullable=True)
+
+    # Identidade do produto na importação com atualização: hash de nome + marca + modelo
+    # normalizados + fornecedor, mantido pelo evento de flush e pelo importador em lotes
+    CAMPOS_CHAVE_NATURAL = ('nome', 'marca', 'modelo', 'fornecedor_id')
+    chave_natural = db.Column(db.String(40), nullable=True)
+    # Produto que não veio na última lista importada do seu fornecedor (importação com atualização)
+    ausente_na_lista = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    __table_args__ = (
+        db.Index('ix_produtos_fornecedores_user_chave', 'user_id', 'chave_natural'),
+        db.Index('ix_produtos_fornecedores_user_foto', 'user_id', 'tem_foto'),
+        db.Index('ix_produtos_fornecedores_user_descricao', 'user_id', 'tem_descricao'),
+        # Paginação keyset da listagem do catálogo: ORDER BY nome, id dentro do usuário
+        db.Index('ix_produtos_fornecedores_user_nome_id', 'user_id', 'nome', 'id'),
+    )
 
     @property
     def foto_url_prop(self):
         """Retorna URL da foto"""
-        detalhes = ProdutoDetalhes.query.filter_by(produto_id=self.id).first()
+        detalhes = self.detalhes_rel
         return detalhes.foto_url if detalhes else None
 
     @property
     def descricao_preview(self):
         """Retorna preview da descrição"""
-        detalhes = ProdutoDetalhes.query.filter_by(produto_id=self.id).first()
+        detalhes = self.detalhes_rel
         if detalhes and detalhes.descricao_detalhada:
             if len(detalhes.descricao_detalhada) > 100:
                 return detalhes.descricao_detalhada[:100] + '...'
@@ -277,7 +413,7 @@ class ProdutosFornecedores(db.Model):
 
     def get_detalhes(self):
         """Retorna detalhes do produto"""
-        return ProdutoDetalhes.query.filter_by(produto_id=self.id).first()
+        return self.detalhes_rel
 
 
 class Lote(db.Model):
@@ -363,31 +499,128 @@ class CalculadoraPasso1Servicos(db.Model):
     # Adicionar esta classe ao seu arquivo models.py existente
 
 
-class CalculadoraSessao(db.Model):
+# ===== ARQUIVO DE PROPOSTAS ENCERRADAS =====
+
+def _tabela_arquivo(modelo, *indices):
     """
-    Modelo para armazenar sessões de recuperação da calculadora
+    Cópia da tabela do modelo com sufixo _arquivo: mesmas colunas e ids, sem chaves
+    estrangeiras nem defaults (as linhas chegam prontas por INSERT ... SELECT)
     """
-    __tablename__ = 'calculadora_sessoes'
+    tabela = modelo.__table__
+    colunas = [
+        db.Column(coluna.name, coluna.type, primary_key=coluna.primary_key, autoincrement=False,
+                  nullable=coluna.nullable)
+        for coluna in tabela.columns
+    ]
+    nome = f'{tabela.name}_arquivo'
+    return db.Table(
+        nome, db.metadata, *colunas,
+        db.Column('arquivado_em', db.DateTime, nullable=False, default=datetime.utcnow),
+        *[db.Index(f'ix_{nome}_{"_".join(campos)}', *campos) for campos in indices]
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    subusuario_id = db.Column(db.Integer, db.ForeignKey('subusuario.id'), nullable=True)
 
-    # Dados da sessão em JSON
-    dados_sessao = db.Column(db.Text, nullable=False)  # JSON string
-    passo_atual = db.Column(db.Integer, default=1)  # 1 ou 2
+# Propostas encerradas há mais de N dias (e seus itens, lotes, serviços e despesas) são
+# movidas para cá pelo arquivo_propostas.py; relatórios leem as duas camadas
+TABELAS_ARQUIVO = {
+    CalculadoraPasso1: _tabela_arquivo(CalculadoraPasso1, ('user_id', 'status')),
+    ResumoProposta: _tabela_arquivo(ResumoProposta),
+    Produto: _tabela_arquivo(Produto, ('calculadora_passo1_id',)),
+    CalculadoraPasso1Servicos: _tabela_arquivo(CalculadoraPasso1Servicos, ('user_id', 'status')),
+    Lote: _tabela_arquivo(Lote, ('proposta_id',), ('proposta_servico_id',)),
+    Servico: _tabela_arquivo(Servico, ('lote_id',)),
+    Despesa: _tabela_arquivo(Despesa, ('proposta_id',), ('proposta_servico_id',)),
+}
 
-    # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24))
 
-    # Relacionamentos
-    user = db.relationship('User', backref='calculadora_sessoes')
-    subusuario = db.relationship('Subusuario', backref='calculadora_sessoes')
+# ===== SESSÕES DA CALCULADORA: SNAPSHOT COMPRIMIDO + DELTAS =====
 
-    def __repr__(self):
-        return f'<CalculadoraSessao {self.id} - User {self.user_id} - Passo {self.passo_atual}>'
+class SessaoIncrementalMixin:
+    """
+    Armazenamento incremental dos dados de uma sessão da calculadora.
+
+    O documento fica em `dados_comprimidos` (JSON + zlib) na versão `versao_snapshot`;
+    cada autosave posterior grava só um delta JSON Patch na tabela de deltas e avança
+    `versao`. Quando os deltas pendentes passam do limite, são compactados no snapshot.
+    Sessões antigas, gravadas em `dados_sessao` (texto), continuam legíveis.
+    """
+
+    def _nova_versao(self):
+        self.versao = (self.versao or 0) + 1
+        return self.versao
+
+    def _gravar_snapshot(self, dados):
+        self.dados_comprimidos = comprimir_json(dados)
+        self.dados_sessao = ''
+        self.versao_snapshot = self._nova_versao()
+        self.tamanho_deltas = 0
+        if self.id is not None:
+            self.deltas.delete(synchronize_session=False)
+
+    def _dados_snapshot(self):
+        if self.dados_comprimidos:
+            return descomprimir_json(self.dados_comprimidos)
+        return json.loads(self.dados_sessao) if self.dados_sessao else {}
+
+    def set_dados_sessao(self, dados):
+        """Grava o documento completo como novo snapshot (descarta os deltas)"""
+        self._gravar_snapshot(dados)
+
+    def get_dados_sessao(self):
+        """Retorna os dados da sessão (snapshot + deltas pendentes)"""
+        dados = self._dados_snapshot()
+        if self.id is None or (self.versao or 0) == (self.versao_snapshot or 0):
+            return dados
+        for delta in self.deltas.order_by(type(self).deltas.property.mapper.class_.versao):
+            if delta.versao <= (self.versao_snapshot or 0):
+                continue
+            try:
+                dados = aplicar_patch(dados, json.loads(delta.operacoes))
+            except PatchInvalido as e:
+                # Mantém o último estado consistente; o próximo salvamento completo regrava o snapshot
+                app.logger.warning(f"⚠️ Delta {delta.versao} da sessão {self.id} ignorado: {e}")
+                break
+        return dados
+
+    def aplicar_delta(self, operacoes, versao_base, limite_deltas=20, limite_bytes=65536):
+        """
+        Registra um delta JSON Patch calculado pelo cliente sobre `versao_base`.
+
+        Args:
+            operacoes: Lista de operações RFC 6902
+            versao_base: Versão sobre a qual o cliente calculou o patch
+            limite_deltas: Deltas pendentes a partir dos quais o snapshot é compactado
+            limite_bytes: Tamanho acumulado dos deltas que também dispara a compactação
+
+        Raises:
+            VersaoDesatualizada: se `versao_base` não for a versão atual
+            PatchInvalido: se o patch estiver malformado ou não se aplicar
+        """
+        if versao_base != (self.versao or 0):
+            raise VersaoDesatualizada(self.versao or 0)
+        validar_operacoes(operacoes)
+        if not operacoes:
+            return
+
+        # Aplica sobre o estado atual só para validar: um delta que não se aplica nunca é gravado
+        dados = aplicar_patch(self.get_dados_sessao(), operacoes)
+
+        texto = serializar_json(operacoes)
+        pendentes = (self.versao or 0) - (self.versao_snapshot or 0) + 1
+        if self.id is None or pendentes >= limite_deltas or (self.tamanho_deltas or 0) + len(texto) >= limite_bytes:
+            self._gravar_snapshot(dados)
+            return
+
+        classe_delta = type(self).deltas.property.mapper.class_
+        self.deltas.append(classe_delta(versao=self._nova_versao(), operacoes=texto))
+        self.tamanho_deltas = (self.tamanho_deltas or 0) + len(texto)
+
+    def compactar(self, operacoes=None):
+        """Aplica os deltas pendentes (e `operacoes`, se houver) e regrava o snapshot"""
+        dados = self.get_dados_sessao()
+        if operacoes:
+            dados = aplicar_patch(dados, operacoes)
+        self._gravar_snapshot(dados)
 
     def to_dict(self):
         """Converte para dicionário"""
@@ -395,7 +628,8 @@ class CalculadoraSessao(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'subusuario_id': self.subusuario_id,
-            'dados_sessao': json.loads(self.dados_sessao) if self.dados_sessao else {},
+            'dados_sessao': self.get_dados_sessao(),
+            'versao': self.versao or 0,
             'passo_atual': self.passo_atual,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
@@ -406,13 +640,75 @@ class CalculadoraSessao(db.Model):
         """Verifica se a sessão expirou"""
         return datetime.utcnow() > self.expires_at
 
-    def set_dados_sessao(self, dados):
-        """Define os dados da sessão (converte para JSON)"""
-        self.dados_sessao = json.dumps(dados)
+    @classmethod
+    def excluir_expiradas(cls, limite=500):
+        """
+        Remove um lote de sessões expiradas e seus deltas (usa o índice de expires_at).
 
-    def get_dados_sessao(self):
-        """Retorna os dados da sessão (converte de JSON)"""
-        return json.loads(self.dados_sessao) if self.dados_sessao else {}
+        Returns:
+            int: Quantidade de sessões removidas (menor que `limite` quando não restam mais)
+        """
+        ids = db.session.execute(
+            sa_select(cls.id).where(cls.expires_at < datetime.utcnow()).order_by(cls.expires_at).limit(limite)
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        classe_delta = cls.deltas.property.mapper.class_
+        db.session.execute(
+            sa_delete(classe_delta).where(classe_delta.sessao_id.in_(ids)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(
+            sa_delete(cls).where(cls.id.in_(ids)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        return len(ids)
+
+
+class CalculadoraSessao(SessaoIncrementalMixin, db.Model):
+    """
+    Modelo para armazenar sessões de recuperação da calculadora
+    """
+    __tablename__ = 'calculadora_sessoes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    subusuario_id = db.Column(db.Integer, db.ForeignKey('subusuario.id'), nullable=True)
+
+    # Dados da sessão: legado em texto JSON; novas gravações usam o snapshot comprimido + deltas
+    dados_sessao = db.deferred(db.Column(db.Text, nullable=False))  # JSON string
+    dados_comprimidos = db.deferred(db.Column(db.LargeBinary(length=16 * 1024 * 1024), nullable=True))
+    versao = db.Column(db.Integer, default=0, nullable=False)
+    versao_snapshot = db.Column(db.Integer, default=0, nullable=False)
+    tamanho_deltas = db.Column(db.Integer, default=0, nullable=False)
+    passo_atual = db.Column(db.Integer, default=1)  # 1 ou 2
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24), index=True)
+
+    # Relacionamentos
+    user = db.relationship('User', backref='calculadora_sessoes')
+    subusuario = db.relationship('Subusuario', backref='calculadora_sessoes')
+    deltas = db.relationship('CalculadoraSessaoDelta', lazy='dynamic', cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<CalculadoraSessao {self.id} - User {self.user_id} - Passo {self.passo_atual}>'
+
+
+class CalculadoraSessaoDelta(db.Model):
+    """Delta JSON Patch de um autosave da calculadora, pendente de compactação"""
+    __tablename__ = 'calculadora_sessoes_deltas'
+    __table_args__ = (db.UniqueConstraint('sessao_id', 'versao', name='uq_calculadora_sessao_delta_versao'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('calculadora_sessoes.id', ondelete='CASCADE'), nullable=False)
+    versao = db.Column(db.Integer, nullable=False)
+    operacoes = db.Column(db.Text, nullable=False)  # JSON Patch
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 # ===== FUNÇÃO AUXILIAR PARA LIMPAR SESSÃO =====
@@ -457,7 +753,7 @@ def limpar_sessao_calculadora_atual():
             pass
         return False
 
-class CalculadoraSessaoServicos(db.Model):
+class CalculadoraSessaoServicos(SessaoIncrementalMixin, db.Model):
         """
         Modelo para armazenar sessões de recuperação da calculadora de serviços
         """
@@ -467,46 +763,39 @@ class CalculadoraSessaoServicos(db.Model):
         user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
         subusuario_id = db.Column(db.Integer, db.ForeignKey('subusuario.id'), nullable=True)
 
-        # Dados da sessão em JSON
-        dados_sessao = db.Column(db.Text, nullable=False)  # JSON string
+        # Dados da sessão: legado em texto JSON; novas gravações usam o snapshot comprimido + deltas
+        dados_sessao = db.deferred(db.Column(db.Text, nullable=False))  # JSON string
+        dados_comprimidos = db.deferred(db.Column(db.LargeBinary(length=16 * 1024 * 1024), nullable=True))
+        versao = db.Column(db.Integer, default=0, nullable=False)
+        versao_snapshot = db.Column(db.Integer, default=0, nullable=False)
+        tamanho_deltas = db.Column(db.Integer, default=0, nullable=False)
         passo_atual = db.Column(db.Integer, default=1)  # 1 ou 2
 
         # Timestamps
         created_at = db.Column(db.DateTime, default=datetime.utcnow)
         updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-        expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24))
+        expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(hours=24), index=True)
 
         # Relacionamentos
         user = db.relationship('User', backref='calculadora_sessoes_servicos')
         subusuario = db.relationship('Subusuario', backref='calculadora_sessoes_servicos')
+        deltas = db.relationship('CalculadoraSessaoServicosDelta', lazy='dynamic', cascade='all, delete-orphan')
 
         def __repr__(self):
             return f'<CalculadoraSessaoServicos {self.id} - User {self.user_id} - Passo {self.passo_atual}>'
 
-        def to_dict(self):
-            """Converte para dicionário"""
-            return {
-                'id': self.id,
-                'user_id': self.user_id,
-                'subusuario_id': self.subusuario_id,
-                'dados_sessao': json.loads(self.dados_sessao) if self.dados_sessao else {},
-                'passo_atual': self.passo_atual,
-                'created_at': self.created_at.isoformat() if self.created_at else None,
-                'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-                'expires_at': self.expires_at.isoformat() if self.expires_at else None
-            }
-
-        def is_expired(self):
-            """Verifica se a sessão expirou"""
-            return datetime.utcnow() > self.expires_at
-
-        def set_dados_sessao(self, dados):
-            """Define os dados da sessão (converte para JSON)"""
-            self.dados_sessao = json.dumps(dados)
-
-        def get_dados_sessao(self):
-            """Retorna os dados da sessão (converte de JSON)"""
-            return json.loads(self.dados_sessao) if self.dados_sessao else {}
+
+class CalculadoraSessaoServicosDelta(db.Model):
+    """Delta JSON Patch de um autosave da calculadora de serviços, pendente de compactação"""
+    __tablename__ = 'calculadora_sessoes_servicos_deltas'
+    __table_args__ = (db.UniqueConstraint('sessao_id', 'versao', name='uq_calculadora_sessao_servicos_delta_versao'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    sessao_id = db.Column(db.Integer, db.ForeignKey('calculadora_sessoes_servicos.id', ondelete='CASCADE'),
+                          nullable=False)
+    versao = db.Column(db.Integer, nullable=False)
+    operacoes = db.Column(db.Text, nullable=False)  # JSON Patch
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
 
     # ===== FUNÇÃO AUXILIAR PARA LIMPAR SESSÃO DE SERVIÇOS =====
 
@@ -745,8 +1034,10 @@ class ServicoLegislacao(db.Model):
 
     preco_final_legislacao = db.Column(db.Numeric(12, 2), nullable=True)
 
-    # Dados completos do cálculo em JSON para auditoria
-    dados_calculo_completo = db.Column(db.Text, nullable=True)
+    # Dados completos do cálculo para auditoria: legado em texto JSON; novas gravações
+    # usam o blob comprimido com os totais no cabeçalho (codec_blob)
+    dados_calculo_completo = db.deferred(db.Column(db.Text, nullable=True))
+    dados_calculo_comprimido = db.deferred(db.Column(db.LargeBinary(length=16 * 1024 * 1024), nullable=True))
 
     # Controle
     calculado_em = db.Column(db.DateTime, nullable=True)
@@ -758,12 +1049,17 @@ class ServicoLegislacao(db.Model):
     segmento = db.relationship('SegmentoServico', backref='servicos_legislacao')
     convencao = db.relationship('ConvencaoColetiva', backref='servicos_legislacao')
 
+    VERSAO_SCHEMA_CALCULO = 1
+
     def set_dados_calculo(self, dados_dict):
-        """Armazena dados completos do cálculo em JSON"""
-        self.dados_calculo_completo = json.dumps(dados_dict, default=str)
+        """Armazena dados completos do cálculo comprimidos"""
+        self.dados_calculo_comprimido = codificar(dados_dict, versao_schema=self.VERSAO_SCHEMA_CALCULO, default=str)
+        self.dados_calculo_completo = None
 
     def get_dados_calculo(self):
         """Recupera dados completos do cálculo"""
+        if self.dados_calculo_comprimido:
+            return decodificar(self.dados_calculo_comprimido)
         if self.dados_calculo_completo:
             return json.loads(self.dados_calculo_completo)
         return {}
@@ -780,6 +1076,444 @@ class ProdutoDetalhes(db.Model):
     foto_url = db.Column(db.String(500), nullable=True)
     descricao_detalhada = db.Column(db.Text, nullable=True)
 
+
+class LiderAgendador(db.Model):
+    """
+    Trava de liderança do agendador de tarefas (uma linha por agendador)
+    Só o processo dono da linha, enquanto ela não expira, executa as tarefas periódicas
+    """
+    __tablename__ = 'agendador_lider'
+
+    nome = db.Column(db.String(50), primary_key=True)
+    dono = db.Column(db.String(150), nullable=False)
+    expira_em = db.Column(db.DateTime, nullable=False)
+
+
+class ExecucaoAgendador(db.Model):
+    """
+    Próxima execução de cada tarefa periódica (uma linha por agendador e tarefa)
+    Fica no banco para que um novo líder continue o calendário do anterior
+    """
+    __tablename__ = 'agendador_execucoes'
+
+    agendador = db.Column(db.String(50), primary_key=True)
+    tarefa = db.Column(db.String(100), primary_key=True)
+    proxima_em = db.Column(db.DateTime, nullable=False)
+
+
+class TarefaSegundoPlano(db.Model):
+    """
+    Tarefa longa executada fora da requisição (exclusão em massa, importação)
+    O progresso e o cursor (ultimo_id) são gravados a cada lote para consulta de status
+    e para retomar a tarefa do último lote gravado se o processo cair
+    """
+    __tablename__ = 'tarefas_segundo_plano'
+    __table_args__ = (
+        db.Index('ix_tarefas_segundo_plano_status_atualizado', 'status', 'atualizado_em'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, executando, concluida, erro
+    parametros = db.Column(db.Text, nullable=True)  # JSON
+    total = db.Column(db.Integer, nullable=True)
+    processados = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_id = db.Column(db.Integer, nullable=False, default=0)
+    mensagem = db.Column(db.String(500), nullable=True)
+    erro = db.Column(db.Text, nullable=True)
+    resultado = db.Column(db.Text().with_variant(MEDIUMTEXT(), 'mysql'), nullable=True)  # JSON (relatório)
+
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+
+    def set_parametros(self, parametros):
+        self.parametros = json.dumps(parametros)
+
+    def get_parametros(self):
+        return json.loads(self.parametros) if self.parametros else {}
+
+    def set_resultado(self, resultado):
+        self.resultado = json.dumps(resultado)
+
+    def get_resultado(self):
+        return json.loads(self.resultado) if self.resultado else {}
+
+    def to_dict(self):
+        """Converte para o formato da rota de status"""
+        percentual = None
+        if self.total:
+            percentual = round(min(self.processados / self.total, 1) * 100, 1)
+        elif self.status == 'concluida':
+            percentual = 100.0
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'status': self.status,
+            'total': self.total,
+            'processados': self.processados,
+            'percentual': percentual,
+            'mensagem': self.mensagem,
+            'erro': self.erro,
+            'resultado': self.get_resultado(),
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'concluido_em': self.concluido_em.isoformat() if self.concluido_em else None
+        }
+
+
+class ContadoresCatalogo(db.Model):
+    """
+    Contadores do catálogo de produtos por usuário (uma linha por usuário)
+    Atualizados na mesma transação das escritas em produtos, detalhes e fornecedores
+    """
+    __tablename__ = 'contadores_catalogo'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    total_produtos = db.Column(db.Integer, nullable=False, default=0)
+    produtos_com_foto = db.Column(db.Integer, nullable=False, default=0)
+    produtos_com_descricao = db.Column(db.Integer, nullable=False, default=0)
+    total_fornecedores = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        """Converte para o formato usado pela rota de estatísticas"""
+        return {
+            'total_produtos': self.total_produtos,
+            'produtos_com_foto': self.produtos_com_foto,
+            'produtos_com_descricao': self.produtos_com_descricao,
+            'produtos_sem_foto': self.total_produtos - self.produtos_com_foto,
+            'produtos_sem_descricao': self.total_produtos - self.produtos_com_descricao,
+            'total_fornecedores': self.total_fornecedores
+        }
+
+
+# ===== SINCRONIZAÇÃO DAS FLAGS E CONTADORES DO CATÁLOGO =====
+
+def _contar_catalogo(conexao, user_id):
+    """Conta o catálogo do usuário direto nas tabelas (usado para criar/recalcular o contador)"""
+    pf = ProdutosFornecedores.__table__
+    total, com_foto, com_descricao = conexao.execute(
+        sa_select(
+            func.count(pf.c.id),
+            func.coalesce(func.sum(case((pf.c.tem_foto == true(), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((pf.c.tem_descricao == true(), 1), else_=0)), 0),
+        ).where(pf.c.user_id == user_id)
+    ).one()
+    total_fornecedores = conexao.execute(
+        sa_select(func.count(FornecedorProdutos.__table__.c.id))
+        .where(FornecedorProdutos.__table__.c.user_id == user_id)
+    ).scalar()
+    return {
+        'total_produtos': int(total or 0),
+        'produtos_com_foto': int(com_foto or 0),
+        'produtos_com_descricao': int(com_descricao or 0),
+        'total_fornecedores': int(total_fornecedores or 0),
+    }
+
+
+def recalcular_contadores_catalogo(user_id, commit=True):
+    """
+    Recalcula do zero o contador do usuário
+    Necessário após exclusões/atualizações em massa (query.delete/update), que não passam pelo flush
+    """
+    contagem = _contar_catalogo(db.session.connection(), user_id)
+    contadores = ContadoresCatalogo.query.filter_by(user_id=user_id).first()
+    if not contadores:
+        contadores = ContadoresCatalogo(user_id=user_id)
+        db.session.add(contadores)
+    for campo, valor in contagem.items():
+        setattr(contadores, campo, valor)
+    if commit:
+        db.session.commit()
+    return contadores
+
+
+def obter_contadores_catalogo(user_id):
+    """Retorna o contador do usuário, criando-o a partir das tabelas na primeira consulta"""
+    contadores = ContadoresCatalogo.query.filter_by(user_id=user_id).first()
+    if contadores is None:
+        contadores = recalcular_contadores_catalogo(user_id)
+    return contadores
+
+
+def _acumular_delta(deltas, user_id, campo, valor):
+    if not user_id or not valor:
+        return
+    deltas.setdefault(user_id, {}).setdefault(campo, 0)
+    deltas[user_id][campo] += valor
+
+
+@event.listens_for(SASession, 'before_flush')
+def _sincronizar_flags_catalogo(session, flush_context, instances):
+    """
+    Mantém ProdutosFornecedores.tem_foto/tem_descricao coerentes com ProdutoDetalhes
+    e acumula os deltas dos contadores para gravar no after_flush
+    """
+    deltas = session.info.setdefault('contadores_catalogo_deltas', {})
+    produtos_excluidos = {id(obj) for obj in session.deleted if isinstance(obj, ProdutosFornecedores)}
+
+    for obj in list(session.new):
+        if isinstance(obj, ProdutosFornecedores):
+            _acumular_delta(deltas, obj.user_id, 'total_produtos', 1)
+            _acumular_delta(deltas, obj.user_id, 'produtos_com_foto', int(bool(obj.tem_foto)))
+            _acumular_delta(deltas, obj.user_id, 'produtos_com_descricao', int(bool(obj.tem_descricao)))
+        elif isinstance(obj, FornecedorProdutos):
+            _acumular_delta(deltas, obj.user_id, 'total_fornecedores', 1)
+
+    for obj in list(session.deleted):
+        if isinstance(obj, ProdutosFornecedores):
+            _acumular_delta(deltas, obj.user_id, 'total_produtos', -1)
+            _acumular_delta(deltas, obj.user_id, 'produtos_com_foto', -int(bool(obj.tem_foto)))
+            _acumular_delta(deltas, obj.user_id, 'produtos_com_descricao', -int(bool(obj.tem_descricao)))
+        elif isinstance(obj, FornecedorProdutos):
+            _acumular_delta(deltas, obj.user_id, 'total_fornecedores', -1)
+
+    detalhes_alterados = [(d, False) for d in list(session.new) + list(session.dirty)
+                          if isinstance(d, ProdutoDetalhes)]
+    detalhes_alterados += [(d, True) for d in session.deleted if isinstance(d, ProdutoDetalhes)]
+
+    for detalhes, excluido in detalhes_alterados:
+        produto = detalhes.produto
+        if produto is None and detalhes.produto_id:
+            produto = session.get(ProdutosFornecedores, detalhes.produto_id)
+        if produto is None or id(produto) in produtos_excluidos:
+            continue
+
+        nova_foto = bool(detalhes.foto_url) and not excluido
+        nova_descricao = bool(detalhes.descricao_detalhada) and not excluido
+        # Produto ainda não gravado: o delta é contado pelo bloco de session.new
+        produto_pendente = produto in session.new
+
+        if bool(produto.tem_foto) != nova_foto:
+            if not produto_pendente:
+                _acumular_delta(deltas, produto.user_id, 'produtos_com_foto', 1 if nova_foto else -1)
+            produto.tem_foto = nova_foto
+        if bool(produto.tem_descricao) != nova_descricao:
+            if not produto_pendente:
+                _acumular_delta(deltas, produto.user_id, 'produtos_com_descricao', 1 if nova_descricao else -1)
+            produto.tem_descricao = nova_descricao
+
+        if produto_pendente:
+            _acumular_delta(deltas, produto.user_id, 'produtos_com_foto', int(nova_foto))
+            _acumular_delta(deltas, produto.user_id, 'produtos_com_descricao', int(nova_descricao))
+
+
+@event.listens_for(SASession, 'after_flush')
+def _gravar_contadores_catalogo(session, flush_context):
+    """Aplica os deltas acumulados com UPDATE atômico (campo = campo + delta) na mesma transação"""
+    deltas = session.info.pop('contadores_catalogo_deltas', None)
+    if not deltas:
+        return
+
+    tabela = ContadoresCatalogo.__table__
+    conexao = session.connection()
+    for user_id, campos in deltas.items():
+        campos = {campo: valor for campo, valor in campos.items() if valor}
+        if not campos:
+            continue
+        valores = {campo: tabela.c[campo] + valor for campo, valor in campos.items()}
+        valores['atualizado_em'] = datetime.utcnow()
+        resultado = conexao.execute(
+            sa_update(tabela).where(tabela.c.user_id == user_id).values(**valores)
+        )
+        if resultado.rowcount == 0:
+            # Primeira escrita do usuário: a contagem já enxerga as linhas recém-gravadas
+            conexao.execute(
+                tabela.insert().values(user_id=user_id, atualizado_em=datetime.utcnow(),
+                                       **_contar_catalogo(conexao, user_id))
+            )
+
+
+@event.listens_for(SASession, 'after_rollback')
+def _descartar_deltas_catalogo(session):
+    session.info.pop('contadores_catalogo_deltas', None)
+
+
+# ===== AGREGADO DAS AVALIAÇÕES DE FORNECEDORES =====
+
+CAMPOS_NOTAS_AVALIACAO = (('nota_prazo', 'soma_prazo'), ('nota_qualidade', 'soma_qualidade'),
+                          ('nota_preco', 'soma_preco'))
+
+
+def _somar_avaliacoes(conexao, fornecedor_id):
+    """Soma as avaliações do fornecedor direto na tabela (usado para criar/recalcular o agregado)"""
+    av = AvaliacaoFornecedor.__table__
+    total, prazo, qualidade, preco = conexao.execute(
+        sa_select(
+            func.count(av.c.id),
+            func.coalesce(func.sum(av.c.nota_prazo), 0),
+            func.coalesce(func.sum(av.c.nota_qualidade), 0),
+            func.coalesce(func.sum(av.c.nota_preco), 0),
+        ).where(av.c.fornecedor_id == fornecedor_id)
+    ).one()
+    return {
+        'total_avaliacoes': int(total or 0),
+        'soma_prazo': int(prazo or 0),
+        'soma_qualidade': int(qualidade or 0),
+        'soma_preco': int(preco or 0),
+    }
+
+
+@event.listens_for(SASession, 'before_flush')
+def _acumular_avaliacoes_fornecedor(session, flush_context, instances):
+    """Acumula os deltas do agregado de avaliações para gravar no after_flush"""
+    deltas = session.info.setdefault('avaliacoes_fornecedor_deltas', {})
+
+    for obj in session.new:
+        if isinstance(obj, AvaliacaoFornecedor):
+            _acumular_delta(deltas, obj.fornecedor_id, 'total_avaliacoes', 1)
+            for nota, soma in CAMPOS_NOTAS_AVALIACAO:
+                _acumular_delta(deltas, obj.fornecedor_id, soma, getattr(obj, nota) or 0)
+
+    for obj in session.deleted:
+        if isinstance(obj, AvaliacaoFornecedor):
+            estado = db.inspect(obj)
+            _acumular_delta(deltas, obj.fornecedor_id, 'total_avaliacoes', -1)
+            for nota, soma in CAMPOS_NOTAS_AVALIACAO:
+                historico = estado.attrs[nota].history
+                anterior = historico.deleted[0] if historico.deleted else getattr(obj, nota)
+                _acumular_delta(deltas, obj.fornecedor_id, soma, -(anterior or 0))
+
+    for obj in session.dirty:
+        if not isinstance(obj, AvaliacaoFornecedor) or not session.is_modified(obj):
+            continue
+        estado = db.inspect(obj)
+        historico_fornecedor = estado.attrs.fornecedor_id.history
+        fornecedor_anterior = (historico_fornecedor.deleted[0] if historico_fornecedor.deleted
+                               else obj.fornecedor_id)
+        if fornecedor_anterior != obj.fornecedor_id:
+            _acumular_delta(deltas, fornecedor_anterior, 'total_avaliacoes', -1)
+            _acumular_delta(deltas, obj.fornecedor_id, 'total_avaliacoes', 1)
+        for nota, soma in CAMPOS_NOTAS_AVALIACAO:
+            historico = estado.attrs[nota].history
+            anterior = historico.deleted[0] if historico.deleted else getattr(obj, nota)
+            _acumular_delta(deltas, fornecedor_anterior, soma, -(anterior or 0))
+            _acumular_delta(deltas, obj.fornecedor_id, soma, getattr(obj, nota) or 0)
+
+
+@event.listens_for(SASession, 'after_flush')
+def _gravar_avaliacoes_fornecedor(session, flush_context):
+    """Aplica os deltas com UPDATE atômico (campo = campo + delta) na mesma transação da avaliação"""
+    deltas = session.info.pop('avaliacoes_fornecedor_deltas', None)
+    if not deltas:
+        return
+
+    tabela = ResumoAvaliacaoFornecedor.__table__
+    conexao = session.connection()
+    for fornecedor_id, campos in deltas.items():
+        campos = {campo: valor for campo, valor in campos.items() if valor}
+        if not campos:
+            continue
+        valores = {campo: tabela.c[campo] + valor for campo, valor in campos.items()}
+        valores['atualizado_em'] = datetime.utcnow()
+        resultado = conexao.execute(
+            sa_update(tabela).where(tabela.c.fornecedor_id == fornecedor_id).values(**valores)
+        )
+        if resultado.rowcount == 0:
+            # Primeira avaliação do fornecedor: a soma já enxerga as linhas recém-gravadas
+            conexao.execute(
+                tabela.insert().values(fornecedor_id=fornecedor_id, atualizado_em=datetime.utcnow(),
+                                       **_somar_avaliacoes(conexao, fornecedor_id))
+            )
+
+
+@event.listens_for(SASession, 'after_rollback')
+def _descartar_deltas_avaliacoes(session):
+    session.info.pop('avaliacoes_fornecedor_deltas', None)
+
+
+def recalcular_resumo_avaliacoes(fornecedor_id, commit=True):
+    """Recalcula do zero o agregado de avaliações do fornecedor"""
+    somas = _somar_avaliacoes(db.session.connection(), fornecedor_id)
+    resumo = db.session.get(ResumoAvaliacaoFornecedor, fornecedor_id)
+    if resumo is None:
+        resumo = ResumoAvaliacaoFornecedor(fornecedor_id=fornecedor_id)
+        db.session.add(resumo)
+    for campo, valor in somas.items():
+        setattr(resumo, campo, valor)
+    if commit:
+        db.session.commit()
+    return resumo
+
+
+# ===== TEXTO NORMALIZADO PARA BUSCA =====
+
+def normalizar_busca(*partes):
+    """
+    Normaliza texto para busca: remove acentos, passa para minúsculas e troca
+    pontuação por espaço (mesma regra do _normalize usado no casamento de itens)
+    """
+    txt = ' '.join(p for p in partes if p)
+    txt = unicodedata.normalize('NFKD', txt).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', txt.lower()).strip()
+
+
+def texto_busca(obj):
+    """Monta o valor de busca_normalizada a partir dos CAMPOS_BUSCA do modelo"""
+    tamanho = obj.__table__.c.busca_normalizada.type.length
+    return normalizar_busca(*(getattr(obj, campo) for campo in obj.CAMPOS_BUSCA))[:tamanho]
+
+
+@event.listens_for(SASession, 'before_flush')
+def _atualizar_busca_normalizada(session, flush_context, instances):
+    """Recalcula busca_normalizada dos produtos novos ou com nome/marca/modelo alterados"""
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, (Produto, ProdutosFornecedores)):
+            continue
+        if obj not in session.new and obj.busca_normalizada is not None:
+            estado = db.inspect(obj)
+            if not any(estado.attrs[campo].history.has_changes() for campo in obj.CAMPOS_BUSCA):
+                continue
+        obj.busca_normalizada = texto_busca(obj)
+
+
+def chave_natural_produto(nome, marca, modelo, fornecedor_id):
+    """Hash (SHA-1) de nome, marca e modelo normalizados + fornecedor: mesma chave para a mesma linha da lista"""
+    partes = (normalizar_busca(nome), normalizar_busca(marca), normalizar_busca(modelo), str(fornecedor_id or ''))
+    return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+
+def desvincular_fornecedor_produtos(user_id, fornecedor_id):
+    """
+    Tira o fornecedor dos produtos do catálogo do usuário (sem commit).
+
+    UPDATE em massa não passa pelo before_flush: a chave natural (que inclui o
+    fornecedor) é recalculada aqui, numa única execução com os valores de cada produto.
+
+    Returns:
+        int: Quantidade de produtos desvinculados
+    """
+    t = ProdutosFornecedores.__table__
+    produtos = db.session.execute(
+        sa_select(t.c.id, t.c.nome, t.c.marca, t.c.modelo)
+        .where(t.c.user_id == user_id, t.c.fornecedor_id == fornecedor_id)
+    ).all()
+    if produtos:
+        db.session.execute(
+            sa_update(t).where(t.c.id == bindparam('b_id')).values(
+                fornecedor_id=None, chave_natural=bindparam('b_chave')
+            ),
+            [{'b_id': p.id, 'b_chave': chave_natural_produto(p.nome, p.marca, p.modelo, None)} for p in produtos]
+        )
+    return len(produtos)
+
+
+@event.listens_for(SASession, 'before_flush')
+def _atualizar_chave_natural(session, flush_context, instances):
+    """Recalcula chave_natural dos produtos do catálogo novos ou com campos da chave alterados"""
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, ProdutosFornecedores):
+            continue
+        if obj not in session.new and obj.chave_natural is not None:
+            estado = db.inspect(obj)
+            if not any(estado.attrs[campo].history.has_changes() for campo in obj.CAMPOS_CHAVE_NATURAL):
+                continue
+        obj.chave_natural = chave_natural_produto(obj.nome, obj.marca, obj.modelo, obj.fornecedor_id)
+
+
 class HistoricoCalculoLegislacao(db.Model):
     """
     Histórico de cálculos para auditoria e comparação
@@ -790,9 +1524,12 @@ class HistoricoCalculoLegislacao(db.Model):
     servico_legislacao_id = db.Column(db.Integer, db.ForeignKey('servico_legislacao.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
-    # Snapshot dos dados no momento do cálculo
-    dados_entrada = db.Column(db.Text, nullable=False)  # JSON
-    dados_calculo = db.Column(db.Text, nullable=False)  # JSON
+    # Snapshot dos dados no momento do cálculo: legado em texto JSON (gravado vazio
+    # nas novas linhas); os dados ficam nos blobs comprimidos (codec_blob)
+    dados_entrada = db.deferred(db.Column(db.Text, nullable=False))  # JSON
+    dados_calculo = db.deferred(db.Column(db.Text, nullable=False))  # JSON
+    dados_entrada_comprimido = db.deferred(db.Column(db.LargeBinary(length=16 * 1024 * 1024), nullable=True))
+    dados_calculo_comprimido = db.deferred(db.Column(db.LargeBinary(length=16 * 1024 * 1024), nullable=True))
     preco_final = db.Column(db.Numeric(12, 2), nullable=False)
 
     # Metadados
@@ -805,18 +1542,26 @@ class HistoricoCalculoLegislacao(db.Model):
     servico_legislacao = db.relationship('ServicoLegislacao', backref='historico_calculos')
     user = db.relationship('User', backref='historico_calculos_legislacao')
 
+    VERSAO_SCHEMA_CALCULO = 1
+
     def set_dados_entrada(self, dados_dict):
-        self.dados_entrada = json.dumps(dados_dict, default=str)
+        self.dados_entrada_comprimido = codificar(dados_dict, versao_schema=self.VERSAO_SCHEMA_CALCULO, default=str)
+        self.dados_entrada = ''
 
     def get_dados_entrada(self):
+        if self.dados_entrada_comprimido:
+            return decodificar(self.dados_entrada_comprimido)
         if self.dados_entrada:
             return json.loads(self.dados_entrada)
         return {}
 
     def set_dados_calculo(self, dados_dict):
-        self.dados_calculo = json.dumps(dados_dict, default=str)
+        self.dados_calculo_comprimido = codificar(dados_dict, versao_schema=self.VERSAO_SCHEMA_CALCULO, default=str)
+        self.dados_calculo = ''
 
     def get_dados_calculo(self):
+        if self.dados_calculo_comprimido:
+            return decodificar(self.dados_calculo_comprimido)
         if self.dados_calculo:
             return json.loads(self.dados_calculo)
         return {}
@@ -9,6 +9,7 @@ import json
 
 # Usar a mesma instância db do models.py principal
 from models import db
+from codec_blob import codificar, decodificar
 
 
 class SvcScenario(db.Model):
@@ -174,8 +175,13 @@ class SvcOutput(db.Model):
     # Tipo de saída
     tipo = db.Column(db.String(50), nullable=False)  # 'pdf', 'excel', 'json'
     
-    # Resultado do cálculo (JSON)
-    resultado_json = db.Column(db.Text, nullable=True)
+    # Versão do formato do resultado e totais copiados para o cabeçalho do blob
+    VERSAO_SCHEMA_RESULTADO = 1
+    CAMPOS_TOTAIS_RESULTADO = ('total_contrato',)
+    
+    # Resultado do cálculo: legado em texto JSON; novas gravações usam o blob comprimido (codec_blob)
+    resultado_json = db.deferred(db.Column(db.Text, nullable=True))
+    resultado_comprimido = db.deferred(db.Column(db.LargeBinary(length=16 * 1024 * 1024), nullable=True))
     
     # Arquivo gerado
     arquivo_path = db.Column(db.String(500), nullable=True)
@@ -184,10 +190,15 @@ class SvcOutput(db.Model):
     
     def get_resultado(self):
         """Retorna o resultado como dicionário Python"""
+        if self.resultado_comprimido:
+            return decodificar(self.resultado_comprimido)
         if self.resultado_json:
             return json.loads(self.resultado_json)
         return {}
     
     def set_resultado(self, data):
-        """Salva o resultado como JSON"""
-        self.resultado_json = json.dumps(data, ensure_ascii=False)
+        """Salva o resultado comprimido"""
+        self.resultado_comprimido = codificar(
+            data, versao_schema=self.VERSAO_SCHEMA_RESULTADO, campos_cabecalho=self.CAMPOS_TOTAIS_RESULTADO
+        )
+        self.resultado_json = None
@@ -0,0 +1,161 @@
+"""
+Gravação Incremental das Sessões da Calculadora
+Snapshot comprimido (zlib) + deltas em JSON Patch (RFC 6902): cada autosave grava
+apenas as operações alteradas, e os deltas são compactados no snapshot periodicamente
+"""
+
+import json
+import zlib
+
+
+OPERACOES_PATCH = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+class PatchInvalido(ValueError):
+    """Operação de JSON Patch malformada ou que não se aplica ao documento"""
+
+
+class VersaoDesatualizada(Exception):
+    """O cliente enviou um delta calculado sobre uma versão que não é a atual"""
+
+    def __init__(self, versao_atual):
+        super().__init__(f'versão atual da sessão é {versao_atual}')
+        self.versao_atual = versao_atual
+
+
+# ------------------------------------------------------------------
+# Compressão do snapshot
+# ------------------------------------------------------------------
+
+def serializar_json(dados):
+    """JSON compacto (sem espaços) usado no snapshot e nos deltas"""
+    return json.dumps(dados, separators=(',', ':'), ensure_ascii=False)
+
+
+def comprimir_json(dados):
+    return zlib.compress(serializar_json(dados).encode('utf-8'), 6)
+
+
+def descomprimir_json(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+# ------------------------------------------------------------------
+# JSON Patch (RFC 6902) e JSON Pointer (RFC 6901)
+# ------------------------------------------------------------------
+
+def _tokens(ponteiro):
+    if ponteiro == '':
+        return []
+    if not isinstance(ponteiro, str) or not ponteiro.startswith('/'):
+        raise PatchInvalido(f'caminho inválido: {ponteiro!r}')
+    return [t.replace('~1', '/').replace('~0', '~') for t in ponteiro[1:].split('/')]
+
+
+def _indice(lista, token, inserir=False):
+    if inserir and token == '-':
+        return len(lista)
+    if not token.isdigit() or (len(token) > 1 and token.startswith('0')):
+        raise PatchInvalido(f'índice de lista inválido: {token!r}')
+    indice = int(token)
+    if indice > len(lista) or (not inserir and indice == len(lista)):
+        raise PatchInvalido(f'índice fora da lista: {indice}')
+    return indice
+
+
+def _resolver(documento, tokens):
+    alvo = documento
+    for token in tokens:
+        if isinstance(alvo, list):
+            alvo = alvo[_indice(alvo, token)]
+        elif isinstance(alvo, dict) and token in alvo:
+            alvo = alvo[token]
+        else:
+            raise PatchInvalido(f'caminho inexistente: /{"/".join(tokens)}')
+    return alvo
+
+
+def _adicionar(documento, tokens, valor):
+    if not tokens:
+        return valor
+    pai = _resolver(documento, tokens[:-1])
+    if isinstance(pai, list):
+        pai.insert(_indice(pai, tokens[-1], inserir=True), valor)
+    elif isinstance(pai, dict):
+        pai[tokens[-1]] = valor
+    else:
+        raise PatchInvalido(f'destino não é objeto nem lista: /{"/".join(tokens)}')
+    return documento
+
+
+def _remover(documento, tokens):
+    if not tokens:
+        raise PatchInvalido('não é possível remover a raiz do documento')
+    pai = _resolver(documento, tokens[:-1])
+    if isinstance(pai, list):
+        return pai.pop(_indice(pai, tokens[-1]))
+    if isinstance(pai, dict) and tokens[-1] in pai:
+        return pai.pop(tokens[-1])
+    raise PatchInvalido(f'caminho inexistente: /{"/".join(tokens)}')
+
+
+def validar_operacoes(operacoes):
+    """
+    Confere a estrutura de um JSON Patch sem aplicá-lo.
+
+    Raises:
+        PatchInvalido: se alguma operação estiver malformada
+    """
+    if not isinstance(operacoes, list):
+        raise PatchInvalido('o patch deve ser uma lista de operações')
+    for operacao in operacoes:
+        if not isinstance(operacao, dict) or operacao.get('op') not in OPERACOES_PATCH:
+            raise PatchInvalido(f'operação inválida: {operacao!r}')
+        _tokens(operacao.get('path'))
+        if operacao['op'] in ('add', 'replace', 'test') and 'value' not in operacao:
+            raise PatchInvalido(f"operação '{operacao['op']}' sem 'value'")
+        if operacao['op'] in ('move', 'copy'):
+            _tokens(operacao.get('from'))
+
+
+def aplicar_patch(documento, operacoes):
+    """
+    Aplica as operações de um JSON Patch ao documento.
+
+    Args:
+        documento: Documento JSON já decodificado (é alterado no lugar quando possível)
+        operacoes: Lista de operações RFC 6902
+
+    Returns:
+        O documento resultante (pode ser outro objeto se a raiz for substituída)
+
+    Raises:
+        PatchInvalido: se uma operação não se aplicar ao documento
+    """
+    for operacao in operacoes:
+        op = operacao.get('op')
+        tokens = _tokens(operacao.get('path'))
+
+        if op == 'add':
+            documento = _adicionar(documento, tokens, operacao['value'])
+        elif op == 'remove':
+            _remover(documento, tokens)
+        elif op == 'replace':
+            if tokens:
+                _remover(documento, tokens)
+            documento = _adicionar(documento, tokens, operacao['value'])
+        elif op in ('move', 'copy'):
+            origem = _tokens(operacao.get('from'))
+            if op == 'move':
+                if tokens[:len(origem)] == origem and tokens != origem:
+                    raise PatchInvalido('não é possível mover um valor para dentro dele mesmo')
+                valor = _remover(documento, origem) if origem else documento
+            else:
+                valor = json.loads(json.dumps(_resolver(documento, origem)))
+            documento = _adicionar(documento, tokens, valor)
+        elif op == 'test':
+            if _resolver(documento, tokens) != operacao['value']:
+                raise PatchInvalido(f'teste falhou em {operacao["path"]}')
+        else:
+            raise PatchInvalido(f'operação inválida: {op!r}')
+    return documento
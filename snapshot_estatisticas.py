@@ -0,0 +1,134 @@
+"""
+Snapshot Materializado de Estatísticas
+Mantém em memória o resultado de uma consulta agregada pesada e o recalcula
+em segundo plano, com debounce, depois de commits que alteram os modelos de origem
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db
+
+
+class SnapshotEstatisticas:
+    """
+    Resultado de uma função de cálculo servido da memória.
+
+    Recursos:
+    - Primeiro cálculo sob demanda; depois sempre servido da memória
+    - Escritas nos modelos observados agendam um recálculo após `atraso_segundos`;
+      escritas em sequência dentro da janela geram um único recálculo
+    - Idade máxima: snapshots antigos (ex.: escritas feitas em outro worker)
+      são recalculados em segundo plano enquanto o anterior continua servindo
+    """
+
+    def __init__(self, app, calcular, atraso_segundos=5, idade_maxima_segundos=300):
+        """
+        Inicializa o snapshot.
+
+        Args:
+            app: Aplicação Flask (o recálculo roda fora da requisição)
+            calcular: Função sem argumentos que retorna o dicionário do snapshot
+            atraso_segundos: Janela de debounce após uma escrita
+            idade_maxima_segundos: Idade a partir da qual o snapshot é recalculado mesmo sem escritas
+        """
+        self.app = app
+        self.calcular = calcular
+        self.atraso_segundos = atraso_segundos
+        self.idade_maxima_segundos = idade_maxima_segundos
+        self._dados = None
+        self._calculado_em = 0
+        self._lock = threading.Lock()
+        self._agendado = None
+        self._recalculando = False
+        self._pendente = False
+
+    def obter(self):
+        """Retorna o snapshot atual (calcula na hora apenas na primeira chamada)"""
+        with self._lock:
+            dados = self._dados
+            vencido = time.time() - self._calculado_em >= self.idade_maxima_segundos
+
+        if dados is None:
+            return self._recalcular()
+        if vencido:
+            self.agendar(0)
+        return dados
+
+    def agendar(self, atraso=None):
+        """Agenda um recálculo; chamadas repetidas dentro da janela são agrupadas"""
+        with self._lock:
+            if self._recalculando:
+                # O cálculo em andamento pode não enxergar esta escrita: refaz ao terminar
+                self._pendente = True
+                return
+            if self._agendado is not None:
+                return
+            self._agendado = threading.Timer(
+                self.atraso_segundos if atraso is None else atraso,
+                self._recalcular_em_segundo_plano
+            )
+            self._agendado.daemon = True
+            self._agendado.start()
+
+    def invalidar(self):
+        """Descarta o snapshot (o próximo obter() recalcula na hora)"""
+        with self._lock:
+            self._dados = None
+
+    def _recalcular(self):
+        inicio = time.time()
+        dados = self.calcular()
+        with self._lock:
+            self._dados = dados
+            self._calculado_em = inicio
+        return dados
+
+    def _recalcular_em_segundo_plano(self):
+        with self._lock:
+            self._agendado = None
+            self._recalculando = True
+        try:
+            with self.app.app_context():
+                try:
+                    self._recalcular()
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            self.app.logger.error(f"❌ Erro ao recalcular snapshot de estatísticas: {e}")
+        finally:
+            with self._lock:
+                self._recalculando = False
+                pendente, self._pendente = self._pendente, False
+            if pendente:
+                self.agendar()
+
+    def registrar_eventos(self, modelos):
+        """
+        Instala os eventos de sessão que agendam o recálculo após commits.
+
+        Args:
+            modelos: Tupla de modelos cujas escritas alteram o snapshot
+        """
+        chave = f'snapshot_alterado_{id(self)}'
+
+        @event.listens_for(Session, 'after_flush')
+        def _detectar_alteracao(session, flush_context):
+            if session.info.get(chave):
+                return
+            for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+                if isinstance(obj, modelos):
+                    session.info[chave] = True
+                    return
+
+        @event.listens_for(Session, 'after_commit')
+        def _agendar_recalculo(session):
+            if session.info.pop(chave, None):
+                self.agendar()
+
+        @event.listens_for(Session, 'after_rollback')
+        def _descartar_alteracao(session):
+            session.info.pop(chave, None)
@@ -0,0 +1,169 @@
+"""
+Tarefas em Segundo Plano
+Executa operações longas (exclusões em massa, importações) fora da requisição,
+em threads do processo, com o progresso gravado na tabela tarefas_segundo_plano
+para ser consultado por qualquer worker; tarefas de um processo que caiu são
+retomadas do cursor gravado
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import update as sa_update
+
+from models import db, TarefaSegundoPlano
+
+
+class ExecutorTarefas:
+    """
+    Fila de tarefas longas com progresso persistido.
+
+    Recursos:
+    - Funções registradas por tipo com @executor.tipo('nome')
+    - Pool de threads limitado (tarefas além do limite aguardam na fila)
+    - Cada função recebe a linha da tarefa e grava progresso/cursor com commits
+      curtos por lote; o executor marca início, conclusão e erro
+    - Pool separado, de uma thread, para remoção de arquivos fora das transações
+    - Cada execução reivindica a tarefa com um UPDATE condicional (status 'pendente'),
+      então uma tarefa nunca roda em duas threads/workers ao mesmo tempo
+    - retomar_paradas() devolve à fila as tarefas sem progresso há muito tempo (processo
+      encerrado no meio); a função continua do cursor (ultimo_id) gravado no último lote
+    """
+
+    def __init__(self, app, max_simultaneas=2):
+        """
+        Inicializa o executor.
+
+        Args:
+            app: Aplicação Flask (as tarefas rodam dentro de um app_context)
+            max_simultaneas: Tarefas executadas ao mesmo tempo neste processo
+        """
+        self.app = app
+        self._funcoes = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_simultaneas, thread_name_prefix='tarefa')
+        self._pool_arquivos = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tarefa-arquivos')
+
+    def tipo(self, nome):
+        """Decorador que registra a função executada pelas tarefas do tipo `nome`"""
+        def registrar(funcao):
+            self._funcoes[nome] = funcao
+            return funcao
+        return registrar
+
+    def em_andamento(self, user_id, tipo):
+        """Tarefa do mesmo tipo ainda pendente ou em execução para o usuário (ou None)"""
+        return TarefaSegundoPlano.query.filter(
+            TarefaSegundoPlano.user_id == user_id,
+            TarefaSegundoPlano.tipo == tipo,
+            TarefaSegundoPlano.status.in_(('pendente', 'executando'))
+        ).order_by(TarefaSegundoPlano.id.desc()).first()
+
+    def iniciar(self, user_id, tipo, parametros=None, total=None):
+        """
+        Cria a tarefa e a coloca na fila.
+
+        Args:
+            user_id: Dono da tarefa (a consulta de status é restrita a ele)
+            tipo: Tipo registrado com @tipo
+            parametros: Dicionário repassado à função pela linha da tarefa
+            total: Total de itens, se já conhecido (para o percentual)
+
+        Returns:
+            TarefaSegundoPlano: Linha criada (já commitada)
+        """
+        if tipo not in self._funcoes:
+            raise ValueError(f'tipo de tarefa não registrado: {tipo}')
+        tarefa = TarefaSegundoPlano(user_id=user_id, tipo=tipo, total=total)
+        tarefa.set_parametros(parametros or {})
+        db.session.add(tarefa)
+        db.session.commit()
+        self._pool.submit(self._executar, tarefa.id)
+        return tarefa
+
+    def retomar_paradas(self, parada_segundos, limite=10):
+        """
+        Recoloca na fila as tarefas pendentes ou em execução sem atualização há
+        `parada_segundos` (o processo que as executava caiu ou foi reiniciado).
+
+        Uma tarefa viva atualiza atualizado_em a cada lote: o tempo deve ser bem maior
+        que a duração de um lote.
+
+        Returns:
+            int: Quantidade de tarefas recolocadas na fila
+        """
+        corte = datetime.utcnow() - timedelta(seconds=parada_segundos)
+        paradas = db.session.query(
+            TarefaSegundoPlano.id, TarefaSegundoPlano.status, TarefaSegundoPlano.atualizado_em
+        ).filter(
+            TarefaSegundoPlano.status.in_(('pendente', 'executando')),
+            TarefaSegundoPlano.atualizado_em < corte,
+            TarefaSegundoPlano.tipo.in_(list(self._funcoes))
+        ).order_by(TarefaSegundoPlano.id).limit(limite).all()
+
+        retomadas = 0
+        for tarefa_id, status, atualizado_em in paradas:
+            # Condicional: outro worker pode ter retomado a mesma tarefa neste intervalo
+            resultado = db.session.execute(
+                sa_update(TarefaSegundoPlano).where(
+                    TarefaSegundoPlano.id == tarefa_id,
+                    TarefaSegundoPlano.status == status,
+                    TarefaSegundoPlano.atualizado_em == atualizado_em
+                ).values(status='pendente', atualizado_em=datetime.utcnow())
+            )
+            db.session.commit()
+            if resultado.rowcount:
+                self._pool.submit(self._executar, tarefa_id)
+                retomadas += 1
+        return retomadas
+
+    def remover_arquivos(self, caminhos):
+        """Remove arquivos na thread de arquivos (chamar só depois do commit que os desvincula)"""
+        if caminhos:
+            self._pool_arquivos.submit(self._remover_arquivos, list(caminhos))
+
+    def _remover_arquivos(self, caminhos):
+        for caminho in caminhos:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                self.app.logger.warning(f"⚠️ Falha ao remover arquivo '{caminho}': {e}")
+
+    def _executar(self, tarefa_id):
+        with self.app.app_context():
+            try:
+                reivindicada = db.session.execute(
+                    sa_update(TarefaSegundoPlano).where(
+                        TarefaSegundoPlano.id == tarefa_id,
+                        TarefaSegundoPlano.status == 'pendente'
+                    ).values(status='executando', atualizado_em=datetime.utcnow())
+                ).rowcount
+                db.session.commit()
+                if not reivindicada:
+                    # Já executada ou retomada em outra thread/worker
+                    return
+
+                tarefa = db.session.get(TarefaSegundoPlano, tarefa_id)
+                tarefa.iniciado_em = tarefa.iniciado_em or datetime.utcnow()
+                db.session.commit()
+
+                self._funcoes[tarefa.tipo](tarefa)
+
+                tarefa.status = 'concluida'
+                tarefa.concluido_em = datetime.utcnow()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"❌ Erro na tarefa {tarefa_id}: {e}", exc_info=True)
+                try:
+                    tarefa = db.session.get(TarefaSegundoPlano, tarefa_id)
+                    tarefa.status = 'erro'
+                    tarefa.erro = str(e)[:2000]
+                    tarefa.concluido_em = datetime.utcnow()
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+            finally:
+                db.session.remove()
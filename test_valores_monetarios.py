@@ -0,0 +1,74 @@
+"""
+Paridade da conversão vetorizada de valores monetários
+processar_valores_monetarios deve devolver, valor a valor, o mesmo float de
+processar_valor_monetario sobre o corpus de casos de borda e um corpus gerado
+
+Execute com:
+python3 -m pytest test_valores_monetarios.py
+"""
+
+import random
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from valores_monetarios import LARGURA_MAXIMA, processar_valor_monetario, processar_valores_monetarios
+
+# Casos de borda: formatos brasileiro/americano, separadores repetidos, sinais, textos
+# vazios, dígitos não ASCII, empates de meio centavo e textos acima de LARGURA_MAXIMA
+CORPUS_BORDAS = [
+    '', None, 0, 0.0, 12, 12.5, 1e20, float('nan'), True, False,
+    'nan', 'NaN', 'NULL', ' None ', 'none',
+    'R$ 1.234,56', '1.234,56', '$1,234.56', '1.234.567,89', '1,234,567.89', '12.345.678,9',
+    '1,5', '1,2,3', '1,234,567', '1.234.567', '1.234', '1,,5', '1..5', ',5', '5,',
+    '1,2.3,4', '1.2,3.4', '1 234,56', 'US$ 10.00', '10,00 reais', 'R$1.000',
+    '-5', '5-', '--5', '--1', '-.5', 'R$ -3,00', '+3', '1-2', '1e5',
+    '.5', '5.', '.', ',', '-', 'abc', 'R$', 'R$ ,', '  7 ', '0', '0,00', '3,999',
+    '0,665', '2.675', '1.005', '0,125', '0,005', '1.234,565', '8.345',
+    '١٢٣,٤', '٣', '１２,５０', '12 345,00',
+    'R$ ' + '1' * (LARGURA_MAXIMA + 5),
+    'valor sujeito a confirmação do fornecedor: R$ 12,50',
+    '9' * (LARGURA_MAXIMA + 1) + ',99',
+]
+
+
+def _corpus_gerado(quantidade, semente=7):
+    """Textos aleatórios com os caracteres da conversão e preços formatados nos dois padrões"""
+    gerador = random.Random(semente)
+    caracteres = '0123456789,.-R$ a'
+    corpus = [''.join(gerador.choice(caracteres) for _ in range(gerador.randint(0, 10)))
+              for _ in range(quantidade)]
+    for _ in range(quantidade):
+        inteiro, decimal = gerador.randint(0, 10 ** gerador.randint(1, 9)), gerador.randint(0, 999)
+        formato = gerador.choice(['{a}.{d:03d}', '{a},{d:02d}', 'R$ {a:,}.{d:03d}', '{a:,}'])
+        texto = formato.format(a=inteiro, d=decimal % 100 if ',{d:02d}' in formato else decimal)
+        if gerador.random() < 0.5:
+            texto = texto.replace(',', 'X').replace('.', ',').replace('X', '.')
+        corpus.append(texto)
+    return corpus
+
+
+@pytest.fixture(autouse=True)
+def contexto_app():
+    # A versão por valor registra textos inválidos no logger da aplicação
+    with Flask(__name__).app_context():
+        yield
+
+
+def test_casos_de_borda():
+    assert processar_valores_monetarios(CORPUS_BORDAS).tolist() == [
+        processar_valor_monetario(valor) for valor in CORPUS_BORDAS
+    ]
+
+
+def test_corpus_gerado():
+    corpus = _corpus_gerado(20000)
+    assert processar_valores_monetarios(corpus).tolist() == [processar_valor_monetario(valor) for valor in corpus]
+
+
+def test_entradas_numpy_e_vazia():
+    assert processar_valores_monetarios(np.array(['1.234,56', '', '0,665'], dtype=object)).tolist() == [
+        1234.56, 0.0, processar_valor_monetario('0,665')
+    ]
+    assert processar_valores_monetarios([]).tolist() == []
@@ -0,0 +1,187 @@
+"""
+Conversão de Valores Monetários
+Texto de planilhas de preços (formatos brasileiro e americano, 'R$', separador de
+milhar) para número com duas casas. A versão vetorizada converte uma coluna inteira
+sobre uma matriz NumPy de code points e dá o mesmo resultado da conversão por valor
+"""
+
+import operator
+import re
+
+import numpy as np
+from flask import current_app
+
+_NAO_NUMERICOS = r'[^\d,.-]'
+_TEXTOS_VAZIOS = ('nan', 'null', 'none', '')
+# Caracteres por valor na matriz da versão vetorizada (textos maiores usam a versão por valor)
+LARGURA_MAXIMA = 40
+
+
+def processar_valor_monetario(valor_str):
+    """Processa valores monetários de diferentes formatos"""
+    if not valor_str:
+        return 0.0
+
+    try:
+        valor_str = str(valor_str).strip()
+        if not valor_str or valor_str.lower() in _TEXTOS_VAZIOS:
+            return 0.0
+
+        # Remover símbolos de moeda
+        valor_limpo = valor_str.replace('R$', '').replace('$', '').strip()
+        valor_limpo = re.sub(_NAO_NUMERICOS, '', valor_limpo)
+
+        if not valor_limpo:
+            return 0.0
+
+        # Processar formato brasileiro (vírgula como decimal)
+        if ',' in valor_limpo and '.' in valor_limpo:
+            if valor_limpo.rfind(',') > valor_limpo.rfind('.'):
+                partes = valor_limpo.rsplit(',', 1)
+                parte_inteira = partes[0].replace('.', '')
+                parte_decimal = partes[1] if len(partes) > 1 else '0'
+                valor_final = parte_inteira + '.' + parte_decimal
+            else:
+                partes = valor_limpo.rsplit('.', 1)
+                parte_inteira = partes[0].replace(',', '')
+                parte_decimal = partes[1] if len(partes) > 1 else '0'
+                valor_final = parte_inteira + '.' + parte_decimal
+        elif ',' in valor_limpo:
+            valor_final = valor_limpo.replace(',', '.')
+        else:
+            valor_final = valor_limpo
+
+        resultado = float(valor_final)
+        return round(max(0, resultado), 2)
+
+    except Exception as e:
+        current_app.logger.warning(f"Erro ao processar valor '{valor_str}': {e}")
+        return 0.0
+
+
+def _arredondar(numeros):
+    """
+    round(x, 2) do Python sobre o array. np.round multiplica por 100 e pode divergir no
+    último dígito perto da metade (ex.: 0.665): esses valores usam o round() do Python
+    """
+    resultado = np.round(numeros, 2)
+    centavos = numeros * 100
+    duvidosos = np.abs(np.abs(centavos - np.floor(centavos)) - 0.5) <= 1e-9 * np.maximum(1.0, np.abs(centavos))
+    if duvidosos.any():
+        resultado[duvidosos] = [round(v, 2) for v in numeros[duvidosos].tolist()]
+    return resultado
+
+
+def _compactar(codigos, manter):
+    """Remove de cada linha da matriz de code points as posições fora de `manter` (zeros à direita)"""
+    linhas, largura = codigos.shape
+    origem = np.flatnonzero(manter)
+    destino = np.cumsum(manter, axis=1, dtype=np.int32) - 1
+    destino += (np.arange(linhas, dtype=np.int32) * largura)[:, None]
+    compactado = np.zeros(linhas * largura, dtype=codigos.dtype)
+    compactado[destino.ravel()[origem]] = codigos.ravel()[origem]
+    return compactado.reshape(linhas, largura)
+
+
+def _ultima_posicao(codigos, caractere):
+    """Índice da última ocorrência do caractere em cada linha (-1 se não há)"""
+    ocorrencias = codigos[:, ::-1] == ord(caractere)
+    posicoes = codigos.shape[1] - 1 - ocorrencias.argmax(axis=1)
+    return np.where(ocorrencias.any(axis=1), posicoes, -1)
+
+
+def _ler_numeros(final, largura):
+    """
+    float() de cada linha da matriz (textos já validados). Com até 15 dígitos e 22 casas,
+    mantissa inteira / 10**casas é exata (mesmo resultado de float()); os demais usam float()
+    """
+    digito = (final >= ord('0')) & (final <= ord('9'))
+    valores = final.astype(np.int64) - ord('0')
+    mantissa = np.zeros(final.shape[0], dtype=np.int64)
+    for coluna in range(final.shape[1]):
+        mantissa = np.where(digito[:, coluna], mantissa * 10 + valores[:, coluna], mantissa)
+
+    posicao_ponto = _ultima_posicao(final, '.')
+    casas = np.where(posicao_ponto >= 0,
+                     np.count_nonzero(digito & (np.arange(final.shape[1]) > posicao_ponto[:, None]), axis=1), 0)
+    numeros = mantissa / np.power(10.0, casas)
+    numeros[final[:, 0] == ord('-')] *= -1
+
+    longos = (np.count_nonzero(digito, axis=1) > 15) | (casas > 22)
+    if longos.any():
+        textos = np.ascontiguousarray(final[longos]).view(f'<U{largura}').ravel()
+        numeros[longos] = list(map(float, textos.tolist()))
+    return numeros
+
+
+def processar_valores_monetarios(valores):
+    """
+    Versão vetorizada de processar_valor_monetario para uma coluna inteira.
+
+    Os textos viram uma matriz de code points (uma linha por valor) e cada regra da
+    conversão por valor vira uma operação NumPy sobre ela: a limpeza mantém dígitos,
+    vírgula, ponto e sinal; o último separador define o decimal e o outro é descartado;
+    textos que não formam um número resultam em 0.0. Valores com caracteres não ASCII
+    (ex.: dígitos de outros alfabetos, raros) usam a versão por valor.
+
+    Args:
+        valores: Iterável de textos (ou números) de custo; pd.Series e np.ndarray também servem
+
+    Returns:
+        np.ndarray: float64 com duas casas, na ordem de `valores`
+    """
+    lista = valores.tolist() if hasattr(valores, 'tolist') else list(valores)
+    quantidade = len(lista)
+    if not quantidade:
+        return np.zeros(0)
+
+    vazios = np.fromiter(map(operator.not_, lista), dtype=bool, count=quantidade)
+    texto = np.strings.strip(np.array(list(map(str, lista)), dtype=str))
+    # 'nan', 'null', 'none': lower() só nos textos curtos
+    curtos = np.strings.str_len(texto) <= 4
+    vazios[curtos] |= np.isin(np.strings.lower(texto[curtos]), _TEXTOS_VAZIOS)
+
+    # Um texto longo (observação na coluna de preço) alargaria a matriz inteira: vai para a versão por valor
+    longos = np.strings.str_len(texto) > LARGURA_MAXIMA
+    if longos.any():
+        texto[longos] = ''
+    largura = max(int(np.strings.str_len(texto).max()), 1)
+    codigos = texto.astype(f'<U{largura}').view(np.uint32).reshape(quantidade, largura)
+    # \d da regex aceita dígitos não ASCII: esses valores também vão para a versão por valor
+    outros = ~vazios & (longos | ((codigos > 127) & (codigos != 0xA0)).any(axis=1))
+
+    # A limpeza mantém só dígitos, vírgula, ponto e sinal ('R$', espaços e letras saem);
+    # a ordem dos separadores não muda, então as decisões usam as posições originais
+    virgula, ponto = codigos == ord(','), codigos == ord('.')
+    ultima_virgula, ultimo_ponto = _ultima_posicao(codigos, ','), _ultima_posicao(codigos, '.')
+    tem_virgula, tem_ponto = ultima_virgula >= 0, ultimo_ponto >= 0
+    # 1.234,56 -> pontos de milhar saem, a vírgula vira o decimal (com mais de uma vírgula,
+    # a parte inteira fica com vírgula e o texto não é número, como na versão por valor)
+    brasileiro = tem_virgula & tem_ponto & (ultima_virgula > ultimo_ponto)
+    brasileiro_invalido = brasileiro & (np.count_nonzero(virgula, axis=1) > 1)
+    # 1,234.56 -> vírgulas de milhar saem; 12,5 -> toda vírgula vira ponto
+    americano = tem_virgula & tem_ponto & ~brasileiro
+    manter = (
+        ((codigos >= ord('0')) & (codigos <= ord('9'))) | (codigos == ord('-'))
+        | (virgula & ~americano[:, None]) | (ponto & ~brasileiro[:, None])
+    )
+    final = _compactar(np.where(virgula, np.uint32(ord('.')), codigos), manter)
+
+    # Forma aceita por float(): sinal só no início, no máximo um ponto e ao menos um dígito
+    sinais = np.count_nonzero(final == ord('-'), axis=1)
+    validos = (
+        ~vazios & ~outros & ~brasileiro_invalido
+        & ((sinais == 0) | ((sinais == 1) & (final[:, 0] == ord('-'))))
+        & (np.count_nonzero(final == ord('.'), axis=1) <= 1)
+        & ((final >= ord('0')) & (final <= ord('9'))).any(axis=1)
+    )
+
+    numeros = np.zeros(quantidade)
+    if validos.any():
+        numeros[validos] = _ler_numeros(final[validos], largura)
+    # + 0.0: -0.0 vira 0.0, como max(0, ...) na versão por valor
+    resultado = _arredondar(np.maximum(numeros, 0.0) + 0.0)
+
+    if outros.any():
+        resultado[outros] = [processar_valor_monetario(lista[i]) for i in np.flatnonzero(outros)]
+    return resultado